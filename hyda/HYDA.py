@@ -2,17 +2,26 @@
 """
 HYDA - Hydrological Delimitation Assistant
 """
-from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, Qt, QVariant
+from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, Qt
 from qgis.PyQt.QtGui import QIcon, QCursor, QColor
 from qgis.PyQt.QtWidgets import QAction, QMessageBox
-from qgis.core import (QgsProject, QgsVectorLayer, QgsFeature, QgsGeometry, 
-                       QgsPointXY, QgsWkbTypes, QgsField, QgsSpatialIndex,
-                       QgsVectorFileWriter, QgsRectangle, QgsMessageLog,
-                       Qgis, QgsSymbol, QgsRendererCategory, QgsCategorizedSymbolRenderer,
-                       QgsFillSymbol, QgsCoordinateTransform, QgsPointLocator)
+from qgis.core import (QgsProject, QgsVectorLayer, QgsGeometry, 
+                       QgsPointXY, QgsWkbTypes, QgsSpatialIndex,
+                       QgsVectorFileWriter, QgsRectangle,
+                       QgsSymbol, QgsRendererCategory, QgsCategorizedSymbolRenderer,
+                       QgsFillSymbol, QgsCoordinateTransform, QgsPointLocator,
+                       QgsApplication)
 from qgis.gui import QgsMapToolEmitPoint, QgsRubberBand
 from .resources import *
 from .HYDA_dialog import HYDADialog
+from .cache_topo import dir_cache_defecto
+from .tareas import TareaCargaTopo, TareaTrazado
+from .HYDA_provider import HYDAProvider
+from .servicio import ServicioHYDA
+from .aoi import R_AOI
+from .persistencia import guardar_en_proyecto, leer_de_proyecto
+from .seleccion import IndicePoligonos
+from . import registro
 import os.path
 import math
 
@@ -64,40 +73,52 @@ class PuntoMapTool(QgsMapToolEmitPoint):
         self.snap_indicator.setMatch(QgsPointLocator.Match())
 
 class PoligonoMapTool(QgsMapToolEmitPoint):
+    """Resalta y selecciona polígonos de capa_poly (IndicePoligonos, sin recorrer la capa)"""
+    
     def __init__(self, canvas, callback, capa_poly):
         super().__init__(canvas)
         self.canvas = canvas
         self.callback = callback
         self.capa_poly = capa_poly
+        self.indice = IndicePoligonos(capa_poly)
+        self.fid_hov = None
         
         self.rb_hov = QgsRubberBand(canvas, QgsWkbTypes.PolygonGeometry)
         self.rb_hov.setColor(QColor(255, 255, 0, 20))
         self.rb_hov.setWidth(1)
         self.rb_hov.setLineStyle(Qt.DashLine)
+    
+    def activate(self):
+        super().activate()
+        self.indice.invalidar()
+        self.indice.conectar()
+    
+    def poligono_en(self, e):
+        """fid del polígono bajo el cursor, o None"""
+        pt = self.toLayerCoordinates(self.capa_poly, e.pos())
+        return self.indice.en_punto(pt.x(), pt.y())
         
     def canvasMoveEvent(self, e):
-        pt = self.toMapCoordinates(e.pos())
-        pt_g = QgsGeometry.fromPointXY(pt)
+        fid = self.poligono_en(e)
+        if fid == self.fid_hov:
+            return
+        self.fid_hov = fid
         self.rb_hov.reset(QgsWkbTypes.PolygonGeometry)
-        
-        for feat in self.capa_poly.getFeatures():
-            if feat.geometry().contains(pt_g):
-                self.rb_hov.setToGeometry(feat.geometry(), None)
-                break
+        if fid is not None:
+            self.rb_hov.setToGeometry(self.indice.geometria(fid), self.capa_poly)
         
     def canvasPressEvent(self, e):
-        pt = self.toMapCoordinates(e.pos())
-        pt_g = QgsGeometry.fromPointXY(pt)
-        
-        for feat in self.capa_poly.getFeatures():
-            if feat.geometry().contains(pt_g):
-                self.callback(feat)
-                return
+        fid = self.poligono_en(e)
+        if fid is not None:
+            self.callback(self.capa_poly.getFeature(fid))
+            return
         
         QMessageBox.information(None, "Sin selección", "No se encontró ningún polígono en ese punto.")
     
     def deactivate(self):
         super().deactivate()
+        self.indice.desconectar()
+        self.fid_hov = None
         self.rb_hov.reset(QgsWkbTypes.PolygonGeometry)
 
 
@@ -117,11 +138,17 @@ class HYDA:
         self.actions = []
         self.menu = self.tr(u'&HYDA')
         self.first_start = None
+        self.provider = None
         
         self.capa_topo = None
         self.campo_elev = None
         self.curvas = {}
         self.idx_esp = None
+        self.version_topo = None
+        self.tarea_carga = None
+        self.tarea_traza = None
+        # Vista previa de las líneas en trazado: {número de línea: QgsRubberBand}
+        self.rb_prev = {}
         self.pts_ini = []
         self.pts_aux = []
         self.pts_conexion = []
@@ -131,6 +158,9 @@ class HYDA:
         self.mt_sel = None
         self.capa_div = None
         self.res_lin = []
+        # Última salida de fin_divisorias: {'clave', 'lineas'} (ver clave_traza)
+        self.traza_ult = None
+        # Metadatos de polígonos HYDA por capa destino: {capa_id: {fid: meta}}
         self.poly_meta = {}
         self.poly_edit = None
 
@@ -158,12 +188,23 @@ class HYDA:
         self.actions.append(action)
         return action
 
+    def initProcessing(self):
+        self.provider = HYDAProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
+
     def initGui(self):
+        self.initProcessing()
+        
         icon_path = os.path.join(self.plugin_dir, 'icon.png')
         
         self.add_action(icon_path, text=self.tr(u'Hydrological Delimitation Assistant'),
                     callback=self.run, parent=self.iface.mainWindow())
         self.first_start = True
+        
+        # Metadatos de polígonos guardados en el proyecto (también si ya hay uno abierto)
+        QgsProject.instance().readProject.connect(self.restaurar_meta)
+        QgsProject.instance().cleared.connect(self.restaurar_meta)
+        self.restaurar_meta()
 
     def unload(self):
         for action in self.actions:
@@ -178,6 +219,32 @@ class HYDA:
             self.iface.mapCanvas().unsetMapTool(self.mt_conexion)
         if self.mt_sel:
             self.iface.mapCanvas().unsetMapTool(self.mt_sel)
+        
+        if self.tarea_carga:
+            self.tarea_carga.cancel()
+        self.cancelar_trazado()
+        self.borrar_vista_previa()
+        
+        QgsProject.instance().readProject.disconnect(self.restaurar_meta)
+        QgsProject.instance().cleared.disconnect(self.restaurar_meta)
+        QgsApplication.processingRegistry().removeProvider(self.provider)
+
+    def restaurar_meta(self, *args):
+        """Recupera poly_meta (con sus divisorias) del proyecto, sin volver a trazar"""
+        metas = leer_de_proyecto(QgsProject.instance())
+        self.poly_meta = {cid: m for cid, m in metas.items() if QgsProject.instance().mapLayer(cid) is not None}
+        self.poly_edit = None
+        if self.poly_meta:
+            registro.info("Metadatos de proyecto: %d polígonos editables en %d capas",
+                          sum(len(m) for m in self.poly_meta.values()), len(self.poly_meta))
+
+    def guardar_meta(self):
+        """Escribe poly_meta en el proyecto; queda guardado al guardar el proyecto"""
+        guardar_en_proyecto(QgsProject.instance(), self.poly_meta)
+
+    def meta_capa(self, capa):
+        """poly_meta de una capa destino: {fid: meta}"""
+        return self.poly_meta.setdefault(capa.id(), {})
 
     def run(self):
         if self.first_start == True:
@@ -185,6 +252,8 @@ class HYDA:
             self.dlg = HYDADialog()
             
             self.dlg.topoLoaded.connect(self.on_topo_loaded)
+            self.dlg.cargaCancelada.connect(self.cancelar_carga)
+            self.dlg.trazadoCancelado.connect(self.cancelar_trazado)
             self.dlg.puntoInicialMode.connect(self.on_pto_ini_mode)
             self.dlg.puntoAuxiliarMode.connect(self.on_pto_aux_mode)
             self.dlg.puntoConexionMode.connect(self.on_pto_conexion_mode)
@@ -206,47 +275,77 @@ class HYDA:
             self.dlg.show()
 
     def on_topo_loaded(self, capa, campo):
-        QgsMessageLog.logMessage(f"Cargando topo: {capa.name()}", 'HYDA', Qgis.Info)
+        registro.info("Cargando topo: %s", capa.name())
         self.capa_topo = capa
         self.campo_elev = campo
         self.cargar_curvas()
         
     def cargar_curvas(self):
-        self.curvas = {}
-        fid = 0
+        """Lanza la carga en un QgsTask; los botones se habilitan al terminar"""
+        registro.depuracion("Cargando curvas...")
         
-        QgsMessageLog.logMessage("Cargando curvas...", 'HYDA', Qgis.Info)
+        if self.tarea_carga:
+            self.tarea_carga.progressChanged.disconnect(self.dlg.progreso_carga)
+            self.tarea_carga.cancel()
+        self.cancelar_trazado()
         
-        for feat in self.capa_topo.getFeatures():
-            try:
-                elev = feat[self.campo_elev]
-                if elev is None:
-                    continue
-                    
-                geom = feat.geometry()
-                
-                if geom.isMultipart():
-                    if geom.wkbType() == QgsWkbTypes.MultiLineString:
-                        partes = geom.asMultiPolyline()
-                        for parte in partes:
-                            g_ind = QgsGeometry.fromPolylineXY(parte)
-                            self.curvas[fid] = {'elevation': float(elev), 'geometry': g_ind}
-                            fid += 1
-                else:
-                    self.curvas[fid] = {'elevation': float(elev), 'geometry': geom}
-                    fid += 1
-            except Exception as e:
-                QgsMessageLog.logMessage(f"Error: {str(e)}", 'HYDA', Qgis.Warning)
-                continue
+        self.curvas = {}
+        self.idx_esp = None
+        self.version_topo = None
+        
+        aoi = self.rect_aoi() if self.dlg.chk_aoi.isChecked() else None
+        dir_c = self.dir_cache() if aoi is None else None
+        tarea = TareaCargaTopo(self.capa_topo, self.campo_elev, dir_c, self.fin_carga_curvas, aoi)
+        tarea.progressChanged.connect(self.dlg.progreso_carga)
+        self.tarea_carga = tarea
+        QgsApplication.taskManager().addTask(tarea)
+    
+    def cancelar_carga(self):
+        if self.tarea_carga:
+            self.tarea_carga.cancel()
+    
+    def fin_carga_curvas(self, tarea):
+        """Hilo principal: publica el resultado de la carga"""
+        if tarea is not self.tarea_carga:
+            return
+        self.tarea_carga = None
+        
+        if tarea.resultado is None:
+            if tarea.error:
+                registro.critico("Error cargando curvas:\n%s", tarea.error)
+                self.dlg.fin_carga(False, "Error al cargar topografía")
+            else:
+                registro.info("Carga de curvas cancelada")
+                self.dlg.fin_carga(False, "Carga cancelada")
+            return
         
-        self.idx_esp = QgsSpatialIndex()
-        for fid, curva in self.curvas.items():
-            feat = QgsFeature()
-            feat.setId(fid)
-            feat.setGeometry(curva['geometry'])
-            self.idx_esp.addFeature(feat)
+        self.curvas, self.idx_esp, info = tarea.resultado
+        self.version_topo = info['version']
         
-        QgsMessageLog.logMessage(f"Curvas: {len(self.curvas)}", 'HYDA', Qgis.Info)
+        with registro.agrupado():
+            if info.get('aoi'):
+                registro.info("Área de interés: %d teselas", info['teselas'])
+            elif info['cache'] == 'hit':
+                registro.info("Caché topo: %s", info['ruta'])
+            else:
+                registro.info("Lectura %s: %d filas | %.0f filas/s",
+                              self.capa_topo.providerType(), info['filas'], info['filas_s'])
+                registro.info("Índice STR: %.0f ms", info['t_indice'] * 1000)
+            registro.info("Curvas: %d | %.1f MB | %.1fs", len(self.curvas), self.curvas.memoria() / 1e6, info['t'])
+        self.dlg.fin_carga(True, "Topografía cargada")
+
+    def rect_aoi(self):
+        """Extensión visible del mapa en el SRC de la capa de curvas"""
+        canvas = self.iface.mapCanvas()
+        ext = canvas.extent()
+        crs_mapa = canvas.mapSettings().destinationCrs()
+        if crs_mapa.isValid() and self.capa_topo.crs().isValid() and crs_mapa != self.capa_topo.crs():
+            tr = QgsCoordinateTransform(crs_mapa, self.capa_topo.crs(), QgsProject.instance())
+            ext = tr.transformBoundingBox(ext)
+        return ext.xMinimum(), ext.yMinimum(), ext.xMaximum(), ext.yMaximum()
+
+    def dir_cache(self):
+        return dir_cache_defecto(self.capa_topo)
 
     def on_pto_ini_mode(self, activado):
         if activado:
@@ -278,7 +377,8 @@ class HYDA:
     def on_pto_ini_click(self, pt):
         # Si ya hay 2 puntos previos, resetear para nueva pareja
         if len(self.pts_ini) >= 2:
-            QgsMessageLog.logMessage("↻ Iniciando nueva delimitación", 'HYDA', Qgis.Info)
+            registro.depuracion("↻ Iniciando nueva delimitación")
+            self.cancelar_trazado()
             self.pts_ini = []
             self.pts_aux = []
             self.pts_conexion = []
@@ -296,15 +396,14 @@ class HYDA:
         if self.mt_ini:
             self.mt_ini.rb.addPoint(pt)
         
-        QgsMessageLog.logMessage(f"Pto ini {len(self.pts_ini)}: {pt.x():.2f}, {pt.y():.2f}", 'HYDA', Qgis.Info)
+        registro.depuracion("Pto ini %d: %.2f, %.2f", len(self.pts_ini), pt.x(), pt.y())
         
         # NUEVO: Actualizar estado según cantidad de puntos
         if len(self.pts_ini) == 1:
             self.dlg.actualizar_estado("Delimitando", mostrar_check=False, color="#0483AD")
         elif len(self.pts_ini) == 2:
+            # Sigue en fin_divisorias cuando termina el trazado
             self.procesar_divisorias(modo='nuevo')
-            self.dlg.habilitar_puntos_auxiliares()
-            self.dlg.actualizar_estado("Delimitación creada", mostrar_check=True, color="#58AD03")
 
     def on_pto_aux_mode(self, activado):
         if activado:
@@ -317,8 +416,11 @@ class HYDA:
                 self.iface.mapCanvas().setCursor(Qt.ArrowCursor)
 
     def on_pto_aux_click(self, pt):
+        if self.tarea_traza:
+            registro.aviso("Delimitación en curso: punto auxiliar ignorado")
+            return
         self.pts_aux.append(pt)
-        QgsMessageLog.logMessage(f"Pto aux {len(self.pts_aux)}: {pt.x():.2f}, {pt.y():.2f}", 'HYDA', Qgis.Info)
+        registro.depuracion("Pto aux %d: %.2f, %.2f", len(self.pts_aux), pt.x(), pt.y())
         
         # Procesar con metodología de auxiliar incluyendo puntos directos previos
         if self.poly_edit is not None:
@@ -339,6 +441,9 @@ class HYDA:
 
     def on_pto_conexion_click(self, pt):
         """Maneja el clic para conexión directa"""
+        if self.tarea_traza:
+            registro.aviso("Delimitación en curso: conexión ignorada")
+            return
         if not self.res_lin or len(self.res_lin) < 2:
             QMessageBox.warning(self.dlg, "Advertencia", "Debe tener líneas de divisoria creadas primero")
             return
@@ -368,7 +473,7 @@ class HYDA:
             QMessageBox.warning(self.dlg, "Advertencia", "No se encontró línea cercana")
             return
         
-        QgsMessageLog.logMessage(f"Conexión directa | Línea {idx_linea+1} | Dist: {d_min:.1f}m", 'HYDA', Qgis.Info)
+        registro.depuracion("Conexión directa | Línea %d | Dist: %.1fm", idx_linea + 1, d_min)
         
         # Agregar el punto de conexión a la lista de conexiones
         self.pts_conexion.append({
@@ -403,7 +508,7 @@ class HYDA:
             linea_cercana['longitud'] = QgsGeometry.fromPolylineXY(nuevos_puntos).length()
             linea_cercana['conexion_directa'] = True
             
-            QgsMessageLog.logMessage(f"✓ Conexión directa aplicada | Nuevos puntos: {len(nuevos_puntos)}", 'HYDA', Qgis.Info)
+            registro.info("✓ Conexión directa aplicada | Nuevos puntos: %d", len(nuevos_puntos))
             
             # Actualizar estado
             self.dlg.actualizar_estado("Polígono modificado", mostrar_check=True, color="#1487F3")
@@ -433,29 +538,117 @@ class HYDA:
 
     def on_poly_sel(self, feat):
         fid = feat.id()
-        QgsMessageLog.logMessage(f"Click poly FID: {fid} | Meta: {list(self.poly_meta.keys())}", 'HYDA', Qgis.Info)
+        poly_meta = self.meta_capa(self.mt_sel.capa_poly)
+        registro.depuracion("Click poly FID: %s | Meta: %s", fid, list(poly_meta.keys()))
         
-        if fid not in self.poly_meta:
+        if fid not in poly_meta:
             QMessageBox.warning(self.dlg, "Polígono no válido",
                 f"Este polígono (FID: {fid}) no fue creado con HYDA.\n"
-                f"FIDs disponibles: {list(self.poly_meta.keys())}")
+                f"FIDs disponibles: {list(poly_meta.keys())}")
             return
         
-        meta = self.poly_meta[fid]
+        meta = poly_meta[fid]
         self.poly_edit = fid
         self.pts_ini = [meta['punto1'], meta['punto2']]
         self.pts_aux = meta['auxiliares'].copy()
         self.pts_conexion = meta.get('conexiones', []).copy()
         
-        # Reconstruir las líneas de divisoria
-        self.procesar_divisorias(modo='cargar')
+        # Reconstruir las líneas de divisoria; sin cambios en la topografía se reutilizan las guardadas
+        res = self.traza_en_cache(meta)
+        if res is not None:
+            self.res_lin = res
+            registro.info("Divisorias de poly %s desde caché", fid)
+        else:
+            self.procesar_divisorias(modo='cargar')
         
         area_km2 = feat.geometry().area() / 1_000_000.0
         self.dlg.actualizar_info_poligono(fid, area_km2)
-        QgsMessageLog.logMessage(f"Poly {fid} sel | Ini: 2 | Aux: {len(self.pts_aux)}", 'HYDA', Qgis.Info)
+        registro.info("Poly %s sel | Ini: 2 | Aux: %d", fid, len(self.pts_aux))
+
+    def servicio(self):
+        """Servicio de delimitación sobre la topografía cargada"""
+        crs = self.capa_topo.crs() if self.capa_topo else None
+        return ServicioHYDA(self.curvas, self.idx_esp, self.version_topo, crs)
+
+    def traza_en_cache(self, meta):
+        """Copia de las divisorias guardadas en meta si siguen vigentes, o None"""
+        from .hyda_processor import clave_traza, copiar_lineas
+        
+        clave = clave_traza(self.version_topo, [meta['punto1'], meta['punto2']], meta['auxiliares'])
+        traza = meta.get('traza')
+        if clave is None or traza is None or traza['clave'] != clave:
+            return None
+        return copiar_lineas(traza['lineas'])
+
+    def guardar_traza(self, meta):
+        """Asocia a meta la última traza calculada si corresponde a sus puntos"""
+        from .hyda_processor import clave_traza
+        
+        clave = clave_traza(self.version_topo, [meta['punto1'], meta['punto2']], meta['auxiliares'])
+        if clave is not None and self.traza_ult and self.traza_ult['clave'] == clave:
+            meta['traza'] = self.traza_ult
+
+    def lanzar_trazado(self, descripcion, trabajo, al_terminar):
+        """
+        Ejecuta trabajo(vigia) en un TareaTrazado, con vista previa de las
+        líneas en el lienzo. al_terminar(tarea) corre en el hilo principal
+        solo si la tarea sigue siendo la vigente (ver terminar_trazado).
+        """
+        self.cancelar_trazado()
+        self.borrar_vista_previa()
+        tarea = TareaTrazado(descripcion, trabajo, al_terminar)
+        tarea.parcial.connect(lambda num, pts: self.mostrar_parcial(tarea, num, pts))
+        self.tarea_traza = tarea
+        self.dlg.inicio_trazado()
+        QgsApplication.taskManager().addTask(tarea)
+    
+    def cancelar_trazado(self):
+        if self.tarea_traza:
+            self.tarea_traza.cancel()
+    
+    def terminar_trazado(self, tarea):
+        """Hilo principal: limpia la vista previa; True si hay resultado que publicar"""
+        if tarea is not self.tarea_traza:
+            return False
+        self.tarea_traza = None
+        self.borrar_vista_previa()
+        self.dlg.fin_trazado()
+        
+        if tarea.resultado is None:
+            if tarea.error:
+                registro.critico("Error trazando divisorias:\n%s", tarea.error)
+                self.dlg.actualizar_estado("Error en la delimitación", mostrar_check=False, color="#E53935")
+                QMessageBox.critical(self.dlg, "Error", f"Error:\n\n{tarea.error.strip().splitlines()[-1]}")
+            else:
+                registro.info("Delimitación cancelada")
+                self.dlg.actualizar_estado("Delimitación cancelada", mostrar_check=False, color="#E53935")
+            return False
+        return True
+    
+    def mostrar_parcial(self, tarea, num, pts):
+        """Vista previa de la línea num mientras se traza"""
+        if tarea is not self.tarea_traza or len(pts) < 2:
+            return
+        rb = self.rb_prev.get(num)
+        if rb is None:
+            rb = QgsRubberBand(self.iface.mapCanvas(), QgsWkbTypes.LineGeometry)
+            rb.setColor(QColor(255, 140, 0, 200))
+            rb.setWidth(2)
+            self.rb_prev[num] = rb
+        # Vértices en el SRC de las curvas; el lienzo los reproyecta
+        rb.setToGeometry(QgsGeometry.fromPolylineXY(pts), self.capa_topo)
+    
+    def borrar_vista_previa(self):
+        for rb in self.rb_prev.values():
+            rb.reset(QgsWkbTypes.LineGeometry)
+            self.iface.mapCanvas().scene().removeItem(rb)
+        self.rb_prev = {}
 
     def procesar_con_auxiliar_y_directos(self, pt_aux):
-        """Procesa auxiliar considerando puntos directos previos"""
+        """
+        Procesa auxiliar considerando puntos directos previos. La extensión se
+        traza en segundo plano sobre una copia de las líneas (fin_auxiliar).
+        """
         if len(self.pts_ini) < 2:
             return
         
@@ -463,88 +656,89 @@ class HYDA:
             QMessageBox.warning(self.dlg, "Advertencia", "Debe cargar topografía")
             return
         
-        QgsMessageLog.logMessage("="*60, 'HYDA', Qgis.Info)
-        QgsMessageLog.logMessage(f"Proc auxiliar con directos", 'HYDA', Qgis.Info)
+        registro.depuracion("Proc auxiliar con directos")
         
-        try:
-            from .hyda_processor import procesar_divisoria_individual, procesar_desde_auxiliar, crear_poligono_cuenca, recortar_lineas_en_cruce
-            
-            # Si ya existen líneas, trabajar sobre ellas
-            if self.res_lin and len(self.res_lin) >= 2:
-                # Encontrar la línea más cercana al punto auxiliar
-                d_min = float('inf')
-                lin_c = None
-                idx_lin = -1
+        # Si ya existen líneas, trabajar sobre ellas
+        if not self.res_lin or len(self.res_lin) < 2:
+            return
+        
+        from .hyda_processor import copiar_lineas
+        lineas = copiar_lineas(self.res_lin)
+        
+        # Encontrar la línea más cercana al punto auxiliar
+        d_min = float('inf')
+        lin_c = None
+        idx_lin = -1
+        
+        for i, r in enumerate(lineas):
+            if len(r['puntos']) < 2:
+                continue
+            pt_fin = r['punto_final']
+            d = pt_fin.distance(pt_aux)
+            if d < d_min:
+                d_min = d
+                lin_c = r
+                idx_lin = i
+        
+        if lin_c is None:
+            return
+        
+        # Obtener puntos de conexión directa pendientes para esta línea
+        pts_directos = []
+        for conexion in self.pts_conexion:
+            if conexion.get('linea_idx') == idx_lin:
+                pts_directos.append(conexion['punto_click'])
+        
+        # Agregar puntos directos a la línea
+        if pts_directos:
+            registro.depuracion("Agregando %d puntos directos", len(pts_directos))
+            for pt_dir in pts_directos:
+                if pt_dir not in lin_c['puntos']:
+                    lin_c['puntos'].append(pt_dir)
+        
+        # Agregar conexión directa al punto auxiliar
+        lin_c['puntos'].append(pt_aux)
+        registro.depuracion("L#%d cerc aux (%.1fm)", lin_c['numero'], d_min)
+        
+        # Determinar otra línea para detección de cruces
+        otra_pts = lineas[1]['puntos'] if idx_lin == 0 else lineas[0]['puntos']
+        
+        # Continuar con metodología de auxiliar desde el punto auxiliar
+        serv = self.servicio()
+        
+        def trabajo(vigia):
+            serv.extender_desde_auxiliar(lin_c, pt_aux, otra_pts, vigia)
+            return lineas
+        
+        self.lanzar_trazado("extendiendo divisoria", trabajo, self.fin_auxiliar)
+    
+    def fin_auxiliar(self, tarea):
+        """Hilo principal: adopta las líneas extendidas y actualiza el polígono"""
+        if not self.terminar_trazado(tarea):
+            return
+        
+        with registro.agrupado():
+            try:
+                self.res_lin = tarea.resultado
                 
-                for i, r in enumerate(self.res_lin):
-                    if len(r['puntos']) < 2:
-                        continue
-                    pt_fin = r['punto_final']
-                    d = pt_fin.distance(pt_aux)
-                    if d < d_min:
-                        d_min = d
-                        lin_c = r
-                        idx_lin = i
+                # Actualizar estado
+                self.dlg.actualizar_estado("Delimitación modificada", mostrar_check=True, color="#24C2E2")
                 
-                if lin_c is not None:
-                    # Obtener puntos de conexión directa pendientes para esta línea
-                    pts_directos = []
-                    for conexion in self.pts_conexion:
-                        if conexion.get('linea_idx') == idx_lin:
-                            pts_directos.append(conexion['punto_click'])
-                    
-                    # Agregar puntos directos a la línea
-                    if pts_directos:
-                        QgsMessageLog.logMessage(f"Agregando {len(pts_directos)} puntos directos", 'HYDA', Qgis.Info)
-                        for pt_dir in pts_directos:
-                            if pt_dir not in lin_c['puntos']:
-                                lin_c['puntos'].append(pt_dir)
-                    
-                    # Agregar conexión directa al punto auxiliar
-                    lin_c['puntos'].append(pt_aux)
-                    QgsMessageLog.logMessage(f"L#{lin_c['numero']} cerc aux ({d_min:.1f}m)", 'HYDA', Qgis.Info)
-                    
-                    # Determinar otra línea para detección de cruces
-                    otra_pts = None
-                    if len(self.res_lin) >= 2:
-                        otra_pts = self.res_lin[1]['puntos'] if idx_lin == 0 else self.res_lin[0]['puntos']
-                    
-                    # Continuar con metodología de auxiliar desde el punto auxiliar
-                    r_cont = procesar_desde_auxiliar(pt_aux, self.idx_esp, self.curvas,
-                        lin_c['elev_final'], lin_c['curvas_usadas'], otra_pts)
-                    
-                    if len(r_cont['puntos']) > 1:
-                        lin_c['puntos'].extend(r_cont['puntos'][1:])
-                        lin_c['elev_final'] = r_cont['elev_final']
-                        lin_c['ganancia'] = lin_c['elev_final'] - lin_c['elev_inicial']
-                        lin_c['num_puntos'] = len(lin_c['puntos'])
-                        lin_c['salto_auxiliar'] = True
-                        lin_c['razon'] = r_cont['razon']
-                        lin_c['punto_final'] = r_cont['puntos'][-1] if r_cont['puntos'] else pt_aux
-                        lin_c['longitud'] = QgsGeometry.fromPolylineXY(lin_c['puntos']).length()
-                        QgsMessageLog.logMessage(f"✓ Ext: {r_cont['elev_inicial']}→{r_cont['elev_final']}m", 'HYDA', Qgis.Info)
-                    else:
-                        lin_c['salto_auxiliar'] = False
-                        QgsMessageLog.logMessage("⚠ Sin curvas desde aux", 'HYDA', Qgis.Warning)
-                    
-                    # Actualizar estado
-                    self.dlg.actualizar_estado("Delimitación modificada", mostrar_check=True, color="#24C2E2")
-                    
-                    # Actualizar polígono
-                    if self.poly_edit is not None:
-                        self.actualizar_poly_exist()
-                    else:
-                        self.crear_act_capas()
-            
-            QgsMessageLog.logMessage("="*60, 'HYDA', Qgis.Info)
+                # Actualizar polígono
+                if self.poly_edit is not None:
+                    self.actualizar_poly_exist()
+                else:
+                    self.crear_act_capas()
             
-        except Exception as e:
-            import traceback
-            QgsMessageLog.logMessage(f"Error: {str(e)}", 'HYDA', Qgis.Critical)
-            QgsMessageLog.logMessage(traceback.format_exc(), 'HYDA', Qgis.Critical)
-            QMessageBox.critical(self.dlg, "Error", f"Error:\n\n{str(e)}")
+            except Exception as e:
+                registro.excepcion("Error: %s", e)
+                QMessageBox.critical(self.dlg, "Error", f"Error:\n\n{str(e)}")
 
     def procesar_divisorias(self, modo='nuevo'):
+        """
+        Traza ambas divisorias (y sus auxiliares) en segundo plano; el
+        polígono se escribe en fin_divisorias, en el hilo principal.
+        """
         if len(self.pts_ini) < 2:
             return
         
@@ -558,158 +752,90 @@ class HYDA:
             QMessageBox.warning(self.dlg, "Advertencia", "Debe seleccionar una capa de salida")
             return
         
-        QgsMessageLog.logMessage("="*60, 'HYDA', Qgis.Info)
-        QgsMessageLog.logMessage(f"Proc div (modo: {modo})", 'HYDA', Qgis.Info)
+        registro.depuracion("Proc div (modo: %s)", modo)
         
-        try:
-            from .hyda_processor import procesar_divisoria_individual, procesar_desde_auxiliar, crear_poligono_cuenca
-            
-            res = []
-            
-            QgsMessageLog.logMessage("Proc L1", 'HYDA', Qgis.Info)
-            r1 = procesar_divisoria_individual(self.pts_ini[0], self.idx_esp, self.curvas, 1, self.pts_aux, None)
-            res.append(r1)
-            QgsMessageLog.logMessage(f"L1: {r1['elev_inicial']}→{r1['elev_final']}m | {r1['longitud']/1000:.2f}km | Pts:{r1['num_puntos']}", 'HYDA', Qgis.Info)
-            
-            QgsMessageLog.logMessage("Proc L2", 'HYDA', Qgis.Info)
-            r2 = procesar_divisoria_individual(self.pts_ini[1], self.idx_esp, self.curvas, 2, self.pts_aux, None)  # ← Cambio: None en vez de r1['puntos']
-            res.append(r2)
-            QgsMessageLog.logMessage(f"L2: {r2['elev_inicial']}→{r2['elev_final']}m | {r2['longitud']/1000:.2f}km | Pts:{r2['num_puntos']}", 'HYDA', Qgis.Info)
-            
-            # RECORTAR LÍNEAS EN EL CRUCE (agregado)
-            from .hyda_processor import recortar_lineas_en_cruce
-            
-            pts1_orig = r1['puntos'].copy()
-            pts2_orig = r2['puntos'].copy()
-            
-            pts1_rec, pts2_rec, pt_cruce = recortar_lineas_en_cruce(pts1_orig, pts2_orig)
-            
-            if pt_cruce:
-                QgsMessageLog.logMessage(f"✂ Cruce detectado - L1: {len(pts1_orig)}→{len(pts1_rec)} pts | L2: {len(pts2_orig)}→{len(pts2_rec)} pts", 'HYDA', Qgis.Info)
-                r1['puntos'] = pts1_rec
-                r2['puntos'] = pts2_rec
-                r1['num_puntos'] = len(pts1_rec)
-                r2['num_puntos'] = len(pts2_rec)
-                r1['longitud'] = QgsGeometry.fromPolylineXY(pts1_rec).length()
-                r2['longitud'] = QgsGeometry.fromPolylineXY(pts2_rec).length()
-                r1['punto_final'] = pts1_rec[-1]
-                r2['punto_final'] = pts2_rec[-1]
-            else:
-                QgsMessageLog.logMessage("⚠ No se detectó cruce entre líneas", 'HYDA', Qgis.Warning)
-            
-            if len(self.pts_aux) > 0:
-                QgsMessageLog.logMessage("Eval pto aux", 'HYDA', Qgis.Info)
+        serv = self.servicio()
+        pts_ini, pts_aux = list(self.pts_ini), list(self.pts_aux)
+        
+        def trabajo(vigia):
+            # Carga por área de interés: asegurar curvas alrededor de los puntos
+            for pt in pts_ini:
+                serv.idx.asegurar_cobertura(pt.x(), pt.y(), R_AOI)
+            # Ambas líneas recortadas en su cruce; luego los auxiliares
+            return serv.trazar(pts_ini, pts_aux, vigia)
+        
+        self.lanzar_trazado("trazando divisorias", trabajo,
+                            lambda tarea: self.fin_divisorias(tarea, modo, pts_ini, pts_aux))
+    
+    def fin_divisorias(self, tarea, modo, pts_ini, pts_aux):
+        """Hilo principal: publica las divisorias y escribe el polígono"""
+        if not self.terminar_trazado(tarea):
+            return
+        
+        with registro.agrupado():
+            try:
+                from .hyda_processor import clave_traza, copiar_lineas
                 
-                for pt_aux in self.pts_aux:
-                    lin_c = None
-                    d_min = float('inf')
-                    idx_lin = -1
-                    otra_pts = None
-                    
-                    for i, r in enumerate(res):
-                        if len(r['puntos']) < 2:
-                            continue
-                        pt_fin = r['punto_final']
-                        d = pt_fin.distance(pt_aux)
-                        if d < d_min:
-                            d_min = d
-                            lin_c = r
-                            idx_lin = i
-                    
-                    if lin_c is not None:
-                        if len(res) >= 2:
-                            otra_pts = res[1]['puntos'] if idx_lin == 0 else res[0]['puntos']
-                        
-                        QgsMessageLog.logMessage(f"L#{lin_c['numero']} cerc aux ({d_min:.1f}m)", 'HYDA', Qgis.Info)
-                        lin_c['puntos'].append(pt_aux)
-                        
-                        r_cont = procesar_desde_auxiliar(pt_aux, self.idx_esp, self.curvas,
-                            lin_c['elev_final'], lin_c['curvas_usadas'], otra_pts)
-                        
-                        if len(r_cont['puntos']) > 1:
-                            lin_c['puntos'].extend(r_cont['puntos'][1:])
-                            lin_c['elev_final'] = r_cont['elev_final']
-                            lin_c['ganancia'] = lin_c['elev_final'] - lin_c['elev_inicial']
-                            lin_c['num_puntos'] = len(lin_c['puntos'])
-                            lin_c['salto_auxiliar'] = True
-                            lin_c['razon'] = r_cont['razon']
-                            lin_c['punto_final'] = r_cont['puntos'][-1] if r_cont['puntos'] else pt_aux
-                            lin_c['longitud'] = QgsGeometry.fromPolylineXY(lin_c['puntos']).length()
-                            QgsMessageLog.logMessage(f"✓ Ext: {r_cont['elev_inicial']}→{r_cont['elev_final']}m", 'HYDA', Qgis.Info)
-                        else:
-                            lin_c['salto_auxiliar'] = False
-                            QgsMessageLog.logMessage("⚠ Sin curvas desde aux", 'HYDA', Qgis.Warning)
-            
-            self.res_lin = res
-            
-            if modo == 'editar' or modo == 'cargar':
-                self.actualizar_poly_exist()
-            else:
-                self.crear_act_capas()
-            
-            QgsMessageLog.logMessage("="*60, 'HYDA', Qgis.Info)
-            QgsMessageLog.logMessage("Divisorias OK", 'HYDA', Qgis.Info)
+                res, _ = tarea.resultado
+                self.res_lin = res
+                # Copia aparte: res_lin se modifica luego con auxiliares y conexiones
+                clave = clave_traza(self.version_topo, pts_ini, pts_aux)
+                self.traza_ult = {'clave': clave, 'lineas': copiar_lineas(res)} if clave is not None else None
+                
+                if modo == 'editar' or modo == 'cargar':
+                    self.actualizar_poly_exist()
+                else:
+                    self.crear_act_capas()
+                    self.dlg.habilitar_puntos_auxiliares()
+                    self.dlg.actualizar_estado("Delimitación creada", mostrar_check=True, color="#58AD03")
+                
+                registro.info("Divisorias OK")
             
-        except Exception as e:
-            import traceback
-            QgsMessageLog.logMessage(f"Error: {str(e)}", 'HYDA', Qgis.Critical)
-            QgsMessageLog.logMessage(traceback.format_exc(), 'HYDA', Qgis.Critical)
-            QMessageBox.critical(self.dlg, "Error", f"Error:\n\n{str(e)}")
+            except Exception as e:
+                registro.excepcion("Error: %s", e)
+                QMessageBox.critical(self.dlg, "Error", f"Error:\n\n{str(e)}")
 
     def actualizar_poly_exist(self):
-        from .hyda_processor import crear_poligono_cuenca
-        
         if self.poly_edit is None:
-            QgsMessageLog.logMessage("No hay poly en edición", 'HYDA', Qgis.Warning)
+            registro.aviso("No hay poly en edición")
             return
         
         capa_d = self.dlg.get_capa_destino()
         if not capa_d or not capa_d.isValid():
-            QgsMessageLog.logMessage("Capa dest no válida", 'HYDA', Qgis.Warning)
+            registro.aviso("Capa dest no válida")
             return
         
-        if len(self.res_lin) < 2:
-            QgsMessageLog.logMessage("No hay sufic líneas", 'HYDA', Qgis.Warning)
+        meta = self.meta_capa(capa_d).get(self.poly_edit)
+        if meta is None:
+            registro.aviso("Poly %s no es de la capa dest", self.poly_edit)
             return
         
-        nuevo_p = crear_poligono_cuenca(self.res_lin[0]['puntos'], self.res_lin[1]['puntos'])
-        
-        if nuevo_p is None:
+        if len(self.res_lin) < 2:
+            registro.aviso("No hay sufic líneas")
             return
         
-        capa_d.startEditing()
+        serv = self.servicio()
+        nuevo_p = serv.poligono(self.res_lin)
         
-        feat = capa_d.getFeature(self.poly_edit)
-        if not feat.isValid():
-            capa_d.rollBack()
+        if nuevo_p is None:
             return
         
-        capa_d.changeGeometry(self.poly_edit, nuevo_p)
-        
-        area_m2 = int(nuevo_p.area())
-                
-        if capa_d.fields().indexOf('Area_m2') != -1:
-            capa_d.changeAttributeValue(self.poly_edit, capa_d.fields().indexOf('Area_m2'), area_m2)
-
-        if capa_d.commitChanges():
-            capa_d.triggerRepaint()
-            self.poly_meta[self.poly_edit]['auxiliares'] = self.pts_aux.copy()
-            self.poly_meta[self.poly_edit]['conexiones'] = self.pts_conexion.copy()
-            QgsMessageLog.logMessage(f"✓ Poly {self.poly_edit} actualizado | Área: {area_m2} m²", 'HYDA', Qgis.Info)
-        else:
-            capa_d.rollBack()
+        if serv.actualizar_poligono(capa_d, self.poly_edit, nuevo_p):
+            meta['auxiliares'] = self.pts_aux.copy()
+            meta['conexiones'] = self.pts_conexion.copy()
+            self.guardar_traza(meta)
+            self.guardar_meta()
 
     def crear_act_capas(self):
-        from .hyda_processor import crear_poligono_cuenca
-        
         if len(self.res_lin) < 2:
-            QgsMessageLog.logMessage("No se pueden crear capas sin líneas", 'HYDA', Qgis.Warning)
+            registro.aviso("No se pueden crear capas sin líneas")
             return
 
-        poly_g = crear_poligono_cuenca(self.res_lin[0]['puntos'], self.res_lin[1]['puntos'])
+        serv = self.servicio()
+        poly_g = serv.poligono(self.res_lin)
 
         if poly_g is None:
-            QgsMessageLog.logMessage("No se pudo crear poly cuenca", 'HYDA', Qgis.Warning)
+            registro.aviso("No se pudo crear poly cuenca")
             return
 
         capa_d = self.dlg.get_capa_destino()
@@ -718,65 +844,28 @@ class HYDA:
             QMessageBox.warning(self.dlg, "Advertencia", "Debe seleccionar una capa de salida válida")
             return
 
-        area_m2 = int(poly_g.area())
-
-
-        def aseg_campos(prov, layer):
-            nuevos = []
-            if layer.fields().indexOf('Area_m2') == -1:
-                nuevos.append(QgsField('Area_m2', QVariant.Int))  # Int en vez de Double
-            if nuevos:
-                prov.addAttributes(nuevos)
-                layer.updateFields()
-
-        def set_atr(feat, layer):
-            if layer.fields().indexOf('Area_m2') != -1:
-                feat['Area_m2'] = area_m2
-
-        try:
-            if self.capa_topo and self.capa_topo.crs().isValid() and capa_d.crs().isValid() \
-            and self.capa_topo.crs() != capa_d.crs():
-                tr = QgsCoordinateTransform(self.capa_topo.crs(), capa_d.crs(), QgsProject.instance())
-                poly_g.transform(tr)
-        except Exception as e:
-            QgsMessageLog.logMessage(f"Adv reproyec: {e}", 'HYDA', Qgis.Warning)
-
-        prov_d = capa_d.dataProvider()
-        aseg_campos(prov_d, capa_d)
-
-        feat = QgsFeature(capa_d.fields())
-        feat.setGeometry(poly_g)
-        set_atr(feat, capa_d)
-
-        capa_d.startEditing()
-        ok = capa_d.addFeature(feat)
-        
-        if ok:
-            if capa_d.commitChanges():
-                capa_d.triggerRepaint()
-                
-                fids = [f.id() for f in capa_d.getFeatures()]
-                if fids:
-                    nuevo_fid = max(fids)
-                    self.poly_meta[nuevo_fid] = {
-                        'punto1': self.pts_ini[0],
-                        'punto2': self.pts_ini[1],
-                        'auxiliares': self.pts_aux.copy(),
-                        'conexiones': self.pts_conexion.copy()
-                    }
-                    QgsMessageLog.logMessage(f"Poly agregado (FID: {nuevo_fid}) | Meta OK | Tot: {len(self.poly_meta)}", 'HYDA', Qgis.Info)
-            else:
-                QgsMessageLog.logMessage("Error commitChanges", 'HYDA', Qgis.Warning)
-        else:
-            capa_d.rollBack()
-            QgsMessageLog.logMessage("No se pudo agregar poly", 'HYDA', Qgis.Warning)
+        nuevo_fid = serv.agregar_poligono(capa_d, poly_g)
+        if nuevo_fid is not None:
+            poly_meta = self.meta_capa(capa_d)
+            poly_meta[nuevo_fid] = {
+                'punto1': self.pts_ini[0],
+                'punto2': self.pts_ini[1],
+                'auxiliares': self.pts_aux.copy(),
+                'conexiones': self.pts_conexion.copy()
+            }
+            self.guardar_traza(poly_meta[nuevo_fid])
+            self.guardar_meta()
+            registro.info("Poly agregado (FID: %s) | Meta OK | Tot: %d", nuevo_fid, len(poly_meta))
 
     def limpiar_todo(self):
+        self.cancelar_trazado()
+        self.borrar_vista_previa()
         self.pts_ini = []
         self.pts_aux = []
         self.pts_conexion = []
         self.poly_meta = {}
         self.poly_edit = None
+        self.traza_ult = None
         
         if self.mt_ini:
             self.mt_ini.reset()
@@ -801,4 +890,4 @@ class HYDA:
             QgsProject.instance().removeMapLayer(self.capa_div.id())
             self.capa_div = None
         
-        QgsMessageLog.logMessage("Plugin limpiado - listo", 'HYDA', Qgis.Info)
+        registro.info("Plugin limpiado - listo")
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Algoritmo de Processing: delimitación en lote desde pares de puntos de inicio"""
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException,
+                       QgsProcessingMultiStepFeedback, QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterField, QgsProcessingParameterFeatureSink,
+                       QgsProcessingParameterNumber, QgsProcessingParameterVectorLayer,
+                       QgsCoordinateTransform, QgsFeatureSink, QgsWkbTypes)
+import os
+import time
+
+from .cache_topo import clave_cache, dir_cache_defecto
+from .carga_topo import cargar_topologia, CargaCancelada
+from .lote import delimitar_lote
+from .servicio import pares_de_fuente, entidades_lote, campos_cuenca, campos_divisoria
+
+
+class HYDALoteAlgorithm(QgsProcessingAlgorithm):
+    """
+    Delimita una cuenca por cada par de puntos de inicio. La topografía se
+    carga una vez (con caché en disco) y se comparte en memoria con un pool
+    de procesos; polígonos y divisorias se escriben con un solo addFeatures.
+    """
+
+    INPUT = 'INPUT'
+    CAMPO_PAR = 'CAMPO_PAR'
+    TOPO = 'TOPO'
+    CAMPO_ELEV = 'CAMPO_ELEV'
+    ELEV_MIN = 'ELEV_MIN'
+    ELEV_MAX = 'ELEV_MAX'
+    PROCESOS = 'PROCESOS'
+    OUTPUT = 'OUTPUT'
+    LINEAS = 'LINEAS'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return HYDALoteAlgorithm()
+
+    def name(self):
+        return 'delimitacion_lote'
+
+    def displayName(self):
+        return self.tr('Delimitación en lote')
+
+    def group(self):
+        return self.tr('Delimitación')
+
+    def groupId(self):
+        return 'delimitacion'
+
+    def shortHelpString(self):
+        return self.tr(
+            "Delimita una cuenca por cada par de puntos de inicio.\n"
+            "Entrada de líneas: el primer y el último vértice de cada línea forman el par.\n"
+            "Entrada de puntos: dos puntos con el mismo valor en el campo de par.\n"
+            "Elevación mínima y máxima (opcionales, juntas) cargan solo las curvas de ese rango.\n"
+            "Procesos = 0 usa todos los núcleos menos uno.")
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.INPUT, self.tr('Pares de puntos de inicio'),
+            [QgsProcessing.TypeVectorPoint, QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterField(
+            self.CAMPO_PAR, self.tr('Campo de par (solo puntos)'),
+            parentLayerParameterName=self.INPUT, optional=True))
+        self.addParameter(QgsProcessingParameterVectorLayer(
+            self.TOPO, self.tr('Curvas de nivel'), [QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterField(
+            self.CAMPO_ELEV, self.tr('Campo de elevación'),
+            parentLayerParameterName=self.TOPO, type=QgsProcessingParameterField.Numeric))
+        for nombre, txt in ((self.ELEV_MIN, 'Elevación mínima'), (self.ELEV_MAX, 'Elevación máxima')):
+            self.addParameter(QgsProcessingParameterNumber(
+                nombre, self.tr(txt), type=QgsProcessingParameterNumber.Double, optional=True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.PROCESOS, self.tr('Procesos'), type=QgsProcessingParameterNumber.Integer,
+            defaultValue=0, minValue=0))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT, self.tr('Cuencas'), QgsProcessing.TypeVectorPolygon))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.LINEAS, self.tr('Divisorias'), QgsProcessing.TypeVectorLine))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        fuente = self.parameterAsSource(parameters, self.INPUT, context)
+        if fuente is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        campo_par = self.parameterAsString(parameters, self.CAMPO_PAR, context)
+        capa = self.parameterAsVectorLayer(parameters, self.TOPO, context)
+        fuente_topo = self.parameterAsSource(parameters, self.TOPO, context)
+        campo = self.parameterAsString(parameters, self.CAMPO_ELEV, context)
+        rango = None
+        if parameters.get(self.ELEV_MIN) is not None or parameters.get(self.ELEV_MAX) is not None:
+            if parameters.get(self.ELEV_MIN) is None or parameters.get(self.ELEV_MAX) is None:
+                raise QgsProcessingException(self.tr('Indique la elevación mínima y la máxima'))
+            rango = (self.parameterAsDouble(parameters, self.ELEV_MIN, context),
+                     self.parameterAsDouble(parameters, self.ELEV_MAX, context))
+        procesos = self.parameterAsInt(parameters, self.PROCESOS, context) or max(1, (os.cpu_count() or 2) - 1)
+
+        tr = QgsCoordinateTransform(fuente.sourceCrs(), capa.crs(), context.transformContext())
+        try:
+            pares, ids, omitidos = pares_de_fuente(fuente, campo_par, tr)
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+        for par, n in omitidos.items():
+            feedback.reportError(f'Par {par}: {n} puntos, se omite', False)
+
+        pasos = QgsProcessingMultiStepFeedback(2, feedback)
+        clave = clave_cache(capa, campo, rango)
+        try:
+            alm, idx, info = cargar_topologia(fuente_topo, campo, clave, dir_cache_defecto(capa) if clave else None,
+                                              pasos, capa.featureCount(), capa.fields(), rango)
+        except CargaCancelada:
+            return {}
+        feedback.pushInfo(f"Curvas: {len(alm)} | {info['t']:.1f}s | caché: {info['cache']}")
+
+        pasos.setCurrentStep(1)
+        t0 = time.time()
+        resultados = delimitar_lote(pares, alm, idx, procesos, pasos)
+        feedback.pushInfo(f"{len(resultados)} pares en {time.time() - t0:.1f}s | procesos: {procesos}")
+
+        feats_p, feats_l, errores = entidades_lote(resultados, ids)
+        for par, error in errores:
+            feedback.reportError(f"Par {par}: {error}", False)
+
+        sink_p, dest_p = self.parameterAsSink(parameters, self.OUTPUT, context, campos_cuenca(),
+                                              QgsWkbTypes.MultiPolygon, capa.crs())
+        sink_l, dest_l = self.parameterAsSink(parameters, self.LINEAS, context, campos_divisoria(),
+                                              QgsWkbTypes.LineString, capa.crs())
+
+        # Una sola escritura por capa de salida
+        sink_p.addFeatures(feats_p, QgsFeatureSink.FastInsert)
+        sink_l.addFeatures(feats_l, QgsFeatureSink.FastInsert)
+        return {self.OUTPUT: dest_p, self.LINEAS: dest_l}
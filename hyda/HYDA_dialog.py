@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 from qgis.PyQt import QtWidgets, uic
-from qgis.PyQt.QtWidgets import QDockWidget, QWidget, QComboBox, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QMessageBox, QFrame
+from qgis.PyQt.QtWidgets import QDockWidget, QWidget, QComboBox, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QMessageBox, QFrame, QProgressBar, QCheckBox
 from qgis.PyQt.QtCore import pyqtSignal, Qt, QSize
 from qgis.PyQt.QtGui import QIcon, QPainter, QColor
 from qgis.core import QgsProject, QgsVectorLayer, QgsWkbTypes
@@ -9,6 +9,8 @@ import os
 class HYDADialog(QDockWidget):
     
     topoLoaded = pyqtSignal(object, str)
+    cargaCancelada = pyqtSignal()
+    trazadoCancelado = pyqtSignal()
     puntoInicialMode = pyqtSignal(bool)
     puntoAuxiliarMode = pyqtSignal(bool)
     puntoConexionMode = pyqtSignal(bool)
@@ -118,8 +120,34 @@ class HYDADialog(QDockWidget):
                 background-color: #2e5052;
             }
         """)
+        self.chk_aoi = QCheckBox("Solo área visible (ampliar bajo demanda)")
+        self.chk_aoi.setToolTip("Carga las curvas de la vista actual y agrega teselas al delimitar")
+        frame1_layout.addWidget(self.chk_aoi)
+        
         frame1_layout.addWidget(self.btn_cargar_topo)
         
+        # Progreso de la carga en segundo plano
+        carga_layout = QHBoxLayout()
+        carga_layout.setSpacing(3)
+        carga_layout.setContentsMargins(0, 3, 0, 0)
+        
+        self.barra_carga = QProgressBar()
+        self.barra_carga.setRange(0, 100)
+        self.barra_carga.setMaximumHeight(14)
+        self.barra_carga.setTextVisible(False)
+        carga_layout.addWidget(self.barra_carga)
+        
+        self.btn_cancelar_carga = QPushButton("✕")
+        self.btn_cancelar_carga.setToolTip("Cancelar carga")
+        self.btn_cancelar_carga.setFixedSize(22, 18)
+        self.btn_cancelar_carga.setStyleSheet("padding: 0px;")
+        self.btn_cancelar_carga.clicked.connect(self.cargaCancelada.emit)
+        carga_layout.addWidget(self.btn_cancelar_carga)
+        
+        self.barra_carga.setVisible(False)
+        self.btn_cancelar_carga.setVisible(False)
+        frame1_layout.addLayout(carga_layout)
+        
         frame1.setLayout(frame1_layout)
         layout.addWidget(frame1)
         
@@ -261,6 +289,28 @@ class HYDADialog(QDockWidget):
         # Sin addStretch() para que los botones se distribuyan
         frame3_layout.addLayout(buttons_layout)
         
+        # Trazado en segundo plano
+        trazado_layout = QHBoxLayout()
+        trazado_layout.setSpacing(3)
+        trazado_layout.setContentsMargins(0, 3, 0, 0)
+        
+        self.barra_trazado = QProgressBar()
+        self.barra_trazado.setRange(0, 0)
+        self.barra_trazado.setMaximumHeight(14)
+        self.barra_trazado.setTextVisible(False)
+        trazado_layout.addWidget(self.barra_trazado)
+        
+        self.btn_cancelar_trazado = QPushButton("✕")
+        self.btn_cancelar_trazado.setToolTip("Cancelar delimitación")
+        self.btn_cancelar_trazado.setFixedSize(22, 18)
+        self.btn_cancelar_trazado.setStyleSheet("padding: 0px;")
+        self.btn_cancelar_trazado.clicked.connect(self.trazadoCancelado.emit)
+        trazado_layout.addWidget(self.btn_cancelar_trazado)
+        
+        self.barra_trazado.setVisible(False)
+        self.btn_cancelar_trazado.setVisible(False)
+        frame3_layout.addLayout(trazado_layout)
+        
         frame3.setLayout(frame3_layout)
         layout.addWidget(frame3)
         
@@ -338,17 +388,59 @@ class HYDADialog(QDockWidget):
             QMessageBox.warning(self, "Advertencia", "Seleccione un campo de elevación")
             return
         
-        self.actualizar_estado("Cargando topografía", mostrar_check=False)
-        
         self.capa_topo = capa
         self.campo_elev = campo
         
-        self.actualizar_estado("Topografía cargada", mostrar_check=True, color="#4CAF50")
-        self.btn_puntos_iniciales.setEnabled(True)
-        self.btn_seleccionar_poligono.setEnabled(True)
+        self.actualizar_estado("Cargando topografía", mostrar_check=False)
+        self.habilitar_delimitacion(False)
+        self.btn_cargar_topo.setEnabled(False)
+        self.barra_carga.setValue(0)
+        self.barra_carga.setVisible(True)
+        self.btn_cancelar_carga.setVisible(True)
         
         self.topoLoaded.emit(capa, campo)
     
+    def progreso_carga(self, pct):
+        self.barra_carga.setValue(int(pct))
+    
+    def fin_carga(self, ok, mensaje):
+        """Fin de la tarea de carga: habilita los botones de una vez"""
+        self.barra_carga.setVisible(False)
+        self.btn_cancelar_carga.setVisible(False)
+        self.btn_cargar_topo.setEnabled(True)
+        
+        if ok:
+            self.habilitar_delimitacion(True)
+            self.actualizar_estado(mensaje, mostrar_check=True, color="#4CAF50")
+        else:
+            self.actualizar_estado(mensaje, mostrar_check=False, color="#E53935")
+    
+    def inicio_trazado(self):
+        """Divisorias en cálculo: barra de actividad y botón para cancelar"""
+        self.barra_trazado.setVisible(True)
+        self.btn_cancelar_trazado.setVisible(True)
+        self.actualizar_estado("Trazando divisorias", mostrar_check=False, color="#0483AD")
+    
+    def fin_trazado(self):
+        self.barra_trazado.setVisible(False)
+        self.btn_cancelar_trazado.setVisible(False)
+    
+    def habilitar_delimitacion(self, activo):
+        """Botones que requieren topografía cargada"""
+        for btn, modo in ((self.btn_puntos_iniciales, self.puntoInicialMode),
+                          (self.btn_seleccionar_poligono, self.seleccionarPoligonoMode),
+                          (self.btn_puntos_auxiliares, self.puntoAuxiliarMode),
+                          (self.btn_puntos_conexion, self.puntoConexionMode)):
+            if not activo and btn.isChecked():
+                btn.setChecked(False)
+                modo.emit(False)
+        
+        self.btn_puntos_iniciales.setEnabled(activo)
+        self.btn_seleccionar_poligono.setEnabled(activo)
+        if not activo:
+            self.btn_puntos_auxiliares.setEnabled(False)
+            self.btn_puntos_conexion.setEnabled(False)
+    
     def toggle_puntos_iniciales(self):
         if self.btn_puntos_iniciales.isChecked():
             # Al activar Inicio, resetear puntos auxiliares y conexiones
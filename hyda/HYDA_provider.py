@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""Proveedor de Processing de HYDA"""
+
+from qgis.core import QgsProcessingProvider
+from qgis.PyQt.QtGui import QIcon
+import os.path
+
+from .HYDA_algorithm import HYDALoteAlgorithm
+
+
+class HYDAProvider(QgsProcessingProvider):
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(HYDALoteAlgorithm())
+
+    def id(self):
+        return 'hyda'
+
+    def name(self):
+        return 'HYDA'
+
+    def longName(self):
+        return 'HYDA - Hydrological Delimitation Assistant'
+
+    def icon(self):
+        return QIcon(os.path.join(os.path.dirname(__file__), 'icon.png'))
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""Almacén columnar de curvas de nivel"""
+
+from collections import OrderedDict
+from collections.abc import Mapping
+import struct
+
+from qgis.core import QgsGeometry
+import numpy as np
+
+from . import perfil
+from .geometria_np import dist_punto_curvas
+
+
+TOL_CERRADA = 2.0
+MAX_GEOMS = 4096
+ARREGLOS = ('coords', 'offsets', 'elev', 'origen', 'es_pico',
+            'bbox', 'cerrada', 'centro', 'longitud', 'area',
+            'padre', 'hijos_off', 'hijos')
+
+
+class VistaCurva:
+    """Acceso tipo dict a una curva: 'elevation', 'geometry' y 'es_pico'"""
+
+    __slots__ = ('alm', 'fid')
+
+    def __init__(self, alm, fid):
+        self.alm = alm
+        self.fid = fid
+
+    def __getitem__(self, clave):
+        if clave == 'elevation':
+            return float(self.alm.elev[self.fid])
+        if clave == 'geometry':
+            return self.alm.geometria(self.fid)
+        if clave == 'es_pico':
+            return bool(self.alm.es_pico[self.fid])
+        raise KeyError(clave)
+
+    def __contains__(self, clave):
+        return clave in ('elevation', 'geometry', 'es_pico')
+
+    def get(self, clave, defecto=None):
+        try:
+            return self[clave]
+        except KeyError:
+            return defecto
+
+
+class AlmacenCurvas(Mapping):
+    """
+    Curvas en estructura de arreglos: un buffer plano de coordenadas float64
+    y arreglos por curva (offsets, elevación, bbox, cerrada, centro).
+    Se comporta como el antiguo dict {fid: {'elevation', 'geometry'}};
+    las QgsGeometry se crean solo al pedirlas y se guardan en una caché LRU.
+    """
+
+    def __init__(self, coords, offsets, elev, origen=None):
+        self.coords = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        self.elev = np.ascontiguousarray(elev, dtype=np.float64)
+        n = len(self.elev)
+        if origen is None:
+            origen = np.full(n, -1, dtype=np.int64)
+        self.origen = np.ascontiguousarray(origen, dtype=np.int64)
+        # 0 / 1 = resultado de es_pico_real (ver anidamiento.construir_anidamiento)
+        self.es_pico = np.zeros(n, dtype=np.int8)
+        # Jerarquía de curvas cerradas (ver anidamiento.construir_anidamiento)
+        self.padre = np.full(n, -1, dtype=np.int64)
+        self.hijos_off = np.zeros(n + 1, dtype=np.int64)
+        self.hijos = np.zeros(0, dtype=np.int64)
+        self._geoms = OrderedDict()
+        self._reserva = {}
+        self._calcular_derivados()
+
+    @classmethod
+    def desde_arreglos(cls, arreglos):
+        """Reconstruye el almacén a partir de ARREGLOS ya calculados (caché)"""
+        alm = cls.__new__(cls)
+        for nom in ARREGLOS:
+            setattr(alm, nom, arreglos[nom])
+        alm._geoms = OrderedDict()
+        alm._reserva = {}
+        return alm
+
+    def arreglos(self):
+        return {nom: getattr(self, nom) for nom in ARREGLOS}
+
+    def extender(self, *otros):
+        """
+        Agrega al final las curvas de otros almacenes (carga por teselas).
+        Los fid existentes no cambian. Los derivados por curva vienen ya
+        calculados en otros y los arreglos crecen sobre una reserva, así que
+        cada llamada cuesta lo agregado y no el total. Las curvas nuevas
+        quedan sin jerarquía ni es_pico hasta anidamiento.actualizar_anidamiento.
+        """
+        for a in otros:
+            m = len(a)
+            if not m:
+                continue
+            self._anexar('offsets', a.offsets[1:] + self.offsets[-1])
+            for nom in ('coords', 'elev', 'origen', 'bbox', 'cerrada', 'centro', 'longitud', 'area'):
+                self._anexar(nom, getattr(a, nom))
+            self._anexar('es_pico', np.zeros(m, dtype=np.int8))
+            self._anexar('padre', np.full(m, -1, dtype=np.int64))
+            self._anexar('hijos_off', np.full(m, self.hijos_off[-1], dtype=np.int64))
+
+    def _anexar(self, nom, bloque):
+        """Agrega bloque al arreglo nom, que es una vista del inicio de su reserva"""
+        actual = getattr(self, nom)
+        n, m = len(actual), len(bloque)
+        buf = self._reserva.get(nom)
+        if buf is None or actual.base is not buf or len(buf) < n + m:
+            # Capacidad doble: las copias suman O(total) en todas las llamadas
+            buf = np.empty((max(2 * (n + m), 16),) + actual.shape[1:], dtype=actual.dtype)
+            buf[:n] = actual
+            self._reserva[nom] = buf
+        buf[n:n + m] = bloque
+        setattr(self, nom, buf[:n + m])
+
+    def _calcular_derivados(self):
+        n = len(self.elev)
+        if n == 0:
+            self.bbox = np.zeros((0, 4))
+            self.cerrada = np.zeros(0, dtype=bool)
+            self.centro = np.zeros((0, 2))
+            self.longitud = np.zeros(0)
+            self.area = np.zeros(0)
+            return
+
+        ini = self.offsets[:-1]
+        fin = self.offsets[1:]
+        nv = fin - ini
+        x = self.coords[:, 0]
+        y = self.coords[:, 1]
+
+        self.bbox = np.column_stack((
+            np.minimum.reduceat(x, ini), np.minimum.reduceat(y, ini),
+            np.maximum.reduceat(x, ini), np.maximum.reduceat(y, ini)))
+
+        # Segmentos de todo el buffer; el que une dos curvas se anula
+        lon = np.zeros(len(x))
+        lon[:-1] = np.hypot(np.diff(x), np.diff(y))
+        lon[fin - 1] = 0.0
+        mx = np.zeros(len(x))
+        my = np.zeros(len(x))
+        mx[:-1] = (x[:-1] + x[1:]) * 0.5 * lon[:-1]
+        my[:-1] = (y[:-1] + y[1:]) * 0.5 * lon[:-1]
+
+        self.longitud = np.add.reduceat(lon, ini)
+
+        # Centroide de línea (puntos medios ponderados por longitud) o promedio de vértices
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cx = np.add.reduceat(mx, ini) / self.longitud
+            cy = np.add.reduceat(my, ini) / self.longitud
+        sin_lon = self.longitud == 0
+        if sin_lon.any():
+            cx[sin_lon] = (np.add.reduceat(x, ini) / nv)[sin_lon]
+            cy[sin_lon] = (np.add.reduceat(y, ini) / nv)[sin_lon]
+        self.centro = np.column_stack((cx, cy))
+
+        d_ext = np.hypot(x[fin - 1] - x[ini], y[fin - 1] - y[ini])
+        self.cerrada = (nv >= 3) & (self.longitud > 0) & (d_ext < TOL_CERRADA)
+
+        # Área del anillo (fórmula del trapecio, cerrando último con primero)
+        cruz = np.zeros(len(x))
+        cruz[:-1] = x[:-1] * y[1:] - x[1:] * y[:-1]
+        cruz[fin - 1] = x[fin - 1] * y[ini] - x[ini] * y[fin - 1]
+        self.area = np.abs(np.add.reduceat(cruz, ini)) * 0.5
+
+    # --- Protocolo Mapping ---
+
+    def __len__(self):
+        return len(self.elev)
+
+    def __iter__(self):
+        return iter(range(len(self.elev)))
+
+    def __contains__(self, fid):
+        return isinstance(fid, (int, np.integer)) and 0 <= fid < len(self.elev)
+
+    def __getitem__(self, fid):
+        if fid not in self:
+            raise KeyError(fid)
+        return VistaCurva(self, int(fid))
+
+    # --- Acceso por curva ---
+
+    def vertices(self, fid):
+        """Vista (n, 2) de los vértices de la curva, sin copia"""
+        return self.coords[self.offsets[fid]:self.offsets[fid + 1]]
+
+    def hijos_de(self, fid):
+        """Curvas cerradas contenidas directamente en fid"""
+        return self.hijos[self.hijos_off[fid]:self.hijos_off[fid + 1]]
+
+    def distancias(self, x, y, fids):
+        """(d, qx, qy) del punto a cada curva de fids, sin crear QgsGeometry"""
+        perfil.contar('dist_curvas', len(fids))
+        return dist_punto_curvas(self.coords, self.offsets, fids, x, y)
+
+    def geometria(self, fid):
+        """QgsGeometry de la curva, creada bajo demanda desde WKB"""
+        g = self._geoms.get(fid)
+        if g is not None:
+            self._geoms.move_to_end(fid)
+            return g
+        v = self.vertices(fid)
+        g = QgsGeometry()
+        g.fromWkb(struct.pack('<BII', 1, 2, len(v)) + v.tobytes())
+        self._geoms[fid] = g
+        if len(self._geoms) > MAX_GEOMS:
+            self._geoms.popitem(last=False)
+        return g
+
+    def memoria(self):
+        """Bytes ocupados por los arreglos del almacén"""
+        return sum(getattr(self, nom).nbytes for nom in ARREGLOS)
+
+
+class ConstructorAlmacen:
+    """
+    Acumula curvas y genera un AlmacenCurvas. Admite partes sueltas
+    (agregar) y bloques ya decodificados (agregar_bloque); el orden de
+    llegada se conserva.
+    """
+
+    def __init__(self):
+        self.bloques = []
+        self.partes = []
+        self.elevs = []
+        self.origenes = []
+        self.n = 0
+
+    def agregar(self, elev, xy, origen=-1):
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        if len(xy) < 2:
+            return
+        self.partes.append(xy)
+        self.elevs.append(float(elev))
+        self.origenes.append(origen)
+        self.n += 1
+
+    def agregar_bloque(self, coords, offsets, elev, origen):
+        """Bloque de curvas en arreglos: coords (n, 2) y offsets (k + 1) relativos al bloque"""
+        if len(offsets) < 2:
+            return
+        self._volcar_partes()
+        self.bloques.append((coords, np.diff(offsets),
+                             np.asarray(elev, dtype=np.float64), np.asarray(origen, dtype=np.int64)))
+        self.n += len(offsets) - 1
+
+    def _volcar_partes(self):
+        if not self.partes:
+            return
+        nv = np.fromiter((len(p) for p in self.partes), dtype=np.int64, count=len(self.partes))
+        self.bloques.append((np.concatenate(self.partes), nv,
+                             np.asarray(self.elevs, dtype=np.float64),
+                             np.asarray(self.origenes, dtype=np.int64)))
+        self.partes = []
+        self.elevs = []
+        self.origenes = []
+
+    def __len__(self):
+        return self.n
+
+    def terminar(self):
+        self._volcar_partes()
+        b = self.bloques
+        nv = np.concatenate([x[1] for x in b]) if b else np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(len(nv) + 1, dtype=np.int64)
+        np.cumsum(nv, out=offsets[1:])
+        coords = np.concatenate([x[0] for x in b]) if b else np.zeros((0, 2))
+        elev = np.concatenate([x[2] for x in b]) if b else np.zeros(0)
+        origen = np.concatenate([x[3] for x in b]) if b else np.zeros(0, dtype=np.int64)
+        alm = AlmacenCurvas(coords, offsets, elev, origen)
+        self.bloques = []
+        self.n = 0
+        return alm
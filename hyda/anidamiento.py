@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Jerarquía de contención de curvas cerradas"""
+
+import numpy as np
+
+
+MAX_CELDAS = 4_000_000
+
+
+def punto_en_poligono(px, py, anillo):
+    """Par-impar (ray casting) de varios puntos contra un anillo (n, 2)"""
+    px = np.atleast_1d(np.asarray(px, dtype=np.float64))
+    py = np.atleast_1d(np.asarray(py, dtype=np.float64))
+    ax, ay = anillo[:, 0], anillo[:, 1]
+    bx, by = np.roll(ax, -1), np.roll(ay, -1)
+    dentro = np.zeros(len(px), dtype=bool)
+    paso = max(1, MAX_CELDAS // max(len(ax), 1))
+    for i in range(0, len(px), paso):
+        x = px[i:i + paso, None]
+        y = py[i:i + paso, None]
+        cruza = (ay > y) != (by > y)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            xc = ax + (y - ay) * (bx - ax) / (by - ay)
+        dentro[i:i + paso] = (np.count_nonzero(cruza & (x < xc), axis=1) % 2) == 1
+    return dentro
+
+
+def construir_anidamiento(alm, idx):
+    """
+    Calcula una vez, al cargar la topografía:
+    - padre / hijos (CSR) de cada curva cerrada: la cerrada de menor área que la contiene
+    - es_pico: curva cerrada sin centro de una curva más alta en su interior
+    idx debe responder intersects() por bbox de curva.
+    """
+    n = len(alm)
+    alm.padre = np.full(n, -1, dtype=np.int64)
+    alm.es_pico = np.zeros(n, dtype=np.int8)
+    _evaluar(alm, idx, alm.cerrada.nonzero()[0].tolist())
+    _hijos(alm)
+
+
+def actualizar_anidamiento(alm, idx, desde, zonas):
+    """
+    Completa la jerarquía tras AlmacenCurvas.extender con las curvas fid >= desde.
+    zonas son rectángulos que cubren lo agregado: solo una cerrada cuyo bbox
+    los toca puede ganar un padre nuevo o dejar de ser pico, así que se
+    reevalúan esas y las cerradas nuevas. El resultado es el de construir_anidamiento.
+    """
+    alm.es_pico[desde:] = 0
+    cs = set(np.flatnonzero(alm.cerrada[desde:]) + desde)
+    for z in zonas:
+        cand = np.asarray(idx.intersects(z), dtype=np.int64)
+        cs.update(cand[alm.cerrada[cand]].tolist())
+    cs = sorted(cs)
+    alm.padre[cs] = -1
+    _evaluar(alm, idx, cs)
+    _hijos(alm)
+
+
+def _evaluar(alm, idx, cerradas):
+    """es_pico y padre de las curvas cerradas dadas"""
+    for c in cerradas:
+        anillo = alm.vertices(c)
+        x0, y0, x1, y1 = alm.bbox[c]
+        vecinas = np.asarray(idx.intersects((x0, y0, x1, y1)), dtype=np.int64)
+
+        # Pico: ningún centro de curva más alta dentro del anillo
+        # (el centro de una curva está en su bbox, así que basta con las vecinas)
+        ce = alm.centro[vecinas]
+        cand = vecinas[(alm.elev[vecinas] > alm.elev[c]) & (ce[:, 0] >= x0) & (ce[:, 0] <= x1) &
+                       (ce[:, 1] >= y0) & (ce[:, 1] <= y1)]
+        alm.es_pico[c] = not (len(cand) and punto_en_poligono(alm.centro[cand, 0], alm.centro[cand, 1], anillo).any())
+
+        # Padre: cerrada más pequeña cuyo bbox envuelve al de c y contiene su primer vértice
+        b = alm.bbox[vecinas]
+        cand = vecinas[alm.cerrada[vecinas] & (vecinas != c) & (alm.area[vecinas] > alm.area[c]) &
+                       (b[:, 0] <= x0) & (b[:, 1] <= y0) & (b[:, 2] >= x1) & (b[:, 3] >= y1)]
+        for p in cand[np.argsort(alm.area[cand], kind='stable')].tolist():
+            if punto_en_poligono(anillo[0, 0], anillo[0, 1], alm.vertices(p))[0]:
+                alm.padre[c] = p
+                break
+
+
+def _hijos(alm):
+    """Hijos en CSR a partir de padre"""
+    n = len(alm)
+    padre = alm.padre
+    con_padre = np.flatnonzero(padre >= 0)
+    hijos_off = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(padre[con_padre], minlength=n), out=hijos_off[1:])
+    alm.hijos = con_padre[np.argsort(padre[con_padre], kind='stable')]
+    alm.hijos_off = hijos_off
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Carga de curvas por área de interés, ampliada por teselas bajo demanda"""
+
+import math
+import time
+
+from .almacen_curvas import ConstructorAlmacen
+from .anidamiento import actualizar_anidamiento
+from .carga_topo import leer_curvas
+from .indice_espacial import IndiceSegmentos
+
+
+TAM_TESELA = 2000.0
+# Semilado del área cargada alrededor de cada punto INICIO
+R_AOI = 1000.0
+
+
+class CargaAOI:
+    """
+    Mantiene un almacén parcial: solo las teselas de TAM_TESELA pedidas.
+    cubrir() lee con setFilterRect las teselas que faltan, extiende el
+    almacén en su lugar (los fid no cambian) e indexa y anida solo lo nuevo.
+    Las curvas cerradas que salen del área cargada arrastran la carga de
+    su bbox, para que es_pico y la jerarquía sean los de la capa completa.
+    """
+
+    def __init__(self, fuente, campo, tam=TAM_TESELA, campos=None, rango=None):
+        self.fuente = fuente
+        self.campo = campo
+        self.campos = campos
+        self.rango = rango
+        self.tam = tam
+        self.teselas = set()
+        self.cargados = set()
+        self.alm = None
+        self.idx = None
+        self.n_lecturas = 0
+
+    def teselas_en(self, x0, y0, x1, y1):
+        t = self.tam
+        return {(i, j)
+                for i in range(math.floor(x0 / t), math.floor(x1 / t) + 1)
+                for j in range(math.floor(y0 / t), math.floor(y1 / t) + 1)}
+
+    def _rects(self, teselas):
+        """Agrupa teselas en tramos contiguos por fila: un rectángulo por tramo"""
+        t = self.tam
+        rects = []
+        for j in sorted({j for _, j in teselas}):
+            fila = sorted(i for i, jj in teselas if jj == j)
+            ini = fila[0]
+            for a, b in zip(fila, fila[1:] + [None]):
+                if b != a + 1:
+                    rects.append((ini * t, j * t, (a + 1) * t, (j + 1) * t))
+                    ini = b
+        return rects
+
+    def iniciar(self, rect, feedback=None):
+        """Carga el área inicial; retorna (almacen, indice, info)"""
+        t0 = time.time()
+        self.alm = ConstructorAlmacen().terminar()
+        self.idx = IndiceSegmentos(self.alm)
+        self.idx.cargador = self
+        self.cubrir(*rect, feedback=feedback)
+        info = {'cache': None, 'version': None, 'aoi': True,
+                'teselas': len(self.teselas), 't': time.time() - t0}
+        return self.alm, self.idx, info
+
+    def cubrir(self, x0, y0, x1, y1, feedback=None):
+        """Carga las teselas que faltan en el rectángulo; retorna curvas agregadas"""
+        pend = self.teselas_en(x0, y0, x1, y1) - self.teselas
+        if not pend:
+            return 0
+
+        n0 = len(self.alm)
+        zonas = []
+        while pend:
+            self.teselas |= pend
+            nuevas = []
+            for rect in self._rects(pend):
+                alm = leer_curvas(self.fuente, self.campo, feedback, rect=rect, excluir=self.cargados,
+                                  campos=self.campos, rango=self.rango)
+                self.n_lecturas += 1
+                if len(alm):
+                    self.cargados.update(alm.origen.tolist())
+                    nuevas.append(alm)
+                    b = alm.bbox
+                    zonas.append((b[:, 0].min(), b[:, 1].min(), b[:, 2].max(), b[:, 3].max()))
+            if nuevas:
+                self.alm.extender(*nuevas)
+
+            # Segunda pasada: cerradas que se salen de lo cargado
+            pend = set()
+            for alm in nuevas:
+                for c in alm.cerrada.nonzero()[0].tolist():
+                    pend |= self.teselas_en(*alm.bbox[c]) - self.teselas
+
+        if len(self.alm) > n0:
+            self.idx.agregar(n0)
+            actualizar_anidamiento(self.alm, self.idx, n0, zonas)
+        return len(self.alm) - n0
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas de rendimiento: terrenos sintéticos (terreno), mediciones de las
+rutas críticas (medir) y ejecución desde consola (python -m hyda.benchmark).
+"""
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Ejecuta las mediciones y escribe el JSON de resultados:
+
+    python -m hyda.benchmark --tamanos 1000 10000 100000 --salida bench.json
+    python -m hyda.benchmark --salida nuevo.json --base bench.json
+
+Con --base se listan las medidas más lentas que la tolerancia y los casos
+cuyos resultados cambiaron; el código de salida es 1 si hay alguno.
+Los tamaños son partes de curva aproximadas; 1000000 requiere varios GB de RAM.
+"""
+
+import argparse
+import json
+import sys
+
+from .terreno import TIPOS
+from .medir import ejecutar, comparar
+
+
+def parsear(argv=None):
+    ap = argparse.ArgumentParser(prog='hyda.benchmark', description='Pruebas de rendimiento de HYDA')
+    ap.add_argument('--terrenos', nargs='+', default=list(TIPOS), choices=TIPOS)
+    ap.add_argument('--tamanos', nargs='+', type=int, default=[1000, 10000, 100000],
+                    help='partes de curva aproximadas por terreno')
+    ap.add_argument('--pares', type=int, default=20, help='pares de puntos de inicio por caso')
+    ap.add_argument('--semilla', type=int, default=0)
+    ap.add_argument('--sin-capa', action='store_true',
+                    help='no crear capa QGIS: mide índice y anidamiento en lugar de la carga')
+    ap.add_argument('--gpkg', default=None, help='carpeta donde escribir las curvas como GeoPackage')
+    ap.add_argument('--salida', default=None, help='archivo JSON de resultados (por defecto stdout)')
+    ap.add_argument('--base', default=None, help='JSON anterior con el que comparar')
+    ap.add_argument('--tolerancia', type=float, default=0.25, help='aumento relativo aceptado')
+    return ap.parse_args(argv)
+
+
+def _progreso(caso):
+    f = caso['funciones']
+    print(f"{caso['terreno']} {caso['partes']} partes / {caso['vertices']} vértices | "
+          f"divisoria {f['procesar_divisoria_individual'].get('media_ms', 0):.1f} ms | "
+          f"par {f['procesar_par'].get('media_ms', 0):.1f} ms", file=sys.stderr)
+
+
+def main(argv=None):
+    args = parsear(argv)
+    app = None
+    if not args.sin_capa:
+        from qgis.core import QgsApplication
+        if QgsApplication.instance() is None:
+            app = QgsApplication([], False)
+            app.initQgis()
+    try:
+        res = ejecutar(args.terrenos, args.tamanos, args.pares, args.semilla,
+                       not args.sin_capa, args.gpkg, _progreso)
+    finally:
+        if app is not None:
+            app.exitQgis()
+
+    txt = json.dumps(res, indent=1, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(txt)
+    else:
+        print(txt)
+
+    if args.base:
+        with open(args.base, encoding='utf-8') as f:
+            lentas, huellas = comparar(json.load(f), res, args.tolerancia)
+        for terreno, partes, semilla, nom, ms_prev, ms, razon in lentas:
+            print(f"MÁS LENTO {terreno}/{partes}/{semilla} {nom}: {ms_prev:.1f} -> {ms:.1f} ms (x{razon:.2f})",
+                  file=sys.stderr)
+        for terreno, partes, semilla in huellas:
+            print(f"RESULTADOS DISTINTOS {terreno}/{partes}/{semilla}", file=sys.stderr)
+        return 1 if lentas or huellas else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Tiempos de las rutas críticas sobre terrenos sintéticos, en JSON comparable"""
+
+from collections import Counter
+import datetime
+import math
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+from qgis.core import QgsPointXY
+
+from ..anidamiento import construir_anidamiento
+from ..carga_topo import cargar_topologia, construir_indice
+from ..hyda_processor import (procesar_divisoria_individual, recortar_lineas_en_cruce,
+                              crear_poligono_cuenca, procesar_par)
+from ..indice_espacial import comparar_indices
+from .terreno import grilla, curvas, lado_para, capa_curvas, PASO
+
+
+FORMATO = 1
+# Funciones con tiempos por llamada; las de carga se miden una vez por caso
+FUNCIONES = ('procesar_divisoria_individual', 'recortar_lineas_en_cruce',
+             'crear_poligono_cuenca', 'procesar_par')
+
+
+def resumen(tiempos):
+    """Estadísticos en ms de una lista de segundos"""
+    t = np.asarray(tiempos, dtype=np.float64) * 1000.0
+    if len(t) == 0:
+        return {'n': 0}
+    return {'n': int(len(t)), 'total_ms': float(t.sum()), 'media_ms': float(t.mean()),
+            'p50_ms': float(np.percentile(t, 50)), 'p90_ms': float(np.percentile(t, 90)),
+            'max_ms': float(t.max())}
+
+
+def pares_prueba(alm, n, semilla=0, sep=(100.0, 300.0)):
+    """
+    n pares de puntos de inicio como los de un usuario: dos puntos a sep m
+    a ambos lados de una salida, dentro de la extensión de las curvas.
+    """
+    rng = np.random.default_rng(semilla)
+    x0, y0 = alm.bbox[:, 0].min(), alm.bbox[:, 1].min()
+    x1, y1 = alm.bbox[:, 2].max(), alm.bbox[:, 3].max()
+    m = sep[1]
+    cx = rng.uniform(x0 + m, max(x0 + m, x1 - m), n)
+    cy = rng.uniform(y0 + m, max(y0 + m, y1 - m), n)
+    d = rng.uniform(*sep, n) * 0.5
+    a = rng.uniform(0.0, math.pi, n)
+    return [(QgsPointXY(x - d_ * math.cos(t), y - d_ * math.sin(t)),
+             QgsPointXY(x + d_ * math.cos(t), y + d_ * math.sin(t)))
+            for x, y, d_, t in zip(cx, cy, d, a)]
+
+
+def medir_carga(capa, campo='elev'):
+    """cargar_topologia sobre la capa: en frío y con la caché en disco ya escrita"""
+    from ..cache_topo import clave_cache
+
+    res = {}
+    with tempfile.TemporaryDirectory() as dir_c:
+        clave = clave_cache(capa, campo)
+        for nom, d in (('fria', None), ('cache_escritura', dir_c), ('cache_lectura', dir_c)):
+            t = time.perf_counter()
+            alm, idx, info = cargar_topologia(capa, campo, clave if d else None, d, None,
+                                              capa.featureCount(), capa.fields())
+            res[nom] = {'s': time.perf_counter() - t, 'cache': info.get('cache')}
+            if nom == 'fria':
+                res[nom].update(t_lectura=info.get('t_lectura'), t_indice=info.get('t_indice'),
+                                filas_s=info.get('filas_s'))
+            if clave is None:
+                break
+    return alm, idx, res
+
+
+def medir_construccion(alm):
+    """Índice y anidamiento sobre un almacén ya en memoria (sin QGIS)"""
+    t = time.perf_counter()
+    idx = construir_indice(alm)
+    t_idx = time.perf_counter() - t
+    t = time.perf_counter()
+    construir_anidamiento(alm, idx)
+    return idx, {'t_indice': t_idx, 't_anidamiento': time.perf_counter() - t}
+
+
+def medir_trazado(alm, idx, pares):
+    """Tiempo por llamada de cada función de FUNCIONES y una huella de los resultados"""
+    tiempos = {nom: [] for nom in FUNCIONES}
+    razones = Counter()
+    puntos = 0
+    areas = []
+
+    def cronometrar(nom, fn, *args):
+        t = time.perf_counter()
+        r = fn(*args)
+        tiempos[nom].append(time.perf_counter() - t)
+        return r
+
+    for p1, p2 in pares:
+        r1 = cronometrar('procesar_divisoria_individual', procesar_divisoria_individual, p1, idx, alm, 1, [], None)
+        r2 = cronometrar('procesar_divisoria_individual', procesar_divisoria_individual, p2, idx, alm, 2, [], None)
+        c1, c2, _ = cronometrar('recortar_lineas_en_cruce', recortar_lineas_en_cruce, r1['puntos'], r2['puntos'])
+        poly = cronometrar('crear_poligono_cuenca', crear_poligono_cuenca, c1, c2)
+        s1, s2, _ = cronometrar('procesar_par', procesar_par, p1, p2, idx, alm)
+        for r in (r1, r2, s1, s2):
+            razones[r['razon']] += 1
+            puntos += len(r['puntos'])
+        areas.append(poly.area() if poly is not None else 0.0)
+
+    huella = {'puntos': puntos, 'razones': dict(sorted(razones.items())),
+              'area_total_m2': float(sum(areas))}
+    return {nom: resumen(t) for nom, t in tiempos.items()}, huella
+
+
+def medir_caso(terreno, partes, n_pares=20, semilla=0, con_capa=True, ruta_gpkg=None):
+    """Genera el terreno, mide carga (o construcción) y trazado. Retorna el dict del caso."""
+    t = time.perf_counter()
+    z = grilla(terreno, lado_para(partes, terreno), semilla)
+    alm = curvas(z)
+    caso = {'terreno': terreno, 'partes_objetivo': partes, 'semilla': semilla,
+            'grilla': list(z.shape), 'paso_m': PASO, 'partes': len(alm),
+            'vertices': int(len(alm.coords)), 't_generacion_s': time.perf_counter() - t}
+    del z
+
+    if con_capa:
+        capa = capa_curvas(alm, ruta=ruta_gpkg)
+        alm, idx, caso['carga'] = medir_carga(capa)
+        caso['indices'] = comparar_indices(alm.bbox, semilla=semilla)
+    else:
+        idx, caso['construccion'] = medir_construccion(alm)
+
+    pares = pares_prueba(alm, n_pares, semilla)
+    caso['funciones'], caso['huella'] = medir_trazado(alm, idx, pares)
+    return caso
+
+
+def entorno():
+    info = {'python': platform.python_version(), 'numpy': np.__version__,
+            'plataforma': platform.platform(), 'cpus': os.cpu_count()}
+    try:
+        from qgis.core import Qgis
+        info['qgis'] = Qgis.QGIS_VERSION
+    except (ImportError, AttributeError):
+        info['qgis'] = None
+    return info
+
+
+def ejecutar(terrenos, tamanos, n_pares=20, semilla=0, con_capa=True, dir_gpkg=None, feedback=None):
+    """Todos los casos terreno x tamaño; retorna el documento de resultados"""
+    casos = []
+    for terreno in terrenos:
+        for partes in tamanos:
+            ruta = os.path.join(dir_gpkg, f'{terreno}_{partes}.gpkg') if dir_gpkg else None
+            caso = medir_caso(terreno, partes, n_pares, semilla, con_capa, ruta)
+            casos.append(caso)
+            if feedback is not None:
+                feedback(caso)
+    return {'formato': FORMATO, 'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+            'entorno': entorno(), 'casos': casos}
+
+
+def _clave_caso(caso):
+    return caso['terreno'], caso['partes_objetivo'], caso['semilla']
+
+
+def tiempos_caso(caso):
+    """{medida: ms} de un caso: media por función, carga / construcción e índices"""
+    t = {nom: r['media_ms'] for nom, r in caso.get('funciones', {}).items() if r.get('n')}
+    for nom, r in caso.get('carga', {}).items():
+        t[f'carga_{nom}'] = r['s'] * 1000.0
+    for nom, s in caso.get('construccion', {}).items():
+        t[nom] = s * 1000.0
+    for nom, r in caso.get('indices', {}).items():
+        if isinstance(r, dict):
+            t[f'indice_{nom}'] = r['construccion_s'] * 1000.0
+            t[f'indice_{nom}_consulta'] = r['consulta_ms']
+    return t
+
+
+def comparar(base, actual, tolerancia=0.25, min_ms=1.0):
+    """
+    Medidas de actual más lentas que en base por encima de la tolerancia
+    (relativa). Se ignoran tiempos base menores que min_ms (ruido).
+    Retorna [(terreno, partes, semilla, medida, ms base, ms actual, razón)],
+    y también cambios de huella (los resultados no deberían variar).
+    """
+    previos = {_clave_caso(c): c for c in base.get('casos', [])}
+    lentas, huellas = [], []
+    for caso in actual.get('casos', []):
+        clave = _clave_caso(caso)
+        prev = previos.get(clave)
+        if prev is None:
+            continue
+        t_prev, t_act = tiempos_caso(prev), tiempos_caso(caso)
+        for nom, ms in t_act.items():
+            ms_prev = t_prev.get(nom)
+            if ms_prev is None or ms_prev < min_ms:
+                continue
+            if ms > ms_prev * (1.0 + tolerancia):
+                lentas.append(clave + (nom, ms_prev, ms, ms / ms_prev))
+        if prev.get('huella') != caso.get('huella'):
+            huellas.append(clave)
+    return lentas, huellas
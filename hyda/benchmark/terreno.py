@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""Terrenos analíticos y sus curvas de nivel (marching squares en NumPy)"""
+
+import math
+import struct
+
+import numpy as np
+
+from ..almacen_curvas import ConstructorAlmacen
+from ..geometria_np import rangos
+from ..wkb_np import WKB_LINESTRING
+
+
+TIPOS = ('cerros', 'crestas', 'sillas', 'mesetas')
+PASO = 10.0             # m por celda de la grilla
+CELDAS_CERRO = 16       # separación entre centros de cerros, en celdas
+EQUIDISTANCIA = 1.0     # el trazado sube de a un metro (buscar_curva: elev + 1)
+PENDIENTE = 0.002       # pendiente regional (m/m) para que haya un sentido de drenaje
+# Partes de curva por cerro con EQUIDISTANCIA (medido); ver lado_para
+PARTES_POR_CERRO = {'cerros': 6.9, 'crestas': 9.5, 'sillas': 40.0, 'mesetas': 19.8}
+FILAS_BLOQUE = 512
+
+# Bordes de la celda: 0 abajo, 1 derecha, 2 arriba, 3 izquierda
+_POS_BORDE = ((0.5, 0.0), (1.0, 0.5), (0.5, 1.0), (0.0, 0.5))
+# Esquinas: bit del caso y posición (abajo-izq, abajo-der, arriba-der, arriba-izq)
+_ESQUINAS = ((1, (0.0, 0.0)), (2, (1.0, 0.0)), (4, (1.0, 1.0)), (8, (0.0, 1.0)))
+# Esquina que un segmento entre dos bordes separa del resto de la celda
+_ESQUINA_DE = {frozenset((0, 3)): 0, frozenset((0, 1)): 1, frozenset((1, 2)): 2,
+               frozenset((2, 3)): 3, frozenset((0, 2)): 0, frozenset((1, 3)): 0}
+
+
+def _orientar(caso, a, b):
+    """(a, b) o (b, a) de modo que lo que está sobre el nivel quede a la izquierda"""
+    bit, (cx, cy) = _ESQUINAS[_ESQUINA_DE[frozenset((a, b))]]
+    (ax, ay), (bx, by) = _POS_BORDE[a], _POS_BORDE[b]
+    izq = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax) > 0
+    return (a, b) if bool(caso & bit) == izq else (b, a)
+
+
+def _tablas():
+    """
+    Segmentos por caso (bits de las esquinas sobre el nivel). Las sillas
+    (5 y 10) tienen dos segmentos y dependen del valor del centro.
+    """
+    uno = np.full((16, 2), -1, dtype=np.int64)
+    for caso in range(1, 15):
+        if caso in (5, 10):
+            continue
+        sobre = [bool(caso & bit) for bit, _ in _ESQUINAS]
+        # Un borde se cruza si sus dos esquinas difieren
+        bordes = [k for k in range(4) if sobre[k] != sobre[(k + 1) % 4]]
+        uno[caso] = _orientar(caso, *bordes)
+    silla = np.zeros((2, 2, 2, 2), dtype=np.int64)       # [caso 5/10][centro sobre][segmento]
+    for s, caso in enumerate((5, 10)):
+        for centro in (0, 1):
+            # Se aíslan las esquinas del lado contrario al centro
+            aisladas = [k for k, (bit, _) in enumerate(_ESQUINAS) if bool(caso & bit) != bool(centro)]
+            for n, k in enumerate(aisladas):
+                silla[s, centro, n] = _orientar(caso, (k + 3) % 4, k)
+    return uno, silla
+
+
+_UNO, _SILLA = _tablas()
+
+
+def _nucleo(r2):
+    """Núcleo suave de soporte compacto (1 - r²)³"""
+    return (1.0 - np.minimum(r2, 1.0)) ** 3
+
+
+def grilla(tipo='cerros', lado=8, semilla=0):
+    """
+    Alturas (ny, nx) de un terreno de lado x lado cerros con forma según tipo:
+    cerros (redondos), crestas (alargados, se unen en divisorias), sillas
+    (cartón de huevos con puertos entre cumbres) y mesetas (cimas planas).
+    Se calcula por franjas de una fila de cerros: cada cerro solo alcanza a
+    sus vecinos, así la memoria no depende del número de cerros.
+    """
+    if tipo not in TIPOS:
+        raise ValueError(f'Tipo de terreno desconocido: {tipo}')
+    rng = np.random.default_rng(semilla)
+    S = CELDAS_CERRO
+    n = lado * S + 1
+    forma = (lado, lado)
+    cx = (np.arange(lado)[None, :] + 0.5 + rng.uniform(-0.25, 0.25, forma)) * S
+    cy = (np.arange(lado)[:, None] + 0.5 + rng.uniform(-0.25, 0.25, forma)) * S
+    h = rng.uniform(10.0, 40.0, forma)
+    r = rng.uniform(0.8, 1.4, forma) * S
+    alargado = rng.uniform(2.5, 3.5, forma) if tipo == 'crestas' else np.ones(forma)
+    ang = rng.uniform(0.0, math.pi, forma)
+    cos_a, sin_a = np.cos(ang), np.sin(ang)
+    if tipo == 'sillas':
+        h *= 0.4
+    w = int(math.ceil((r * alargado).max() / S))
+
+    z = np.empty((n, n))
+    x = np.arange(n, dtype=np.float64)
+    for fila in range(lado):
+        i0 = fila * S
+        i1 = n if fila == lado - 1 else i0 + S
+        yy, xx = np.meshgrid(np.arange(i0, i1, dtype=np.float64), x, indexing='ij')
+        col = np.minimum(xx.astype(np.int64) // S, lado - 1)
+        franja = np.zeros_like(xx)
+        for di in range(-w, w + 1):
+            I = fila + di
+            if I < 0 or I >= lado:
+                continue
+            for dj in range(-w, w + 1):
+                J = col + dj
+                ok = (J >= 0) & (J < lado)
+                J = np.clip(J, 0, lado - 1)
+                dx, dy = xx - cx[I, J], yy - cy[I, J]
+                u = (dx * cos_a[I, J] + dy * sin_a[I, J]) / (r[I, J] * alargado[I, J])
+                v = (-dx * sin_a[I, J] + dy * cos_a[I, J]) / r[I, J]
+                k = _nucleo(u * u + v * v)
+                if tipo == 'mesetas':
+                    s = np.minimum(k / 0.5, 1.0)
+                    k = s * s * (3.0 - 2.0 * s)
+                franja += np.where(ok, h[I, J] * k, 0.0)
+        if tipo == 'sillas':
+            franja += 12.0 * np.cos(2 * math.pi * xx / S) * np.cos(2 * math.pi * yy / S)
+        z[i0:i1] = franja + PENDIENTE * PASO * (xx + yy)
+    return z
+
+
+def _puntos_borde(z, nivel, e, paso):
+    """Coordenadas del cruce del nivel en los bordes de grilla e (ids globales)"""
+    ny, nx = z.shape
+    nh = ny * (nx - 1)
+    hor = e < nh
+    i = np.where(hor, e // (nx - 1), (e - nh) // nx)
+    j = np.where(hor, e % (nx - 1), (e - nh) % nx)
+    za = z[i, j]
+    zb = np.where(hor, z[i, np.minimum(j + 1, nx - 1)], z[np.minimum(i + 1, ny - 1), j])
+    t = (nivel - za) / (zb - za)
+    return np.column_stack(((j + np.where(hor, t, 0.0)) * paso, (i + np.where(hor, 0.0, t)) * paso))
+
+
+def _encadenar(sa, sb):
+    """
+    Ordena segmentos orientados en cadenas (cada borde es inicio de a lo sumo
+    un segmento y fin de a lo sumo otro). Sin bucles de Python: los anillos
+    se cortan en su segmento de menor id y las cadenas se ordenan por saltos
+    de puntero. Retorna (orden de segmentos, inicio de cada cadena en orden).
+    """
+    n = len(sa)
+    ids = np.arange(n)
+    por_ini = np.argsort(sa, kind='stable')
+    pos = np.minimum(np.searchsorted(sa[por_ini], sb), n - 1)
+    sig = np.where(sa[por_ini[pos]] == sb, por_ini[pos], -1)
+    rondas = max(1, int(math.ceil(math.log2(n))) + 1)
+
+    # Anillos: el puntero nunca llega a -1; se cortan antes de su menor id
+    p, m = sig.copy(), ids.copy()
+    for _ in range(rondas):
+        v = p >= 0
+        m[v] = np.minimum(m[v], m[p[v]])
+        p[v] = p[p[v]]
+    sig[(p >= 0) & (sig == m)] = -1
+
+    # Distancia al final de la cadena y segmento final (identifica la cadena)
+    dist = (sig >= 0).astype(np.int64)
+    p = sig.copy()
+    fin = np.where(sig >= 0, sig, ids)
+    for _ in range(rondas):
+        v = p >= 0
+        dist[v] += dist[p[v]]
+        p[v] = p[p[v]]
+        fin = fin[fin]
+    orden = np.lexsort((-dist, fin))
+    cadena = fin[orden]
+    ini = np.flatnonzero(np.r_[True, cadena[1:] != cadena[:-1]])
+    return orden, ini
+
+
+def curvas_nivel(z, nivel, paso=PASO, celdas=None):
+    """
+    Curvas de un nivel: (coords (n, 2), offsets). Los anillos cerrados
+    repiten el primer vértice al final. celdas (ids i*(nx-1)+j) limita el
+    cálculo a las celdas que el nivel cruza, si ya se conocen.
+    """
+    ny, nx = z.shape
+    nh = ny * (nx - 1)
+    if celdas is None:
+        celdas = np.arange((ny - 1) * (nx - 1))
+    i, j = celdas // (nx - 1), celdas % (nx - 1)
+    esq = np.column_stack((z[i, j], z[i, j + 1], z[i + 1, j + 1], z[i + 1, j]))
+    cs = ((esq > nivel) * np.array([1, 2, 4, 8])).sum(axis=1)
+    cruza = (cs > 0) & (cs < 15)
+    celdas, i, j, esq, cs = celdas[cruza], i[cruza], j[cruza], esq[cruza], cs[cruza]
+    if len(celdas) == 0:
+        return np.zeros((0, 2)), np.zeros(1, dtype=np.int64)
+    # Bordes de cada celda en ids globales: horizontales i*(nx-1)+j, verticales nh + i*nx + j
+    bordes = np.column_stack((i * (nx - 1) + j, nh + i * nx + j + 1, (i + 1) * (nx - 1) + j, nh + i * nx + j))
+
+    loc = _UNO[cs]
+    es_silla = (cs == 5) | (cs == 10)
+    if es_silla.any():
+        k = np.flatnonzero(es_silla)
+        centro = (esq[k].mean(axis=1) > nivel).astype(np.int64)
+        s = (cs[k] == 10).astype(np.int64)
+        loc[k] = _SILLA[s, centro, 0]
+        loc = np.concatenate((loc, _SILLA[s, centro, 1]))
+        bordes = np.concatenate((bordes, bordes[k]))
+    fila = np.arange(len(loc))
+    sa, sb = bordes[fila, loc[:, 0]], bordes[fila, loc[:, 1]]
+
+    orden, ini = _encadenar(sa, sb)
+    n_cad = len(ini)
+    # Cada cadena: inicio de sus segmentos y el fin del último
+    largo = np.diff(np.r_[ini, len(orden)]) + 1
+    offsets = np.zeros(n_cad + 1, dtype=np.int64)
+    np.cumsum(largo, out=offsets[1:])
+    cad_de = np.repeat(np.arange(n_cad), largo - 1)
+    e = np.empty(offsets[-1], dtype=np.int64)
+    e[np.arange(len(orden)) + cad_de] = sa[orden]
+    e[offsets[1:] - 1] = sb[orden[np.r_[ini[1:], len(orden)] - 1]]
+    return _puntos_borde(z, nivel, e, paso), offsets
+
+
+def curvas(z, equidistancia=EQUIDISTANCIA, paso=PASO):
+    """AlmacenCurvas con todas las curvas de la grilla; origen = id de parte"""
+    cons = ConstructorAlmacen()
+    # Pares (celda, nivel) que se cruzan, agrupados por nivel: cada nivel
+    # solo recorre sus celdas y no la grilla completa. La celda cruza el
+    # nivel k * equidistancia si min <= nivel < max de sus esquinas.
+    ny, nx = z.shape
+    celdas, ks = [], []
+    for i0 in range(0, ny - 1, FILAS_BLOQUE):
+        i1 = min(i0 + FILAS_BLOQUE, ny - 1)
+        a, b, c, d = z[i0:i1, :-1], z[i0:i1, 1:], z[i0 + 1:i1 + 1, 1:], z[i0 + 1:i1 + 1, :-1]
+        k0 = np.ceil(np.minimum(np.minimum(a, b), np.minimum(c, d)) / equidistancia).astype(np.int64).ravel()
+        k1 = np.ceil(np.maximum(np.maximum(a, b), np.maximum(c, d)) / equidistancia).astype(np.int64).ravel()
+        celdas.append(np.repeat(np.arange(len(k0)) + i0 * (nx - 1), k1 - k0))
+        ks.append(rangos(k0, k1))
+    celda, k = np.concatenate(celdas), np.concatenate(ks)
+    orden = np.argsort(k, kind='stable')
+    celda, k = celda[orden], k[orden]
+    lim = np.flatnonzero(np.r_[True, k[1:] != k[:-1], True])
+    total = 0
+    for a, b in zip(lim[:-1], lim[1:]):
+        nivel = float(k[a] * equidistancia)
+        coords, offsets = curvas_nivel(z, nivel, paso, celda[a:b])
+        n = len(offsets) - 1
+        if n == 0:
+            continue
+        cons.agregar_bloque(coords, offsets, np.full(n, nivel), np.arange(total, total + n))
+        total += n
+    return cons.terminar()
+
+
+def lado_para(partes, tipo='cerros'):
+    """Cerros por lado para obtener aproximadamente ese número de partes de curva"""
+    return max(1, int(round(math.sqrt(partes / PARTES_POR_CERRO[tipo]))))
+
+
+def generar(tipo='cerros', partes=1000, semilla=0):
+    """Almacén de curvas de un terreno tipo con del orden de partes curvas"""
+    return curvas(grilla(tipo, lado_para(partes, tipo), semilla))
+
+
+def wkb_linea(xy):
+    """WKB (little endian) de una LineString a partir de vértices (n, 2)"""
+    xy = np.ascontiguousarray(xy, dtype='<f8')
+    return struct.pack('<BII', 1, WKB_LINESTRING, len(xy)) + xy.tobytes()
+
+
+def capa_curvas(alm, crs='EPSG:32719', ruta=None, campo='elev'):
+    """
+    Capa de líneas con las curvas de alm: en memoria, o GeoPackage si se da
+    ruta (la lectura de disco es la de un uso real). Requiere QGIS.
+    """
+    from qgis.core import (QgsFeature, QgsField, QgsFields, QgsGeometry, QgsVectorLayer,
+                           QgsVectorFileWriter, QgsCoordinateReferenceSystem,
+                           QgsCoordinateTransformContext, QgsWkbTypes)
+    from qgis.PyQt.QtCore import QVariant
+
+    campos = QgsFields()
+    campos.append(QgsField(campo, QVariant.Double))
+    feats = []
+    for fid in range(len(alm)):
+        f = QgsFeature(campos)
+        g = QgsGeometry()
+        g.fromWkb(wkb_linea(alm.vertices(fid)))
+        f.setGeometry(g)
+        f.setAttributes([float(alm.elev[fid])])
+        feats.append(f)
+
+    if ruta is None:
+        capa = QgsVectorLayer(f'LineString?crs={crs}&field={campo}:double', 'curvas', 'memory')
+        capa.dataProvider().addFeatures(feats)
+        capa.updateExtents()
+        return capa
+
+    opc = QgsVectorFileWriter.SaveVectorOptions()
+    opc.driverName = 'GPKG'
+    opc.layerName = 'curvas'
+    w = QgsVectorFileWriter.create(ruta, campos, QgsWkbTypes.LineString, QgsCoordinateReferenceSystem(crs),
+                                   QgsCoordinateTransformContext(), opc)
+    if w.hasError() != QgsVectorFileWriter.NoError:
+        raise RuntimeError(w.errorMessage())
+    w.addFeatures(feats)
+    del w
+    return QgsVectorLayer(f'{ruta}|layername=curvas', 'curvas', 'ogr')
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Caché en disco de la topografía cargada"""
+
+from qgis.core import QgsProject, QgsProviderRegistry
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .almacen_curvas import AlmacenCurvas, ARREGLOS
+
+
+VERSION_CACHE = 5
+DIR_CACHE = '.hyda_cache'
+
+
+def ruta_fuente(capa):
+    """Ruta del archivo de la capa, o None si no es una fuente de archivo"""
+    try:
+        partes = QgsProviderRegistry.instance().decodeUri(capa.providerType(), capa.source())
+    except Exception:
+        return None
+    ruta = partes.get('path')
+    if ruta and os.path.isfile(ruta):
+        return ruta
+    return None
+
+
+def mtime_fuente(ruta):
+    """Última modificación del archivo y de sus compañeros (-wal, .dbf)"""
+    base = os.path.splitext(ruta)[0]
+    cands = [ruta, ruta + '-wal', base + '.dbf', base + '.shx']
+    return max(os.path.getmtime(c) for c in cands if os.path.exists(c))
+
+
+def clave_cache(capa, campo, rango=None):
+    """Clave de invalidación; None si la fuente no admite caché"""
+    ruta = ruta_fuente(capa)
+    if ruta is None:
+        return None
+    return {
+        'version': VERSION_CACHE,
+        'fuente': capa.source(),
+        'campo': campo,
+        'rango': list(map(float, rango)) if rango else None,
+        'mtime': mtime_fuente(ruta),
+        'tam': os.path.getsize(ruta),
+    }
+
+
+def dir_cache_defecto(capa):
+    """Carpeta del proyecto o, si no está guardado, la de la capa de curvas"""
+    home = QgsProject.instance().homePath()
+    if home:
+        return home
+    ruta = ruta_fuente(capa)
+    return os.path.dirname(ruta) if ruta else None
+
+
+def archivo_cache(clave, dir_base):
+    h = hashlib.sha1(f"{clave['fuente']}|{clave['campo']}|{clave['rango']}".encode('utf-8')).hexdigest()[:16]
+    return os.path.join(dir_base, DIR_CACHE, f"{h}.npz")
+
+
+def digest(clave):
+    """Identificador corto de la clave (versión de topografía)"""
+    return hashlib.sha1(json.dumps(clave, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def leer_cache(ruta, clave):
+    """Retorna (almacen, extras) o None si no existe o está desactualizada"""
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with np.load(ruta, allow_pickle=False) as datos:
+            if json.loads(str(datos['clave'])) != clave:
+                return None
+            arreglos = {nom: datos[nom] for nom in datos.files if nom != 'clave'}
+    except Exception:
+        return None
+    alm = AlmacenCurvas.desde_arreglos(arreglos)
+    extras = {nom: a for nom, a in arreglos.items() if nom not in ARREGLOS}
+    return alm, extras
+
+
+def guardar_cache(ruta, clave, alm, extras=None):
+    """Escribe la caché de forma atómica (archivo temporal + rename)"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    datos = alm.arreglos()
+    datos.update(extras or {})
+    tmp = ruta + '.tmp.npz'
+    np.savez(tmp, clave=np.array(json.dumps(clave, sort_keys=True)), **datos)
+    os.replace(tmp, ruta)
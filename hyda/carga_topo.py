@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Carga de curvas de nivel: lectura, índice espacial y caché"""
+
+from qgis.core import (QgsWkbTypes, QgsFeatureRequest, QgsRectangle,
+                       QgsExpression, QgsGeometry)
+import time
+
+import numpy as np
+
+from . import registro
+from .almacen_curvas import ConstructorAlmacen
+from .cache_topo import archivo_cache, leer_cache, guardar_cache, digest
+from .anidamiento import construir_anidamiento
+from .indice_espacial import IndiceSegmentos
+from .wkb_np import decodificar_lineas
+
+
+LOTE = 5000
+
+
+class CargaCancelada(Exception):
+    pass
+
+
+def avance(feedback, pct):
+    """Reporta progreso y corta la carga si el usuario canceló"""
+    if feedback is None:
+        return
+    if feedback.isCanceled():
+        raise CargaCancelada()
+    if pct is not None:
+        feedback.setProgress(pct)
+
+
+def peticion_curvas(campo, campos=None, rect=None, rango=None):
+    """
+    QgsFeatureRequest que deja el trabajo al proveedor: solo el campo de
+    elevación (si se conocen los campos), rango de elevación como expresión
+    y rectángulo de filtro.
+    """
+    peticion = QgsFeatureRequest()
+    if campos is not None:
+        peticion.setSubsetOfAttributes([campo], campos)
+    if rango is not None:
+        col = QgsExpression.quotedColumnRef(campo)
+        peticion.setFilterExpression(f"{col} >= {float(rango[0])!r} AND {col} <= {float(rango[1])!r}")
+    if rect is not None:
+        peticion.setFilterRect(QgsRectangle(*rect))
+    return peticion
+
+
+def _agregar_geom(cons, elev, geom, fid):
+    """Camino lento por la API de geometría (WKB que decodificar_lineas no admite)"""
+    if geom.isMultipart():
+        if geom.wkbType() == QgsWkbTypes.MultiLineString:
+            for parte in geom.asMultiPolyline():
+                cons.agregar(elev, [(p.x(), p.y()) for p in parte], fid)
+    else:
+        cons.agregar(elev, [(p.x(), p.y()) for p in geom.asPolyline()], fid)
+
+
+def _volcar_lote(cons, fids, elevs, wkbs):
+    """Decodifica en bloque un lote de WKB y lo agrega al constructor"""
+    coords, offsets, geom, malas = decodificar_lineas(wkbs)
+    cons.agregar_bloque(coords, offsets, np.asarray(elevs, dtype=np.float64)[geom],
+                        np.asarray(fids, dtype=np.int64)[geom])
+    for g in malas:
+        try:
+            qg = QgsGeometry()
+            qg.fromWkb(wkbs[g])
+            _agregar_geom(cons, elevs[g], qg, fids[g])
+        except Exception as e:
+            registro.aviso("Error: %s", e)
+
+
+def leer_curvas(fuente, campo, feedback=None, total=0, rect=None, excluir=None,
+                campos=None, rango=None, stats=None):
+    """
+    Lee las curvas de una capa o de un QgsVectorLayerFeatureSource (0-70 %).
+    rect (x0, y0, x1, y1) y rango (e_min, e_max) se filtran en el proveedor;
+    campos (QgsFields) permite pedir solo el atributo de elevación.
+    excluir es un conjunto de ids de entidad ya cargados.
+    La geometría se lee como WKB y se decodifica en bloque (wkb_np) por lotes
+    de LOTE entidades, sin objetos Python por vértice.
+    stats (dict) recibe filas leídas, segundos y filas por segundo.
+    """
+    t0 = time.time()
+    cons = ConstructorAlmacen()
+    peticion = peticion_curvas(campo, campos, rect, rango)
+    fids, elevs, wkbs = [], [], []
+    filas = 0
+
+    # Geometrías rotas: un aviso por entidad, escritos por lotes
+    with registro.agrupado():
+        for i, feat in enumerate(fuente.getFeatures(peticion)):
+            filas += 1
+            if i % 1000 == 0:
+                avance(feedback, 70.0 * i / total if total else None)
+            if excluir and feat.id() in excluir:
+                continue
+            try:
+                elev = feat[campo]
+                if elev is None:
+                    continue
+                wkb = bytes(feat.geometry().asWkb())
+                if not wkb:
+                    continue
+                elev = float(elev)
+            except Exception as e:
+                registro.aviso("Error: %s", e)
+                continue
+            fids.append(feat.id())
+            elevs.append(elev)
+            wkbs.append(wkb)
+            if len(wkbs) >= LOTE:
+                _volcar_lote(cons, fids, elevs, wkbs)
+                fids, elevs, wkbs = [], [], []
+
+        if wkbs:
+            _volcar_lote(cons, fids, elevs, wkbs)
+
+    if stats is not None:
+        t = time.time() - t0
+        stats.update(filas=filas, t_lectura=t, filas_s=filas / t if t > 0 else 0.0)
+    return cons.terminar()
+
+
+def construir_indice(alm):
+    """R-tree STR sobre bbox de curvas y sobre trozos de segmentos, en una sola pasada"""
+    return IndiceSegmentos(alm)
+
+
+def cargar_topologia(fuente, campo, clave=None, dir_cache=None, feedback=None, total=0,
+                     campos=None, rango=None):
+    """
+    Carga curvas, índice y atributos derivados (cerrada, centro, anidamiento y pico).
+    fuente es la capa o un QgsVectorLayerFeatureSource (carga en segundo plano);
+    campos y rango se pasan a la petición al proveedor (ver leer_curvas).
+    Con clave (cache_topo.clave_cache, calculada en el hilo principal) y dir_cache
+    usa/actualiza la caché en disco.
+    feedback (QgsTask o QgsFeedback) recibe el progreso; si se cancela
+    se lanza CargaCancelada.
+    Retorna (almacen, indice, info).
+    """
+    t0 = time.time()
+    ruta = archivo_cache(clave, dir_cache) if clave and dir_cache else None
+    info = {'cache': None, 'version': digest(clave) if clave else None}
+
+    if ruta:
+        leido = leer_cache(ruta, clave)
+        if leido is not None:
+            alm, extras = leido
+            idx = IndiceSegmentos.desde_arreglos(alm, extras)
+            info.update(cache='hit', ruta=ruta, t=time.time() - t0)
+            avance(feedback, 100)
+            return alm, idx, info
+
+    alm = leer_curvas(fuente, campo, feedback, total, campos=campos, rango=rango, stats=info)
+    avance(feedback, 70)
+    t1 = time.time()
+    idx = construir_indice(alm)
+    info['t_indice'] = time.time() - t1
+    avance(feedback, 85)
+    construir_anidamiento(alm, idx)
+    avance(feedback, 98)
+
+    if ruta:
+        try:
+            guardar_cache(ruta, clave, alm, idx.arreglos())
+            info.update(cache='miss', ruta=ruta)
+        except Exception as e:
+            registro.aviso("No se pudo escribir caché: %s", e)
+
+    info['t'] = time.time() - t0
+    avance(feedback, 100)
+    return alm, idx, info
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Delimitación en lote desde la línea de comandos, sin interfaz ni iface:
+
+    python -m hyda.cli curvas.gpkg elev pares.csv salida.gpkg --procesos 4
+
+Pares: CSV con columnas x1, y1, x2, y2 (y opcionalmente par) en el SRC de las
+curvas, o un GeoJSON / archivo OGR de líneas (primer y último vértice) o de
+puntos agrupados por --campo-par. La salida es un GeoPackage con las capas
+'cuencas' y 'divisorias'. Con qgis_process el mismo trabajo es el algoritmo
+hyda:delimitacion_lote.
+"""
+
+from qgis.core import (QgsApplication, QgsCoordinateTransform, QgsCoordinateTransformContext,
+                       QgsProject, QgsVectorFileWriter, QgsVectorLayer, QgsWkbTypes)
+import argparse
+import os
+import sys
+import time
+
+from . import perfil, registro
+from .lote import delimitar_lote
+from .servicio import (ServicioHYDA, pares_de_csv, pares_de_fuente, entidades_lote,
+                       campos_cuenca, campos_divisoria)
+
+
+class Progreso(object):
+    """Feedback mínimo para consola (setProgress / isCanceled / pushInfo)"""
+
+    def __init__(self, etapa, salida=sys.stderr):
+        self.etapa = etapa
+        self.salida = salida
+        self.ultimo = -10
+
+    def setProgress(self, p):
+        if p >= self.ultimo + 10 or p >= 100 > self.ultimo:
+            self.ultimo = p
+            print(f"{self.etapa}: {p:.0f}%", file=self.salida)
+
+    def isCanceled(self):
+        return False
+
+    def pushInfo(self, txt):
+        print(txt, file=self.salida)
+
+
+def parsear(argv=None):
+    ap = argparse.ArgumentParser(prog='hyda', description='Delimitación de cuencas en lote con HYDA')
+    ap.add_argument('curvas', help='archivo de curvas de nivel (líneas)')
+    ap.add_argument('campo', help='campo de elevación')
+    ap.add_argument('pares', help='CSV o archivo vectorial con los pares de puntos de inicio')
+    ap.add_argument('salida', help='GeoPackage de salida')
+    ap.add_argument('--campo-par', default=None, help='campo que agrupa los puntos de cada par')
+    ap.add_argument('--procesos', type=int, default=0, help='procesos de trabajo (0: núcleos - 1)')
+    ap.add_argument('--rango', type=float, nargs=2, default=None, metavar=('E_MIN', 'E_MAX'),
+                    help='carga solo las curvas con elevación entre E_MIN y E_MAX')
+    ap.add_argument('--dir-cache', default=None, help='carpeta de la caché de topografía')
+    ap.add_argument('--perfil', default=None, metavar='RUTA',
+                    help='instrumentación: un registro JSON por traza en RUTA')
+    ap.add_argument('--detallado', action='store_true', help='diagnóstico por traza en el registro')
+    ap.add_argument('--registro', default=None, metavar='RUTA', help='archivo de registro de mensajes')
+    return ap.parse_args(argv)
+
+
+def leer_pares(ruta, campo_par, crs_curvas):
+    if ruta.lower().endswith('.csv'):
+        return pares_de_csv(ruta)
+    capa_p = QgsVectorLayer(ruta, 'pares', 'ogr')
+    if not capa_p.isValid():
+        raise ValueError(f'No se pudo abrir {ruta}')
+    tr = QgsCoordinateTransform(capa_p.crs(), crs_curvas, QgsProject.instance())
+    return pares_de_fuente(capa_p, campo_par, tr)
+
+
+def escribir_gpkg(ruta, crs, feats_p, feats_l):
+    """Cuencas y divisorias como dos capas de un GeoPackage, una escritura por capa"""
+    capas = (('cuencas', campos_cuenca(), QgsWkbTypes.MultiPolygon, feats_p),
+             ('divisorias', campos_divisoria(), QgsWkbTypes.LineString, feats_l))
+    for n, (nombre, campos, tipo, feats) in enumerate(capas):
+        opc = QgsVectorFileWriter.SaveVectorOptions()
+        opc.driverName = 'GPKG'
+        opc.layerName = nombre
+        opc.actionOnExistingFile = (QgsVectorFileWriter.CreateOrOverwriteFile if n == 0
+                                    else QgsVectorFileWriter.CreateOrOverwriteLayer)
+        w = QgsVectorFileWriter.create(ruta, campos, tipo, crs, QgsCoordinateTransformContext(), opc)
+        if w.hasError() != QgsVectorFileWriter.NoError:
+            raise RuntimeError(f'{nombre}: {w.errorMessage()}')
+        w.addFeatures(feats)
+        del w
+
+
+def main(argv=None):
+    args = parsear(argv)
+    if args.perfil:
+        perfil.activar(args.perfil)
+    registro.configurar(registro.DEPURACION if args.detallado else None, args.registro)
+    app = None
+    if QgsApplication.instance() is None:
+        app = QgsApplication([], False)
+        app.initQgis()
+
+    try:
+        capa = QgsVectorLayer(args.curvas, 'curvas', 'ogr')
+        if not capa.isValid() or capa.fields().indexOf(args.campo) == -1:
+            print(f"Curvas no válidas o sin el campo {args.campo}: {args.curvas}", file=sys.stderr)
+            return 2
+        try:
+            pares, ids, omitidos = leer_pares(args.pares, args.campo_par, capa.crs())
+        except (ValueError, KeyError, OSError) as e:
+            print(f"Pares: {e}", file=sys.stderr)
+            return 2
+        for par, n in omitidos.items():
+            print(f"Par {par}: {n} puntos, se omite", file=sys.stderr)
+
+        serv = ServicioHYDA.desde_capa(capa, args.campo, args.dir_cache, Progreso('topografía'), args.rango)
+        print(f"Curvas: {len(serv.curvas)} | {serv.info['t']:.1f}s | caché: {serv.info['cache']}", file=sys.stderr)
+
+        procesos = args.procesos or max(1, (os.cpu_count() or 2) - 1)
+        t0 = time.time()
+        resultados = delimitar_lote(pares, serv.curvas, serv.idx, procesos, Progreso('delimitación'))
+        feats_p, feats_l, errores = entidades_lote(resultados, ids)
+        for par, error in errores:
+            print(f"Par {par}: {error}", file=sys.stderr)
+
+        escribir_gpkg(args.salida, capa.crs(), feats_p, feats_l)
+        print(f"{len(feats_p)} cuencas de {len(pares)} pares en {time.time() - t0:.1f}s "
+              f"({procesos} procesos) -> {args.salida}")
+        return 1 if errores else 0
+    finally:
+        if app is not None:
+            app.exitQgis()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
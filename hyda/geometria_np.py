@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Operaciones geométricas vectorizadas sobre arreglos de segmentos"""
+
+import numpy as np
+
+
+def rangos(ini, fin):
+    """Concatena arange(ini[k], fin[k]) para todos los k"""
+    ini = np.asarray(ini, dtype=np.int64)
+    lens = np.asarray(fin, dtype=np.int64) - ini
+    tot = int(lens.sum())
+    if tot == 0:
+        return np.zeros(0, dtype=np.int64)
+    off = np.cumsum(lens) - lens
+    return np.repeat(ini - off, lens) + np.arange(tot)
+
+
+def dist_punto_segmentos(px, py, ax, ay, bx, by):
+    """Distancia de un punto a cada segmento AB y punto más cercano en él"""
+    dx = bx - ax
+    dy = by - ay
+    l2 = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = ((px - ax) * dx + (py - ay) * dy) / l2
+    t = np.where(l2 > 0, np.clip(t, 0.0, 1.0), 0.0)
+    qx = ax + t * dx
+    qy = ay + t * dy
+    return np.hypot(px - qx, py - qy), qx, qy
+
+
+def _orient(ax, ay, bx, by, cx, cy):
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+def _sobre(ax, ay, bx, by, cx, cy):
+    """C colineal con AB está dentro de la caja de AB"""
+    return ((np.minimum(ax, bx) <= cx) & (cx <= np.maximum(ax, bx)) &
+            (np.minimum(ay, by) <= cy) & (cy <= np.maximum(ay, by)))
+
+
+def segmentos_intersectan(ax, ay, bx, by, cx, cy, dx, dy):
+    """AB intersecta CD (incluye contacto en extremos y solapes colineales)"""
+    o1 = _orient(ax, ay, bx, by, cx, cy)
+    o2 = _orient(ax, ay, bx, by, dx, dy)
+    o3 = _orient(cx, cy, dx, dy, ax, ay)
+    o4 = _orient(cx, cy, dx, dy, bx, by)
+    propia = (((o1 > 0) & (o2 < 0)) | ((o1 < 0) & (o2 > 0))) & \
+             (((o3 > 0) & (o4 < 0)) | ((o3 < 0) & (o4 > 0)))
+    return (propia |
+            ((o1 == 0) & _sobre(ax, ay, bx, by, cx, cy)) |
+            ((o2 == 0) & _sobre(ax, ay, bx, by, dx, dy)) |
+            ((o3 == 0) & _sobre(cx, cy, dx, dy, ax, ay)) |
+            ((o4 == 0) & _sobre(cx, cy, dx, dy, bx, by)))
+
+
+def min_por_grupo(grupo, valores):
+    """Agrupa valores por id y retorna (ids únicos, mínimo, posición del mínimo)"""
+    orden = np.lexsort((valores, grupo))
+    g = grupo[orden]
+    ini = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+    return g[ini], valores[orden[ini]], orden[ini]
+
+
+def dist_punto_curvas(coords, offsets, fids, px, py):
+    """
+    Distancia de un punto a cada curva de fids y su punto más cercano,
+    en una sola pasada por los segmentos de esas curvas.
+    Retorna (d, qx, qy) en el orden de fids.
+    """
+    fids = np.asarray(fids, dtype=np.int64)
+    if len(fids) == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    ini = offsets[fids]
+    nseg = offsets[fids + 1] - 1 - ini
+    segs = rangos(ini, ini + nseg)
+    d, qx, qy = dist_punto_segmentos(px, py, coords[segs, 0], coords[segs, 1],
+                                     coords[segs + 1, 0], coords[segs + 1, 1])
+    # Los segmentos de cada curva son contiguos: mínimo por tramo sin ordenar
+    inicio = np.cumsum(nseg) - nseg
+    d_min = np.minimum.reduceat(d, inicio)
+    es_min = np.flatnonzero(d == np.repeat(d_min, nseg))
+    pos = es_min[np.searchsorted(es_min, inicio)]
+    return d_min, qx[pos], qy[pos]
@@ -2,51 +2,23 @@
 """Procesador HYDA"""
 
 from qgis.core import (QgsGeometry, QgsPointXY, QgsRectangle, QgsWkbTypes)
-from qgis.PyQt.QtCore import QVariant
+import itertools
 import math
 
+import numpy as np
 
-def es_curva_cerrada(geom, tol=2.0):
-    if geom.length() == 0:
-        return False
-    coords = geom.asPolyline()
-    if len(coords) < 3:
-        return False
-    return coords[0].distance(coords[-1]) < tol
+from . import perfil
+from .geometria_np import rangos, dist_punto_segmentos
+from .indice_espacial import IndiceTraza
 
 
-def es_pico_real(geom, elev, idx, curvas, r=250):
-    if not es_curva_cerrada(geom):
-        return False
-    coords = geom.asPolyline()
-    if len(coords) < 3:
-        return False
-    
-    poly = QgsGeometry.fromPolygonXY([coords])
-    bbox = geom.boundingBox()
-    bbox_exp = QgsRectangle(bbox.xMinimum()-r, bbox.yMinimum()-r, bbox.xMaximum()+r, bbox.yMaximum()+r)
-    ids_c = idx.intersects(bbox_exp)
-    
-    for fid in ids_c:
-        c_inf = curvas[fid]
-        if c_inf['elevation'] <= elev:
-            continue
-        g_sup = c_inf['geometry']
-        centro = obtener_centro_curva(g_sup)
-        pt_g = QgsGeometry.fromPointXY(centro)
-        if poly.contains(pt_g):
-            return False
-    return True
-
-
-def obtener_centro_curva(geom):
-    c = geom.centroid()
-    if c.isEmpty():
-        coords = geom.asPolyline()
-        x = sum(p.x() for p in coords) / len(coords)
-        y = sum(p.y() for p in coords) / len(coords)
-        return QgsPointXY(x, y)
-    return c.asPoint()
+@perfil.medido('es_pico_real')
+def es_pico_real(fid, curvas):
+    """
+    Curva cerrada sin ninguna curva más alta en su interior.
+    Se precalcula al cargar la topografía (anidamiento.construir_anidamiento).
+    """
+    return bool(curvas.es_pico[fid])
 
 
 def calc_dir(p1, p2):
@@ -57,133 +29,138 @@ def calc_dir(p1, p2):
     return math.atan2(dy, dx)
 
 
-def score_dir(p_orig, p_cand, dir_obj):
+def score_dir(ox, oy, px, py, dir_obj):
+    """Puntaje de dirección (0-100) de cada candidato (px, py) visto desde (ox, oy)"""
+    px = np.asarray(px, dtype=np.float64)
     if dir_obj is None:
-        return 50
-    d_cand = calc_dir(p_orig, p_cand)
-    if d_cand is None:
-        return 0
-    diff = abs(d_cand - dir_obj)
-    if diff > math.pi:
-        diff = 2 * math.pi - diff
-    return 100 * (1 - diff / math.pi)
+        return np.full(px.shape, 50.0)
+    dx = px - ox
+    dy = np.asarray(py, dtype=np.float64) - oy
+    diff = np.abs(np.arctan2(dy, dx) - dir_obj)
+    diff = np.where(diff > math.pi, 2 * math.pi - diff, diff)
+    # Candidato sobre el origen: sin dirección
+    return np.where((dx == 0) & (dy == 0), 0.0, 100 * (1 - diff / math.pi))
 
 
+@perfil.medido('contar_cruces')
 def contar_cruces(p_ini, p_fin, idx, curvas_d, curvas_u, elev_act):
-    seg = QgsGeometry.fromPolylineXY([p_ini, p_fin])
-    bbox = seg.boundingBox()
-    bbox_exp = QgsRectangle(bbox.xMinimum()-50, bbox.yMinimum()-50, bbox.xMaximum()+50, bbox.yMaximum()+50)
-    
-    ids = idx.intersects(bbox_exp)
+    elevs = idx.niveles_entre(elev_act - 20, elev_act + 20)
+    ids = idx.cruzan(p_ini.x(), p_ini.y(), p_fin.x(), p_fin.y(), elevs)
     cruces = []
     
-    for fid in ids:
+    for fid in ids.tolist():
         if fid in curvas_u:
             continue
-        c_inf = curvas_d[fid]
-        if abs(c_inf['elevation'] - elev_act) > 20:
+        elev = float(curvas_d.elev[fid])
+        if abs(elev - elev_act) > 20:
             continue
-        if seg.intersects(c_inf['geometry']):
-            cruces.append({'idx': fid, 'elev': c_inf['elevation']})
+        cruces.append({'idx': fid, 'elev': elev})
     
     return len(cruces), cruces
 
 
-def contar_menores(pt, idx, curvas, elev_ref, r=30.0):
-    bbox = QgsRectangle(pt.x()-r, pt.y()-r, pt.x()+r, pt.y()+r)
-    ids = idx.intersects(bbox)
-    cnt = 0
-    pt_g = QgsGeometry.fromPointXY(pt)
-    
-    for fid in ids:
-        c_inf = curvas[fid]
-        if c_inf['elevation'] >= elev_ref:
-            continue
-        if c_inf['geometry'].distance(pt_g) <= r:
-            cnt += 1
-    return cnt
+@perfil.medido('contar_menores')
+def contar_menores(px, py, idx, curvas, elev_ref, r=30.0):
+    """
+    Para cada punto, curvas de elevación menor a elev_ref a distancia <= r.
+    Una consulta al índice por punto y una sola pasada de distancias.
+    """
+    partes = [idx.segmentos(x - r, y - r, x + r, y + r) for x, y in zip(px.tolist(), py.tolist())]
+    n = np.array([len(segs) for segs, _ in partes], dtype=np.int64)
+    if n.sum() == 0:
+        return np.zeros(len(px), dtype=np.int64)
+    segs = np.concatenate([segs for segs, _ in partes])
+    fids = np.concatenate([fids for _, fids in partes])
+    k = np.repeat(np.arange(len(px)), n)
+    sel = curvas.elev[fids] < elev_ref
+    segs, fids, k = segs[sel], fids[sel], k[sel]
+    c = curvas.coords
+    perfil.contar('dist_segmentos', len(segs))
+    d, _, _ = dist_punto_segmentos(px[k], py[k], c[segs, 0], c[segs, 1], c[segs + 1, 0], c[segs + 1, 1])
+    # Pares (punto, curva) únicos dentro del radio
+    pares = np.unique(k[d <= r] * len(curvas) + fids[d <= r])
+    return np.bincount(pares // len(curvas), minlength=len(px))
 
 
+@perfil.medido('pto_salida_cresta')
 def pto_salida_cresta(c_pico, g_pico, e_pico, dir_gen, idx, curvas, c_sig):
+    """
+    Punto de salida de una cresta: el vértice muestreado de la curva pico
+    con mejor puntaje de dirección, pocas curvas bajas cerca y curva
+    superior próxima. Todos los candidatos se evalúan en bloque; gana el
+    primero con el puntaje máximo.
+    """
     coords = g_pico.asPolyline()
     if len(coords) < 3:
         return c_pico
     
-    mejor_pt = None
-    mejor_sc = -999999
     paso = max(1, len(coords) // 20)
-    
-    for i in range(0, len(coords), paso):
-        pt = coords[i]
-        sc_d = score_dir(c_pico, pt, dir_gen)
-        n_bajas = contar_menores(pt, idx, curvas, e_pico, r=30.0)
-        sc_alt = -n_bajas * 10
-        
-        d_min_sig = float('inf')
-        for c_s in c_sig:
-            if c_s['elevation'] > e_pico:
-                d = c_s['geometry'].distance(QgsGeometry.fromPointXY(pt))
-                d_min_sig = min(d_min_sig, d)
-        
-        sc_prox = 100 / (1 + d_min_sig / 10.0) if d_min_sig < float('inf') else 0
-        sc_tot = sc_d * 2.0 + sc_alt * 1.0 + sc_prox * 2.5
-        
-        if sc_tot > mejor_sc:
-            mejor_sc = sc_tot
-            mejor_pt = pt
+    cands = coords[::paso]
+    px = np.array([p.x() for p in cands])
+    py = np.array([p.y() for p in cands])
+    
+    sc_d = score_dir(c_pico.x(), c_pico.y(), px, py, dir_gen)
+    sc_alt = -contar_menores(px, py, idx, curvas, e_pico, r=30.0) * 10
+    
+    # Distancia a la curva superior más cercana: mínimo sobre todos sus segmentos
+    ids_sup = np.array([c_s.fid for c_s in c_sig if c_s['elevation'] > e_pico], dtype=np.int64)
+    sc_prox = np.zeros(len(cands))
+    if len(ids_sup):
+        segs = rangos(curvas.offsets[ids_sup], curvas.offsets[ids_sup + 1] - 1)
+        c = curvas.coords
+        perfil.contar('dist_segmentos', len(segs) * len(px))
+        d, _, _ = dist_punto_segmentos(px[:, None], py[:, None], c[segs, 0], c[segs, 1],
+                                       c[segs + 1, 0], c[segs + 1, 1])
+        sc_prox = 100 / (1 + d.min(axis=1) / 10.0)
+    
+    sc_tot = sc_d * 2.0 + sc_alt * 1.0 + sc_prox * 2.5
+    k = int(np.argmax(sc_tot))
+    mejor_pt = cands[k] if sc_tot[k] > -999999 else None
     
     return mejor_pt if mejor_pt else c_pico
 
 
+@perfil.medido('buscar_curva')
 def buscar_curva(pt_act, idx, curvas_d, curvas_u, elev_act, radio, dir_gen):
-    bbox = QgsRectangle(pt_act.x()-radio, pt_act.y()-radio, pt_act.x()+radio, pt_act.y()+radio)
-    ids = idx.intersects(bbox)
-    
     elevs_obj = [elev_act + 1, elev_act]
     
+    # Solo se consultan los índices de los dos niveles buscados
+    ids, dists = idx.en_radio(pt_act.x(), pt_act.y(), radio, elevs_obj)
+    
     # Separar candidatas por elevación ANTES de procesar geometría
     cands_por_elev = {elev_act + 1: [], elev_act: []}
     
-    for fid in ids:
+    for fid, d in zip(ids.tolist(), dists.tolist()):
         if fid in curvas_u:
             continue
-        c_inf = curvas_d[fid]
-        if c_inf['elevation'] not in elevs_obj:
+        elev = float(curvas_d.elev[fid])
+        if elev not in elevs_obj:
             continue
         
-        # Guardar en su grupo de elevación
-        cands_por_elev[c_inf['elevation']].append((fid, c_inf))
+        # Guardar en su grupo de elevación (la distancia ya viene del índice de segmentos)
+        cands_por_elev[elev].append((fid, d))
     
     # Procesar PRIMERO elevación+1, LUEGO elevación actual
     for e_obj in elevs_obj:
         cands = []
         
-        for fid, c_inf in cands_por_elev[e_obj]:
-            c_g = c_inf['geometry']
-            if 'es_pico' not in c_inf:
-                c_inf['es_pico'] = es_pico_real(c_g, c_inf['elevation'], idx, curvas_d, r=250)
+        for fid, d in cands_por_elev[e_obj]:
+            c_inf = curvas_d[fid]
             
-            es_p = c_inf['es_pico']
-            
-            if es_p:
-                centro = obtener_centro_curva(c_g)
+            if es_pico_real(fid, curvas_d):
+                centro = QgsPointXY(*curvas_d.centro[fid])
                 d_c = pt_act.distance(centro)
-                d_p = c_g.distance(QgsGeometry.fromPointXY(pt_act))
-                
-                if d_p <= radio:
-                    usar_p = d_c <= radio
-                    d_rel = d_c if usar_p else d_p
-                    cands.append({
-                        'idx': fid, 'info': c_inf, 'dist': d_rel,
-                        'es_pico': usar_p, 'pt_con': centro if usar_p else None, 'elev': e_obj
-                    })
+                usar_p = d_c <= radio
+                d_rel = d_c if usar_p else d
+                cands.append({
+                    'idx': fid, 'info': c_inf, 'dist': d_rel,
+                    'es_pico': usar_p, 'pt_con': centro if usar_p else None, 'elev': e_obj
+                })
             else:
-                d = c_g.distance(QgsGeometry.fromPointXY(pt_act))
-                if d <= radio:
-                    cands.append({
-                        'idx': fid, 'info': c_inf, 'dist': d,
-                        'es_pico': False, 'pt_con': None, 'elev': e_obj
-                    })
+                cands.append({
+                    'idx': fid, 'info': c_inf, 'dist': d,
+                    'es_pico': False, 'pt_con': None, 'elev': e_obj
+                })
         
         # Si encontró candidatas en esta elevación, retornar la mejor
         if cands:
@@ -193,9 +170,20 @@ def buscar_curva(pt_act, idx, curvas_d, curvas_u, elev_act, radio, dir_gen):
     return None
 
 
-def verif_cruce_otra(pt_act, pt_nvo, otra_pts):
+@perfil.medido('verif_cruce_otra')
+def verif_cruce_otra(pt_act, pt_nvo, otra_pts, ind=None):
+    """
+    Cruce del tramo pt_act -> pt_nvo con la otra línea. Con ind (IndiceTraza
+    de otra_pts) solo se arma la geometría completa si algún segmento
+    cercano lo cruza, es decir, una vez por traza.
+    """
     if not otra_pts or len(otra_pts) < 2:
         return False, None
+    if ind is not None:
+        ind.sincronizar(otra_pts)
+        if not len(ind.cruza(pt_act.x(), pt_act.y(), pt_nvo.x(), pt_nvo.y())):
+            return False, None
+    perfil.contar('geom_exacta')
     seg = QgsGeometry.fromPolylineXY([pt_act, pt_nvo])
     g_otra = QgsGeometry.fromPolylineXY(otra_pts)
     if not seg.intersects(g_otra):
@@ -210,9 +198,20 @@ def verif_cruce_otra(pt_act, pt_nvo, otra_pts):
     return True, QgsPointXY(ctx[1])
 
 
-def verif_autocruce(pts, pt_nvo):
+@perfil.medido('verif_autocruce')
+def verif_autocruce(pts, pt_nvo, ind=None):
+    """
+    Cruce del tramo pts[-1] -> pt_nvo con la traza previa (sin su último
+    segmento). Con ind (IndiceTraza de pts) el caso sin cruce cuesta
+    O(celdas tocadas) en vez de O(len(pts)).
+    """
     if len(pts) < 2:
         return False, None
+    if ind is not None:
+        ind.sincronizar(pts)
+        if not len(ind.cruza(pts[-1].x(), pts[-1].y(), pt_nvo.x(), pt_nvo.y(), len(pts) - 2)):
+            return False, None
+    perfil.contar('geom_exacta')
     seg = QgsGeometry.fromPolylineXY([pts[-1], pt_nvo])
     prev = QgsGeometry.fromPolylineXY(pts[:-1])
     if prev.isEmpty() or not seg.intersects(prev):
@@ -227,30 +226,29 @@ def verif_autocruce(pts, pt_nvo):
     return True, QgsPointXY(ctx[1])
 
 
-def procesar_divisoria_individual(pt_ini, idx, curvas_d, num, pts_aux, otra_pts):
-    bbox_ini = QgsRectangle(pt_ini.x()-25, pt_ini.y()-25, pt_ini.x()+25, pt_ini.y()+25)
-    ids = idx.intersects(bbox_ini)
+@perfil.medido('elevacion_inicial')
+def elevacion_inicial(pt, idx, curvas_d, excluir=()):
+    """
+    Elevación de arranque según las curvas a menos de 25 m del punto:
+    la más cercana o, si es la menor de las dos más cercanas, esa + 1.
+    None si no hay curvas.
+    """
+    idx.asegurar_cobertura(pt.x(), pt.y(), 25)
+    bbox = QgsRectangle(pt.x()-25, pt.y()-25, pt.x()+25, pt.y()+25)
+    ids = [fid for fid in idx.intersects(bbox) if fid not in excluir]
     
-    d_min = float('inf')
-    for fid in ids:
-        d = curvas_d[fid]['geometry'].distance(QgsGeometry.fromPointXY(pt_ini))
-        if d < d_min:
-            d_min = d
+    # Distancia a todas las candidatas en una pasada; la más cercana fija la tolerancia
+    dists, _, _ = curvas_d.distancias(pt.x(), pt.y(), ids)
+    d_min = dists.min() if len(ids) else float('inf')
     
     TOL = 5.0
     cands = []
-    for fid in ids:
-        d = curvas_d[fid]['geometry'].distance(QgsGeometry.fromPointXY(pt_ini))
+    for fid, d in zip(ids, dists.tolist()):
         if d <= d_min + TOL:
             cands.append({'fid': fid, 'elev': curvas_d[fid]['elevation'], 'dist': d})
     
     if not cands:
-        return {
-            'puntos': [pt_ini], 'numero': num, 'elev_inicial': 0, 'elev_final': 0,
-            'ganancia': 0, 'longitud': 0, 'num_puntos': 1, 'num_curvas': 0,
-            'picos': 0, 'iteraciones': 0, 'razon': 'sin_elev_ini',
-            'punto_final': pt_ini, 'curvas_usadas': set(), 'salto_auxiliar': False
-        }
+        return None
     
     cands.sort(key=lambda x: x['dist'])
     c_cerc = cands[0]
@@ -260,349 +258,407 @@ def procesar_divisoria_individual(pt_ini, idx, curvas_d, num, pts_aux, otra_pts)
     else:
         e_min_dos = c_cerc['elev']
     
-    elev_ini = e_min_dos + 1 if c_cerc['elev'] == e_min_dos else c_cerc['elev']
+    # Si está en la curva menor, sube +1
+    return e_min_dos + 1 if c_cerc['elev'] == e_min_dos else c_cerc['elev']
+
+
+class TrazadoCancelado(Exception):
+    """La lanza el vigía de una traza (ver TrazaDivisoria.trazar) para cortarla"""
+    pass
+
+
+class TrazaDivisoria:
+    """
+    Trazado de una divisoria paso a paso. Cada llamada a paso() es una
+    iteración del bucle de ascenso; trazar() la lleva hasta el final.
+    auxiliar=True reproduce procesar_desde_auxiliar (sin autocruce,
+    1000 iteraciones, 5 segmentos libres).
+    Con la instrumentación activa (perfil) cada traza acumula sus cuentas
+    y tiempos en self.perfil; resultado() los agrega en 'perfil'.
+    """
     
     R_BASE = 50.0
     MULT = 5.0
     VENT = 5
-    MAX_IT = 2000
-    SEGS_LIB = 3
-    
-    pts = [pt_ini]
-    pt_act = pt_ini
-    elev_act = elev_ini
-    curvas_u = set()
-    picos = 0
-    d_ult_seg = R_BASE
-    it = 0
-    pt_ant = pt_ini
-    razon = "max_iter"
-    
-    while it < MAX_IT:
-        it += 1
-        r_busq = max(d_ult_seg * MULT, R_BASE)
+    
+    def __init__(self, pt, idx, curvas_d, elev_ini, num=None, otra_pts=None,
+                 curvas_u=(), auxiliar=False, prf=None):
+        self.idx = idx
+        self.curvas_d = curvas_d
+        self.num = num
+        self.otra_pts = otra_pts
+        self.auxiliar = auxiliar
+        self.max_it = 1000 if auxiliar else 2000
+        self.segs_lib = 5 if auxiliar else 3
+        
+        self.pts = [pt]
+        self.ind_pts = IndiceTraza(self.pts)
+        self.ind_otra = IndiceTraza()
+        self.pt_act = pt
+        self.pt_ant = pt
+        self.elev_ini = elev_ini
+        self.elev_act = elev_ini
+        self.curvas_u = set(curvas_u)
+        self.curvas_u0 = frozenset(curvas_u)
+        # Por paso completo: (primer vértice agregado, curva, su elevación, es_pico); ver cortar()
+        self.pasos = []
+        self.picos = 0
+        self.d_ult = self.R_BASE
+        self.it = 0
+        self.razon = "max_iter"
+        self.terminada = False
+        self.perfil = prf if prf is not None else perfil.nuevo()
+        self.volcado = False
+    
+    def _corta(self, p0, p1, p_cuenta, salida, verif_c):
+        """Verificaciones del tramo p0 -> p1; True si la traza termina aquí"""
+        hay_c, p_c = verif_cruce_otra(p0, p1, self.otra_pts, self.ind_otra)
+        if hay_c:
+            self.pts.append(p_c)
+            if salida:
+                self.razon = "cruce_sal" if self.auxiliar else "cruce_sal_pico"
+            else:
+                self.razon = "cruce_otra"
+            return True
+        
+        if not self.auxiliar:
+            hay_a, p_a = verif_autocruce(self.pts, p1, self.ind_pts)
+            if hay_a:
+                self.pts.append(p_a)
+                self.razon = "autocruce_sal" if salida else "autocruce"
+                return True
+        
+        if verif_c:
+            n_c, _ = contar_cruces(p_cuenta, p1, self.idx, self.curvas_d, self.curvas_u, self.elev_act)
+            if n_c >= 3:
+                pref = ("sal_" if self.auxiliar else "sal_pico_") if salida else ""
+                self.razon = f"{pref}cruza_{n_c}"
+                return True
+        return False
+    
+    def _fin(self):
+        self.terminada = True
+        return False
+    
+    def paso(self):
+        """Una iteración; retorna False cuando la traza ya terminó"""
+        if self.perfil is None:
+            return self._paso()
+        with perfil.en(self.perfil, 'paso'):
+            return self._paso()
+    
+    def _paso(self):
+        if self.terminada:
+            return False
+        
+        idx = self.idx
+        curvas_d = self.curvas_d
+        self.it += 1
+        r_busq = max(self.d_ult * self.MULT, self.R_BASE)
+        # Con carga por área de interés, amplía el almacén antes de llegar al borde
+        idx.asegurar_cobertura(self.pt_act.x(), self.pt_act.y(), r_busq * 2)
         
-        pts_rec = pts[-VENT:] if len(pts) >= VENT else pts
+        pts = self.pts
+        n0 = len(pts)
+        pts_rec = pts[-self.VENT:] if len(pts) >= self.VENT else pts
         dir_gen = calc_dir(pts_rec[0], pts_rec[-1]) if len(pts_rec) >= 2 else None
         
-        mejor = buscar_curva(pt_act, idx, curvas_d, curvas_u, elev_act, r_busq, dir_gen)
+        mejor = buscar_curva(self.pt_act, idx, curvas_d, self.curvas_u, self.elev_act, r_busq, dir_gen)
         
         if mejor is None:
-            razon = "sin_curvas"
-            break
+            self.razon = "sin_curvas"
+            return self._fin()
         
         idx_c = mejor['idx']
         c_inf = mejor['info']
-        es_p = mejor['es_pico']
-        verif_c = (it > SEGS_LIB)
+        verif_c = (self.it > self.segs_lib)
         
-        if es_p:
-            picos += 1
+        if mejor['es_pico']:
+            self.picos += 1
             centro = mejor['pt_con']
             
-            hay_c, p_c = verif_cruce_otra(pt_act, centro, otra_pts)
-            if hay_c:
-                pts.append(p_c)
-                razon = "cruce_otra"
-                break
-            
-            hay_a, p_a = verif_autocruce(pts, centro)
-            if hay_a:
-                pts.append(p_a)
-                razon = "autocruce"
-                break
+            if self._corta(self.pt_act, centro, self.pt_ant, False, verif_c):
+                return self._fin()
             
-            if verif_c:
-                n_c, _ = contar_cruces(pt_ant, centro, idx, curvas_d, curvas_u, elev_act)
-                if n_c >= 3:
-                    razon = f"cruza_{n_c}"
-                    break
-            
-            d_ult_seg = pt_act.distance(centro)
+            self.d_ult = self.pt_act.distance(centro)
             pts.append(centro)
-            pt_ant = pt_act
-            pt_act = centro
+            self.pt_ant = self.pt_act
+            self.pt_act = centro
             
-            bbox_sig = QgsRectangle(centro.x()-r_busq*2, centro.y()-r_busq*2, centro.x()+r_busq*2, centro.y()+r_busq*2)
-            ids_sig = idx.intersects(bbox_sig)
-            c_sig = []
-            for fid in ids_sig:
-                if fid in curvas_u or fid == idx_c:
-                    continue
-                c = curvas_d[fid]
-                if c['geometry'].distance(QgsGeometry.fromPointXY(centro)) <= r_busq * 2:
-                    c_sig.append(c)
+            idx.asegurar_cobertura(centro.x(), centro.y(), r_busq * 2)
+            ids_sig, _ = idx.en_radio(centro.x(), centro.y(), r_busq * 2)
+            c_sig = [curvas_d[fid] for fid in ids_sig.tolist() if fid not in self.curvas_u and fid != idx_c]
             
             pt_sal = pto_salida_cresta(centro, c_inf['geometry'], c_inf['elevation'], dir_gen, idx, curvas_d, c_sig)
             
-            hay_c, p_c = verif_cruce_otra(centro, pt_sal, otra_pts)
-            if hay_c:
-                pts.append(p_c)
-                razon = "cruce_sal_pico"
-                break
+            if self._corta(centro, pt_sal, centro, True, verif_c):
+                return self._fin()
             
-            hay_a, p_a = verif_autocruce(pts, pt_sal)
-            if hay_a:
-                pts.append(p_a)
-                razon = "autocruce_sal"
-                break
-            
-            if verif_c:
-                n_c_s, _ = contar_cruces(centro, pt_sal, idx, curvas_d, curvas_u, elev_act)
-                if n_c_s >= 3:
-                    razon = f"sal_pico_cruza_{n_c_s}"
-                    break
-            
-            d_ult_seg = centro.distance(pt_sal)
+            self.d_ult = centro.distance(pt_sal)
             pts.append(pt_sal)
-            pt_ant = centro
-            pt_act = pt_sal
+            self.pt_ant = centro
+            self.pt_act = pt_sal
         else:
-            res = c_inf['geometry'].closestSegmentWithContext(pt_act)
-            pt_cerc = res[1]
-            
-            hay_c, p_c = verif_cruce_otra(pt_act, pt_cerc, otra_pts)
-            if hay_c:
-                pts.append(p_c)
-                razon = "cruce_otra"
-                break
+            _, qx, qy = curvas_d.distancias(self.pt_act.x(), self.pt_act.y(), [idx_c])
+            pt_cerc = QgsPointXY(qx[0], qy[0])
             
-            hay_a, p_a = verif_autocruce(pts, pt_cerc)
-            if hay_a:
-                pts.append(p_a)
-                razon = "autocruce"
-                break
-            
-            if verif_c:
-                n_c, _ = contar_cruces(pt_ant, pt_cerc, idx, curvas_d, curvas_u, elev_act)
-                if n_c >= 3:
-                    razon = f"cruza_{n_c}"
-                    break
+            if self._corta(self.pt_act, pt_cerc, self.pt_ant, False, verif_c):
+                return self._fin()
             
-            d_ult_seg = pt_act.distance(pt_cerc)
+            self.d_ult = self.pt_act.distance(pt_cerc)
             pts.append(pt_cerc)
-            pt_ant = pt_act
-            pt_act = pt_cerc
+            self.pt_ant = self.pt_act
+            self.pt_act = pt_cerc
+        
+        self.elev_act = c_inf['elevation']
+        self.curvas_u.add(idx_c)
+        self.pasos.append((n0, idx_c, self.elev_act, mejor['es_pico']))
         
-        elev_act = c_inf['elevation']
-        curvas_u.add(idx_c)
+        if self.it >= self.max_it:
+            return self._fin()
+        return True
+    
+    def trazar(self, vigia=None):
+        """
+        Traza hasta el final. vigia(num, pts), si se da, se llama tras cada
+        paso (vista previa, cancelación con TrazadoCancelado).
+        """
+        while self.paso():
+            if vigia is not None:
+                vigia(self.num, self.pts)
+        return self.resultado()
+    
+    def cortar(self, i, p):
+        """
+        Termina la traza en p, sobre el segmento que sale del vértice i
+        (cruce con la otra divisoria del par, ver trazar_par). Curvas usadas,
+        elevación actual y picos vuelven a los del último paso que agregó
+        un vértice hasta i; iteraciones sigue contando los pasos dados.
+        """
+        self.pasos = [h for h in self.pasos if h[0] <= i]
+        self.pts = self.pts[:i + 1] + [p]
+        self.ind_pts = IndiceTraza(self.pts)
+        self.pt_ant = self.pts[i]
+        self.pt_act = p
+        self.curvas_u = set(self.curvas_u0).union(h[1] for h in self.pasos)
+        self.elev_act = self.pasos[-1][2] if self.pasos else self.elev_ini
+        self.picos = sum(1 for h in self.pasos if h[3])
+        self.razon = 'cruce_par'
+        self.terminada = True
+    
+    def resultado(self):
+        pts = self.pts
+        long = QgsGeometry.fromPolylineXY(pts).length() if len(pts) >= 2 else 0
+        res_perfil = self.perfil.resumen() if self.perfil is not None else None
+        if res_perfil is not None and not self.volcado:
+            self.volcado = True
+            perfil.volcar({'numero': self.num, 'auxiliar': self.auxiliar, 'iteraciones': self.it,
+                           'razon': self.razon, 'num_puntos': len(pts), **res_perfil})
+        return {
+            'puntos': pts, 'numero': self.num, 'elev_inicial': self.elev_ini, 'elev_final': self.elev_act,
+            'ganancia': self.elev_act - self.elev_ini, 'longitud': long, 'num_puntos': len(pts),
+            'num_curvas': len(self.curvas_u), 'picos': self.picos, 'iteraciones': self.it,
+            'razon': self.razon, 'perfil': res_perfil, 'punto_final': self.pt_act,
+            'curvas_usadas': self.curvas_u, 'salto_auxiliar': False
+        }
+
+
+def procesar_divisoria_individual(pt_ini, idx, curvas_d, num, pts_aux, otra_pts):
+    prf = perfil.nuevo()
+    with perfil.en(prf):
+        elev_ini = elevacion_inicial(pt_ini, idx, curvas_d)
     
-    long = QgsGeometry.fromPolylineXY(pts).length() if len(pts) >= 2 else 0
-    gan = elev_act - elev_ini
+    if elev_ini is None:
+        traza = TrazaDivisoria(pt_ini, idx, curvas_d, 0, num, otra_pts, prf=prf)
+        traza.razon = 'sin_elev_ini'
+        return traza.resultado()
     
-    return {
-        'puntos': pts, 'numero': num, 'elev_inicial': elev_ini, 'elev_final': elev_act,
-        'ganancia': gan, 'longitud': long, 'num_puntos': len(pts), 'num_curvas': len(curvas_u),
-        'picos': picos, 'iteraciones': it, 'razon': razon, 'punto_final': pt_act,
-        'curvas_usadas': curvas_u, 'salto_auxiliar': False
-    }
+    return TrazaDivisoria(pt_ini, idx, curvas_d, elev_ini, num, otra_pts, prf=prf).trazar()
 
 
-def procesar_desde_auxiliar(pt_aux, idx, curvas_d, elev_act_heredada, curvas_u_prev, otra_pts):
+def procesar_desde_auxiliar(pt_aux, idx, curvas_d, elev_act_heredada, curvas_u_prev, otra_pts, vigia=None):
     """
     Procesa delimitación desde un punto auxiliar.
     Calcula elevación analizando terreno local, igual que puntos iniciales.
     """
-    
-    # Calcular elevación local del auxiliar
-    bbox_aux = QgsRectangle(pt_aux.x()-25, pt_aux.y()-25, pt_aux.x()+25, pt_aux.y()+25)
-    ids_cercanos = idx.intersects(bbox_aux)
-    
-    # Encontrar la curva más cercana
-    d_min = float('inf')
-    for fid in ids_cercanos:
-        if fid in curvas_u_prev:
-            continue
-        d = curvas_d[fid]['geometry'].distance(QgsGeometry.fromPointXY(pt_aux))
-        if d < d_min:
-            d_min = d
-    
-    # Buscar candidatas dentro de tolerancia
-    TOL = 5.0
-    cands = []
-    for fid in ids_cercanos:
-        if fid in curvas_u_prev:
-            continue
-        d = curvas_d[fid]['geometry'].distance(QgsGeometry.fromPointXY(pt_aux))
-        if d <= d_min + TOL:
-            cands.append({'fid': fid, 'elev': curvas_d[fid]['elevation'], 'dist': d})
-    
-    if not cands:
+    prf = perfil.nuevo()
+    with perfil.en(prf):
+        elev_inicial = elevacion_inicial(pt_aux, idx, curvas_d, curvas_u_prev)
+    if elev_inicial is None:
         # Fallback: usar elevación heredada si no hay curvas cercanas
         elev_inicial = elev_act_heredada
-    else:
-        # Aplicar misma metodología que puntos iniciales
-        cands.sort(key=lambda x: x['dist'])
-        c_cerc = cands[0]
-        
-        if len(cands) >= 2:
-            e_min_dos = min(c['elev'] for c in cands[:2])
-        else:
-            e_min_dos = c_cerc['elev']
-        
-        # Si está en la curva menor, sube +1
-        elev_inicial = e_min_dos + 1 if c_cerc['elev'] == e_min_dos else c_cerc['elev']
     
-    R_BASE = 50.0
-    MULT = 5.0
-    VENT = 5
-    MAX_IT = 1000
-    SEGS_LIB = 5
-    
-    pts = [pt_aux]
-    pt_act = pt_aux
-    curvas_u = set(curvas_u_prev)
-    picos = 0
-    d_ult = R_BASE
-    it = 0
-    pt_ant = pt_aux
-    razon = "max_iter"
-    elev_act = elev_inicial
-    
-    while it < MAX_IT:
-        it += 1
-        r_busq = max(d_ult * MULT, R_BASE)
-        
-        pts_rec = pts[-VENT:] if len(pts) >= VENT else pts
-        dir_gen = calc_dir(pts_rec[0], pts_rec[-1]) if len(pts_rec) >= 2 else None
-        
-        mejor = buscar_curva(pt_act, idx, curvas_d, curvas_u, elev_act, r_busq, dir_gen)
-        
-        if mejor is None:
-            razon = "sin_curvas"
-            break
-        
-        idx_c = mejor['idx']
-        c_inf = mejor['info']
-        es_p = mejor['es_pico']
-        verif_c = (it > SEGS_LIB)
-        
-        if es_p:
-            picos += 1
-            centro = mejor['pt_con']
-            
-            hay_c, p_c = verif_cruce_otra(pt_act, centro, otra_pts)
-            if hay_c:
-                pts.append(p_c)
-                razon = "cruce_otra"
-                break
-            
-            if verif_c:
-                n_c, _ = contar_cruces(pt_ant, centro, idx, curvas_d, curvas_u, elev_act)
-                if n_c >= 3:
-                    razon = f"cruza_{n_c}"
-                    break
-            
-            d_ult = pt_act.distance(centro)
-            pts.append(centro)
-            pt_ant = pt_act
-            pt_act = centro
-            
-            bbox_sig = QgsRectangle(centro.x()-r_busq*2, centro.y()-r_busq*2, centro.x()+r_busq*2, centro.y()+r_busq*2)
-            ids_sig = idx.intersects(bbox_sig)
-            c_sig = []
-            for fid in ids_sig:
-                if fid in curvas_u or fid == idx_c:
+    traza = TrazaDivisoria(pt_aux, idx, curvas_d, elev_inicial, otra_pts=otra_pts,
+                           curvas_u=curvas_u_prev, auxiliar=True, prf=prf)
+    return traza.trazar(vigia)
+
+
+def _cruce_segmentos(a0, a1, b0, b1):
+    """Punto de intersección de dos segmentos (como recortar_lineas_en_cruce) o None"""
+    perfil.contar('geom_exacta')
+    seg1 = QgsGeometry.fromPolylineXY([a0, a1])
+    seg2 = QgsGeometry.fromPolylineXY([b0, b1])
+    if not seg1.intersects(seg2):
+        return None
+    inter = seg1.intersection(seg2)
+    if inter.isEmpty() or inter.type() != QgsWkbTypes.PointGeometry:
+        return None
+    p_cruce = inter.asMultiPoint()[0] if inter.isMultipart() else inter.asPoint()
+    return QgsPointXY(p_cruce)
+
+
+def trazar_par(t1, t2, vigia=None):
+    """
+    Avanza dos trazas alternadamente (siempre la más corta) y prueba cada
+    segmento nuevo contra los de la otra (su IndiceTraza). Se detiene cuando el mejor cruce
+    (menor distancia total desde los inicios) ya no puede mejorarse:
+    todo cruce futuro usa un segmento nuevo y su distancia total es al
+    menos la longitud actual de esa traza. Una traza terminada no aporta
+    segmentos nuevos. El cruce y las líneas recortadas coinciden con
+    trazar ambas completas y aplicar recortar_lineas_en_cruce.
+    Con cruce, ambas trazas quedan cortadas en él (TrazaDivisoria.cortar).
+    vigia(num, pts) se llama tras cada paso, como en TrazaDivisoria.trazar.
+    Retorna el punto de cruce o None.
+    """
+    trazas = (t1, t2)
+    acum = ([0.0], [0.0])
+    mejor = None
+    
+    def probar(k):
+        """Prueba los segmentos nuevos de la traza k contra los existentes de la otra"""
+        nonlocal mejor
+        pts, otra = trazas[k].pts, trazas[1 - k].pts
+        ac, ac_o = acum[k], acum[1 - k]
+        ind_o = trazas[1 - k].ind_pts
+        n_o = len(ac_o) - 1
+        while len(ac) < len(pts):
+            s = len(ac) - 1
+            ac.append(ac[-1] + pts[s].distance(pts[s + 1]))
+            if n_o == 0:
+                continue
+            ind_o.sincronizar(otra)
+            for j in ind_o.cruza(pts[s].x(), pts[s].y(), pts[s + 1].x(), pts[s + 1].y(), n_o).tolist():
+                seg = (pts[s], pts[s + 1], otra[j], otra[j + 1]) if k == 0 else (otra[j], otra[j + 1], pts[s], pts[s + 1])
+                p = _cruce_segmentos(*seg)
+                if p is None:
                     continue
-                c = curvas_d[fid]
-                if c['geometry'].distance(QgsGeometry.fromPointXY(centro)) <= r_busq * 2:
-                    c_sig.append(c)
-            
-            pt_sal = pto_salida_cresta(centro, c_inf['geometry'], c_inf['elevation'], dir_gen, idx, curvas_d, c_sig)
-            
-            hay_c, p_c = verif_cruce_otra(centro, pt_sal, otra_pts)
-            if hay_c:
-                pts.append(p_c)
-                razon = "cruce_sal"
-                break
-            
-            if verif_c:
-                n_c_s, _ = contar_cruces(centro, pt_sal, idx, curvas_d, curvas_u, elev_act)
-                if n_c_s >= 3:
-                    razon = f"sal_cruza_{n_c_s}"
-                    break
-            
-            d_ult = centro.distance(pt_sal)
-            pts.append(pt_sal)
-            pt_ant = centro
-            pt_act = pt_sal
-        else:
-            res = c_inf['geometry'].closestSegmentWithContext(pt_act)
-            pt_cerc = res[1]
-            
-            hay_c, p_c = verif_cruce_otra(pt_act, pt_cerc, otra_pts)
-            if hay_c:
-                pts.append(p_c)
-                razon = "cruce_otra"
-                break
-            
-            if verif_c:
-                n_c, _ = contar_cruces(pt_ant, pt_cerc, idx, curvas_d, curvas_u, elev_act)
-                if n_c >= 3:
-                    razon = f"cruza_{n_c}"
-                    break
-            
-            d_ult = pt_act.distance(pt_cerc)
-            pts.append(pt_cerc)
-            pt_ant = pt_act
-            pt_act = pt_cerc
-        
-        elev_act = c_inf['elevation']
-        curvas_u.add(idx_c)
+                i1, i2 = (s, j) if k == 0 else (j, s)
+                d1 = acum[0][i1] + trazas[0].pts[i1].distance(p)
+                d2 = acum[1][i2] + trazas[1].pts[i2].distance(p)
+                cand = (d1 + d2, i1, i2, p)
+                if mejor is None or cand[:3] < mejor[:3]:
+                    mejor = cand
+    
+    while True:
+        activas = [k for k in (0, 1) if not trazas[k].terminada]
+        cota = min((acum[k][-1] for k in activas), default=float('inf'))
+        if not activas or (mejor is not None and mejor[0] < cota):
+            break
+        k = min(activas, key=lambda k: acum[k][-1])
+        trazas[k].paso()
+        with perfil.en(trazas[k].perfil, 'cruce_par'):
+            probar(k)
+        if vigia is not None:
+            vigia(trazas[k].num, trazas[k].pts)
+    
+    if mejor is None:
+        return None
     
-    return {
-        'puntos': pts, 
-        'elev_inicial': elev_inicial,
-        'elev_final': elev_act, 
-        'iteraciones': it, 
-        'razon': razon
-    }
+    _, i1, i2, p = mejor
+    t1.cortar(i1, p)
+    t2.cortar(i2, p)
+    return p
+
+
+def procesar_par(pt1, pt2, idx, curvas_d, simultaneo=True, vigia=None):
+    """
+    Traza las dos divisorias desde los puntos INICIO y las recorta en su
+    primer cruce.
+    Con simultaneo (por defecto) ambas avanzan a la vez y se detienen al
+    quedar fijo el cruce (trazar_par): cada línea cortada termina con razon
+    'cruce_par', y elev_final, curvas_usadas y picos son los alcanzados
+    hasta el cruce, que es lo que hereda procesar_desde_auxiliar.
+    Sin simultaneo se trazan completas y luego recortar_lineas_en_cruce;
+    solo se recortan puntos, num_puntos, longitud y punto_final.
+    Los puntos y el cruce son los mismos en los dos modos.
+    vigia: ver TrazaDivisoria.trazar.
+    Retorna (r1, r2, pt_cruce).
+    """
+    trazas = []
+    for num, pt in ((1, pt1), (2, pt2)):
+        prf = perfil.nuevo()
+        with perfil.en(prf):
+            elev_ini = elevacion_inicial(pt, idx, curvas_d)
+        t = TrazaDivisoria(pt, idx, curvas_d, 0 if elev_ini is None else elev_ini, num, prf=prf)
+        if elev_ini is None:
+            t.razon = 'sin_elev_ini'
+            t.terminada = True
+        trazas.append(t)
+    t1, t2 = trazas
+    
+    if simultaneo:
+        pt_cruce = trazar_par(t1, t2, vigia)
+        return t1.resultado(), t2.resultado(), pt_cruce
+    
+    t1.trazar(vigia)
+    t2.trazar(vigia)
+    pts1, pts2, pt_cruce = recortar_lineas_en_cruce(t1.pts, t2.pts)
+    r1, r2 = t1.resultado(), t2.resultado()
+    if pt_cruce:
+        for r, pts in ((r1, pts1), (r2, pts2)):
+            r['puntos'] = pts
+            r['num_puntos'] = len(pts)
+            r['longitud'] = QgsGeometry.fromPolylineXY(pts).length()
+            r['punto_final'] = pts[-1]
+    return r1, r2, pt_cruce
+
+
+def clave_traza(version_topo, pts_ini, pts_aux):
+    """
+    Clave de caché de las divisorias de un polígono: versión de la
+    topografía y coordenadas de los puntos de inicio y auxiliares.
+    None si la topografía no tiene versión (carga por área, fuente sin archivo).
+    """
+    if version_topo is None:
+        return None
+    return [version_topo, [[p.x(), p.y()] for p in pts_ini], [[p.x(), p.y()] for p in pts_aux]]
+
+
+def copiar_lineas(res):
+    """Copia de los resultados de trazado que se puede modificar sin tocar el original"""
+    return [dict(r, puntos=list(r['puntos']), curvas_usadas=set(r['curvas_usadas'])) for r in res]
+
 
 def recortar_lineas_en_cruce(pts1, pts2):
     """
-    Detecta el primer cruce entre dos líneas y las recorta hasta ese punto.
+    Detecta el primer cruce entre dos líneas (menor distancia total desde
+    ambos inicios) y las recorta hasta ese punto.
     Retorna las líneas recortadas y el punto de cruce.
     """
     if len(pts1) < 2 or len(pts2) < 2:
         return pts1, pts2, None
     
-    # Buscar todos los cruces posibles
-    cruces = []
+    # Longitud acumulada hasta cada vértice, mismo orden de suma que antes
+    acum1 = list(itertools.accumulate((pts1[k].distance(pts1[k+1]) for k in range(len(pts1) - 1)), initial=0))
+    acum2 = list(itertools.accumulate((pts2[k].distance(pts2[k+1]) for k in range(len(pts2) - 1)), initial=0))
     
+    # Solo se prueban los pares de segmentos que el índice de la línea 2 da como cruzados
+    ind2 = IndiceTraza(pts2)
+    cruce = None
     for i in range(len(pts1) - 1):
-        seg1 = QgsGeometry.fromPolylineXY([pts1[i], pts1[i+1]])
-        
-        for j in range(len(pts2) - 1):
-            seg2 = QgsGeometry.fromPolylineXY([pts2[j], pts2[j+1]])
-            
-            if seg1.intersects(seg2):
-                inter = seg1.intersection(seg2)
-                if not inter.isEmpty() and inter.type() == QgsWkbTypes.PointGeometry:
-                    p_cruce = inter.asMultiPoint()[0] if inter.isMultipart() else inter.asPoint()
-                    pt_cruce = QgsPointXY(p_cruce)
-                    
-                    # Calcular distancia desde el inicio de cada línea
-                    dist1 = sum(pts1[k].distance(pts1[k+1]) for k in range(i))
-                    dist1 += pts1[i].distance(pt_cruce)
-                    
-                    dist2 = sum(pts2[k].distance(pts2[k+1]) for k in range(j))
-                    dist2 += pts2[j].distance(pt_cruce)
-                    
-                    cruces.append({
-                        'punto': pt_cruce,
-                        'idx1': i,
-                        'idx2': j,
-                        'dist_total': dist1 + dist2
-                    })
-    
-    if not cruces:
+        for j in ind2.cruza(pts1[i].x(), pts1[i].y(), pts1[i+1].x(), pts1[i+1].y()).tolist():
+            pt_cruce = _cruce_segmentos(pts1[i], pts1[i+1], pts2[j], pts2[j+1])
+            if pt_cruce is None:
+                continue
+            dist_total = (acum1[i] + pts1[i].distance(pt_cruce)) + (acum2[j] + pts2[j].distance(pt_cruce))
+            # Menor distancia total; en empate, el primero en orden (i, j)
+            if cruce is None or dist_total < cruce[0]:
+                cruce = (dist_total, i, j, pt_cruce)
+    
+    if cruce is None:
         return pts1, pts2, None
     
-    # Tomar el cruce más cercano al inicio (menor distancia total)
-    cruce = min(cruces, key=lambda x: x['dist_total'])
-    pt_cruce = cruce['punto']
-    idx1 = cruce['idx1']
-    idx2 = cruce['idx2']
+    _, idx1, idx2, pt_cruce = cruce
     
     # Recortar línea 1 hasta el cruce
     pts1_recortada = pts1[:idx1+1]
@@ -636,4 +692,13 @@ def crear_poligono_cuenca(pts1, pts2):
                 return None
         return poly_g
     except:
-        return None
\ No newline at end of file
+        return None
+
+def delimitar_par(pt1, pt2, idx, curvas_d):
+    """
+    Delimitación completa desde un par de puntos de inicio, sin interfaz:
+    ambas divisorias (procesar_par) y el polígono de la cuenca.
+    Retorna (r1, r2, poligono o None).
+    """
+    r1, r2, _ = procesar_par(pt1, pt2, idx, curvas_d)
+    return r1, r2, crear_poligono_cuenca(r1['puntos'], r2['puntos'])
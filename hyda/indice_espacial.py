@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""Índice espacial empaquetado (STR) sobre arreglos de bbox"""
+
+import math
+import time
+
+import numpy as np
+
+from . import perfil
+from .geometria_np import rangos, dist_punto_segmentos, segmentos_intersectan, min_por_grupo
+
+
+CAP_NODO = 16
+LARGO_TROZO = 32
+# Con más niveles que esto conviene el índice global filtrado por elevación
+MAX_NIVELES_PARTICION = 4
+
+
+def _rect(r):
+    if hasattr(r, 'xMinimum'):
+        return r.xMinimum(), r.yMinimum(), r.xMaximum(), r.yMaximum()
+    return r
+
+
+def orden_str(bbox, cap=CAP_NODO):
+    """Orden Sort-Tile-Recursive: franjas por x del centro y, dentro, por y"""
+    n = len(bbox)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    cx = (bbox[:, 0] + bbox[:, 2]) * 0.5
+    cy = (bbox[:, 1] + bbox[:, 3]) * 0.5
+    hojas = math.ceil(n / cap)
+    franjas = math.ceil(math.sqrt(hojas))
+    franja = np.empty(n, dtype=np.int64)
+    franja[np.argsort(cx, kind='stable')] = np.arange(n) // (franjas * cap)
+    return np.lexsort((cy, franja))
+
+
+def _agrupar(cajas, cap):
+    ini = np.arange(0, len(cajas), cap)
+    return np.column_stack((
+        np.minimum.reduceat(cajas[:, 0], ini), np.minimum.reduceat(cajas[:, 1], ini),
+        np.maximum.reduceat(cajas[:, 2], ini), np.maximum.reduceat(cajas[:, 3], ini)))
+
+
+class IndiceSTR:
+    """
+    R-tree empaquetado construido en una sola pasada (bulk load STR).
+    Los niveles se guardan como arreglos de cajas: el nivel 0 son las
+    entradas en orden STR y cada nodo del nivel k cubre CAP_NODO nodos
+    consecutivos del nivel k-1. Compatible con QgsSpatialIndex.intersects.
+    """
+
+    def __init__(self, bbox, cap=CAP_NODO, ids=None):
+        bbox = np.asarray(bbox, dtype=np.float64).reshape(-1, 4)
+        orden = orden_str(bbox, cap)
+        self.cap = cap
+        self.ids = orden if ids is None else np.asarray(ids, dtype=np.int64)[orden]
+        self.niveles = [np.ascontiguousarray(bbox[orden])]
+        while len(self.niveles[-1]) > cap:
+            self.niveles.append(_agrupar(self.niveles[-1], cap))
+
+    @classmethod
+    def desde_arreglos(cls, arreglos, prefijo='str'):
+        ind = cls.__new__(cls)
+        niv = arreglos[f'{prefijo}_niv']
+        cajas = arreglos[f'{prefijo}_cajas']
+        ind.cap = int(arreglos[f'{prefijo}_cap'])
+        ind.ids = arreglos[f'{prefijo}_ids']
+        ind.niveles = [cajas[niv[k]:niv[k + 1]] for k in range(len(niv) - 1)]
+        return ind
+
+    def arreglos(self, prefijo='str'):
+        """Arreglos planos para serializar: ids, cajas de todos los niveles y offsets"""
+        niv = np.zeros(len(self.niveles) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in self.niveles], out=niv[1:])
+        cajas = np.concatenate(self.niveles) if self.niveles else np.zeros((0, 4))
+        return {f'{prefijo}_ids': self.ids, f'{prefijo}_cajas': cajas,
+                f'{prefijo}_niv': niv, f'{prefijo}_cap': np.array(self.cap)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def consultar(self, x0, y0, x1, y1):
+        """Posiciones (orden STR) de las entradas cuya caja intersecta el rectángulo"""
+        if not self.niveles or len(self.ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        cand = np.arange(len(self.niveles[-1]))
+        for k in range(len(self.niveles) - 1, -1, -1):
+            c = self.niveles[k][cand]
+            cand = cand[(c[:, 0] <= x1) & (c[:, 2] >= x0) & (c[:, 1] <= y1) & (c[:, 3] >= y0)]
+            if k == 0 or len(cand) == 0:
+                break
+            hijos = (cand[:, None] * self.cap + np.arange(self.cap)).ravel()
+            cand = hijos[hijos < len(self.niveles[k - 1])]
+        return cand
+
+    def intersects(self, rect):
+        x0, y0, x1, y1 = _rect(rect)
+        return self.ids[self.consultar(x0, y0, x1, y1)].tolist()
+
+
+class IndiceSegmentos:
+    """
+    Índice de curvas por trozos de hasta LARGO_TROZO segmentos consecutivos.
+    Cada trozo guarda su curva y su rango de vértices, de modo que las
+    consultas por radio o por cruce solo calculan distancias e intersecciones
+    contra los segmentos cercanos y no contra la curva completa.
+    intersects() mantiene la consulta por bbox de curva (QgsSpatialIndex).
+    Con cargador (aoi.CargaAOI) el almacén crece bajo demanda al llamar
+    a asegurar_cobertura().
+    """
+
+    cargador = None
+
+    def __init__(self, alm, largo=LARGO_TROZO, idx_curvas=None):
+        self.alm = alm
+        self.largo = largo
+        self.idx_curvas = idx_curvas if idx_curvas is not None else IndiceSTR(alm.bbox)
+        self.tr_fid, self.tr_ini, self.tr_fin = self._trozos(0)
+        self.idx_trozos = IndiceSTR(self._cajas_trozos(0))
+        self._particionar()
+
+    @classmethod
+    def desde_arreglos(cls, alm, arreglos):
+        ind = cls.__new__(cls)
+        ind.alm = alm
+        ind.largo = int(arreglos['tr_largo'])
+        ind.tr_fid = arreglos['tr_fid']
+        ind.tr_ini = arreglos['tr_ini']
+        ind.tr_fin = arreglos['tr_fin']
+        ind.idx_curvas = IndiceSTR.desde_arreglos(arreglos, 'str')
+        ind.idx_trozos = IndiceSTR.desde_arreglos(arreglos, 'trstr')
+        if 'pn_elevs' in arreglos:
+            ind._particion_desde(arreglos)
+        else:
+            ind._particionar()
+        return ind
+
+    def arreglos(self):
+        arr = {'tr_largo': np.array(self.largo), 'tr_fid': self.tr_fid,
+               'tr_ini': self.tr_ini, 'tr_fin': self.tr_fin}
+        arr.update(self.idx_curvas.arreglos('str'))
+        arr.update(self.idx_trozos.arreglos('trstr'))
+        arr.update(self._arreglos_particion())
+        return arr
+
+    def _arreglos_particion(self):
+        """Partición por elevación en arreglos planos: los IndiceSTR de cada nivel concatenados"""
+        partes = [self.por_nivel[e].arreglos('pn') for e in self.elevs.tolist()]
+        arr = {'tr_elev': self.tr_elev, 'pn_elevs': self.elevs, 'pn_cap': np.array(CAP_NODO)}
+        for nom, vacio in (('ids', np.zeros(0, dtype=np.int64)), ('cajas', np.zeros((0, 4))),
+                           ('niv', np.zeros(0, dtype=np.int64))):
+            bloques = [p[f'pn_{nom}'] for p in partes]
+            off = np.zeros(len(bloques) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in bloques], out=off[1:])
+            arr[f'pn_{nom}'] = np.concatenate(bloques) if bloques else vacio
+            arr[f'pn_{nom}_off'] = off
+        return arr
+
+    def _particion_desde(self, arreglos):
+        """Partición guardada por _arreglos_particion: solo vistas, sin reordenar trozos"""
+        self.tr_elev = arreglos['tr_elev']
+        self.elevs = arreglos['pn_elevs']
+        off = {nom: arreglos[f'pn_{nom}_off'].tolist() for nom in ('ids', 'cajas', 'niv')}
+        cap = arreglos['pn_cap']
+        self.por_nivel = {}
+        for k, e in enumerate(self.elevs.tolist()):
+            nivel = {f'pn_{nom}': arreglos[f'pn_{nom}'][off[nom][k]:off[nom][k + 1]]
+                     for nom in ('ids', 'cajas', 'niv')}
+            nivel['pn_cap'] = cap
+            self.por_nivel[e] = IndiceSTR.desde_arreglos(nivel, 'pn')
+
+    def _trozos(self, desde):
+        """Trozos de las curvas con fid >= desde: curva y rango [ini, fin) de vértices iniciales"""
+        fids = np.arange(desde, len(self.alm), dtype=np.int64)
+        ini = self.alm.offsets[desde:-1]
+        nseg = self.alm.offsets[desde + 1:] - ini - 1
+        ntr = (nseg + self.largo - 1) // self.largo
+        tr_fid = np.repeat(fids, ntr)
+        k = np.arange(len(tr_fid)) - np.repeat(np.cumsum(ntr) - ntr, ntr)
+        tr_ini = np.repeat(ini, ntr) + k * self.largo
+        tr_fin = np.minimum(tr_ini + self.largo, self.alm.offsets[tr_fid + 1] - 1)
+        return tr_fid, tr_ini, tr_fin
+
+    def _cajas_trozos(self, desde):
+        """Cajas de los trozos de las curvas con fid >= desde, sin recorrer las anteriores"""
+        k0 = np.searchsorted(self.tr_fid, desde)
+        if k0 == len(self.tr_fid):
+            return np.zeros((0, 4))
+        o0 = self.alm.offsets[desde]
+        x = self.alm.coords[o0:, 0]
+        y = self.alm.coords[o0:, 1]
+        x2 = np.r_[x[1:], x[-1:]]
+        y2 = np.r_[y[1:], y[-1:]]
+        # El "segmento" que une dos curvas se reduce a su vértice inicial
+        fin = self.alm.offsets[desde + 1:] - 1 - o0
+        x2[fin] = x[fin]
+        y2[fin] = y[fin]
+        ini = self.tr_ini[k0:] - o0
+        return np.column_stack((
+            np.minimum.reduceat(np.minimum(x, x2), ini),
+            np.minimum.reduceat(np.minimum(y, y2), ini),
+            np.maximum.reduceat(np.maximum(x, x2), ini),
+            np.maximum.reduceat(np.maximum(y, y2), ini)))
+
+    def _particionar(self, solo=None):
+        """Índice invertido elevación -> R-tree de los trozos de ese nivel; con solo, rehace esos niveles"""
+        self.tr_elev = self.alm.elev[self.tr_fid]
+        orden, cajas = self.idx_trozos.ids, self.idx_trozos.niveles[0]
+        e_tr = self.tr_elev[orden]
+        por_elev = np.argsort(e_tr, kind='stable')
+        e_ord = e_tr[por_elev]
+        self.elevs = np.unique(e_ord)
+        lim = np.searchsorted(e_ord, self.elevs, 'left').tolist() + [len(e_ord)]
+        if solo is None:
+            self.por_nivel = {}
+        for k, e in enumerate(self.elevs.tolist()):
+            if solo is None or e in solo:
+                sel = por_elev[lim[k]:lim[k + 1]]
+                self.por_nivel[e] = IndiceSTR(cajas[sel], ids=orden[sel])
+
+    def niveles_entre(self, e_min, e_max):
+        """Elevaciones cargadas dentro de [e_min, e_max]"""
+        i0 = np.searchsorted(self.elevs, e_min, 'left')
+        i1 = np.searchsorted(self.elevs, e_max, 'right')
+        return self.elevs[i0:i1].tolist()
+
+    def __len__(self):
+        return len(self.alm)
+
+    def agregar(self, desde):
+        """
+        Indexa las curvas con fid >= desde, agregadas con AlmacenCurvas.extender.
+        Solo se trozan y encajan las nuevas; los R-tree se reempaquetan con
+        las cajas ya calculadas y de la partición solo los niveles tocados.
+        """
+        tr_fid, tr_ini, tr_fin = self._trozos(desde)
+        cajas = np.empty((len(self.tr_fid), 4))
+        cajas[self.idx_trozos.ids] = self.idx_trozos.niveles[0]
+        self.tr_fid = np.concatenate((self.tr_fid, tr_fid))
+        self.tr_ini = np.concatenate((self.tr_ini, tr_ini))
+        self.tr_fin = np.concatenate((self.tr_fin, tr_fin))
+        self.idx_curvas = IndiceSTR(self.alm.bbox)
+        self.idx_trozos = IndiceSTR(np.concatenate((cajas, self._cajas_trozos(desde))))
+        self._particionar(set(self.alm.elev[desde:].tolist()))
+
+    def asegurar_cobertura(self, x, y, r):
+        """Garantiza curvas cargadas en el cuadrado de semilado r; sin cargador no hace nada"""
+        if self.cargador is not None:
+            self.cargador.cubrir(x - r, y - r, x + r, y + r)
+
+    def intersects(self, rect):
+        ids = self.idx_curvas.intersects(rect)
+        perfil.contar('idx_consultas')
+        perfil.contar('idx_candidatos', len(ids))
+        return ids
+
+    def segmentos(self, x0, y0, x1, y1, elevs=None):
+        """
+        Vértice inicial y curva de los segmentos de trozos que tocan el rectángulo.
+        Con elevs solo se consultan los índices de esos niveles; si son
+        muchos niveles se usa el índice global y se filtra por elevación.
+        """
+        if elevs is None:
+            tr = self.idx_trozos.ids[self.idx_trozos.consultar(x0, y0, x1, y1)]
+        elif len(elevs) > MAX_NIVELES_PARTICION:
+            tr = self.idx_trozos.ids[self.idx_trozos.consultar(x0, y0, x1, y1)]
+            tr = tr[np.isin(self.tr_elev[tr], elevs)]
+        else:
+            partes = [ind.ids[ind.consultar(x0, y0, x1, y1)]
+                      for ind in (self.por_nivel.get(float(e)) for e in elevs) if ind is not None]
+            tr = np.concatenate(partes) if partes else np.zeros(0, dtype=np.int64)
+        segs = rangos(self.tr_ini[tr], self.tr_fin[tr])
+        fids = np.repeat(self.tr_fid[tr], self.tr_fin[tr] - self.tr_ini[tr])
+        perfil.contar('idx_consultas')
+        perfil.contar('idx_candidatos', len(segs))
+        return segs, fids
+
+    def en_radio(self, x, y, r, elevs=None):
+        """Curvas a distancia <= r del punto y su distancia exacta"""
+        segs, fids = self.segmentos(x - r, y - r, x + r, y + r, elevs)
+        if len(segs) == 0:
+            return fids, np.zeros(0)
+        c = self.alm.coords
+        perfil.contar('dist_segmentos', len(segs))
+        d, _, _ = dist_punto_segmentos(x, y, c[segs, 0], c[segs, 1], c[segs + 1, 0], c[segs + 1, 1])
+        fids, d, _ = min_por_grupo(fids, d)
+        sel = d <= r
+        return fids[sel], d[sel]
+
+    def cruzan(self, x0, y0, x1, y1, elevs=None):
+        """Curvas que intersectan el segmento (x0, y0)-(x1, y1)"""
+        segs, fids = self.segmentos(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1), elevs)
+        if len(segs) == 0:
+            return fids
+        c = self.alm.coords
+        perfil.contar('intersec_segmentos', len(segs))
+        hay = segmentos_intersectan(x0, y0, x1, y1, c[segs, 0], c[segs, 1], c[segs + 1, 0], c[segs + 1, 1])
+        return np.unique(fids[hay])
+
+
+class IndiceTraza:
+    """
+    Rejilla incremental de los segmentos de una traza en crecimiento.
+    Cada segmento se registra en las celdas que toca su caja; los muy
+    largos (más de MAX_CELDAS celdas) van a una lista que se prueba siempre.
+    Agregar un punto y consultar un segmento nuevo cuestan O(celdas tocadas),
+    no O(largo de la traza).
+    """
+
+    TAM = 50.0
+    MAX_CELDAS = 64
+
+    def __init__(self, pts=(), tam=TAM):
+        self.tam = tam
+        self.x = []
+        self.y = []
+        self.celdas = {}
+        self.largos = []
+        self.sincronizar(pts)
+
+    def __len__(self):
+        """Número de segmentos"""
+        return max(len(self.x) - 1, 0)
+
+    def _rango(self, x0, y0, x1, y1):
+        t = self.tam
+        return (math.floor(min(x0, x1) / t), math.floor(min(y0, y1) / t),
+                math.floor(max(x0, x1) / t), math.floor(max(y0, y1) / t))
+
+    def agregar(self, x, y):
+        self.x.append(x)
+        self.y.append(y)
+        s = len(self.x) - 2
+        if s < 0:
+            return
+        i0, j0, i1, j1 = self._rango(self.x[s], self.y[s], x, y)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > self.MAX_CELDAS:
+            self.largos.append(s)
+            return
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                self.celdas.setdefault((i, j), []).append(s)
+
+    def sincronizar(self, pts):
+        """Agrega los puntos de pts (QgsPointXY) posteriores a los ya indexados"""
+        for p in pts[len(self.x):]:
+            self.agregar(p.x(), p.y())
+
+    def candidatos(self, x0, y0, x1, y1, hasta=None):
+        """Segmentos (ordenados) cuyas celdas tocan la caja del segmento dado, con id < hasta"""
+        i0, j0, i1, j1 = self._rango(x0, y0, x1, y1)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.celdas):
+            vistos = set(s for (i, j), lst in self.celdas.items()
+                         if i0 <= i <= i1 and j0 <= j <= j1 for s in lst)
+        else:
+            vistos = set()
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    vistos.update(self.celdas.get((i, j), ()))
+        vistos.update(self.largos)
+        segs = np.fromiter(vistos, dtype=np.int64, count=len(vistos))
+        if hasta is not None:
+            segs = segs[segs < hasta]
+        segs.sort()
+        perfil.contar('traza_consultas')
+        perfil.contar('traza_candidatos', len(segs))
+        return segs
+
+    def cruza(self, x0, y0, x1, y1, hasta=None):
+        """Segmentos (ordenados, id < hasta) que intersectan (x0, y0)-(x1, y1)"""
+        segs = self.candidatos(x0, y0, x1, y1, hasta)
+        if len(segs) == 0:
+            return segs
+        ext = segs.tolist()
+        perfil.contar('intersec_segmentos', len(ext))
+        ax = np.array([self.x[s] for s in ext])
+        ay = np.array([self.y[s] for s in ext])
+        bx = np.array([self.x[s + 1] for s in ext])
+        by = np.array([self.y[s + 1] for s in ext])
+        return segs[segmentos_intersectan(x0, y0, x1, y1, ax, ay, bx, by)]
+
+
+def comparar_indices(bbox, n_consultas=1000, radio=250.0, semilla=0):
+    """
+    Tiempos de construcción y consulta: QgsSpatialIndex con addFeature
+    uno a uno (método anterior) frente a IndiceSTR empaquetado.
+    """
+    from qgis.core import QgsSpatialIndex, QgsRectangle
+
+    bbox = np.asarray(bbox, dtype=np.float64).reshape(-1, 4)
+    rng = np.random.default_rng(semilla)
+    cx = rng.uniform(bbox[:, 0].min(), bbox[:, 2].max(), n_consultas)
+    cy = rng.uniform(bbox[:, 1].min(), bbox[:, 3].max(), n_consultas)
+    rects = [QgsRectangle(x - radio, y - radio, x + radio, y + radio) for x, y in zip(cx, cy)]
+
+    t = time.perf_counter()
+    idx_q = QgsSpatialIndex()
+    for fid, (x0, y0, x1, y1) in enumerate(bbox):
+        idx_q.addFeature(fid, QgsRectangle(x0, y0, x1, y1))
+    t_q = time.perf_counter() - t
+
+    t = time.perf_counter()
+    idx_s = IndiceSTR(bbox)
+    t_s = time.perf_counter() - t
+
+    res = {'n': len(bbox), 'consultas': n_consultas}
+    for nom, idx, t_c in (('qgis_addfeature', idx_q, t_q), ('str', idx_s, t_s)):
+        t = time.perf_counter()
+        n_res = sum(len(idx.intersects(r)) for r in rects)
+        res[nom] = {'construccion_s': t_c,
+                    'consulta_ms': (time.perf_counter() - t) * 1000 / max(n_consultas, 1),
+                    'resultados': n_res}
+    return res
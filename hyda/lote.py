@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Delimitación en lote: muchos pares de puntos sobre una misma topografía"""
+
+from qgis.core import QgsPointXY
+import multiprocessing
+import os
+import sys
+import time
+
+from . import registro
+from .memoria_compartida import TopoCompartida, adjuntar
+from .hyda_processor import delimitar_par
+
+
+# Topografía de cada proceso trabajador: vistas sobre la memoria compartida (alm, idx, bloque)
+_TOPO = None
+# Error al adjuntarla; cada trabajo lo relanza para que lo vea el proceso principal
+_ERROR = None
+
+
+def ejecutable_python():
+    """Intérprete para los procesos hijos: dentro de QGIS sys.executable es qgis(.exe)"""
+    exe = sys.executable
+    if os.path.basename(exe).lower().startswith('python'):
+        return exe
+    for cand in (os.path.join(sys.exec_prefix, 'python.exe'),
+                 os.path.join(sys.exec_prefix, 'bin', 'python3')):
+        if os.path.isfile(cand):
+            return cand
+    return None
+
+
+def delimitar_xy(k, xy1, xy2, idx, curvas):
+    """
+    delimitar_par con entrada y salida en tipos simples (serializables entre procesos).
+    Retorna (k, lineas, wkb del polígono o None, segundos, error o None), con
+    lineas = [(vértices xy, elev_inicial, elev_final, longitud, razon, iteraciones)] * 2.
+    """
+    t0 = time.time()
+    try:
+        r1, r2, poly = delimitar_par(QgsPointXY(*xy1), QgsPointXY(*xy2), idx, curvas)
+    except Exception as e:
+        return k, None, None, time.time() - t0, f"{type(e).__name__}: {e}"
+    lineas = [([(p.x(), p.y()) for p in r['puntos']], float(r['elev_inicial']), float(r['elev_final']),
+               float(r['longitud']), r['razon'], int(r['iteraciones'])) for r in (r1, r2)]
+    wkb = bytes(poly.asWkb()) if poly is not None else None
+    return k, lineas, wkb, time.time() - t0, None
+
+
+def _iniciar_trabajador(descriptor):
+    # Una excepción aquí haría que el pool relance el trabajador sin fin
+    global _TOPO, _ERROR
+    try:
+        _TOPO = adjuntar(descriptor)
+    except (OSError, ValueError, KeyError) as e:
+        _TOPO = None
+        _ERROR = f'{type(e).__name__}: {e}'
+
+
+def _trabajo(par):
+    if _TOPO is None:
+        raise RuntimeError(f'No se pudo adjuntar la topografía compartida ({_ERROR})')
+    alm, idx, _ = _TOPO
+    return delimitar_xy(*par, idx, alm)
+
+
+def _avance(feedback, hechos, total):
+    if feedback is not None:
+        feedback.setProgress(100.0 * hechos / max(total, 1))
+
+
+def delimitar_lote(pares, curvas, idx, procesos=1, feedback=None):
+    """
+    Delimita pares [(k, (x1, y1), (x2, y2)), ...] y retorna sus resultados
+    (ver delimitar_xy) en el mismo orden.
+    Con procesos > 1 la topografía se publica una vez en memoria compartida
+    y los pares se reparten en un pool de procesos que la adjuntan sin copiarla
+    (el arranque no depende del tamaño de las curvas); lo que el pool no
+    resuelva (no arranca, no puede adjuntar) se calcula aquí. Un índice con
+    carga bajo demanda (AOI) no se publica: se procesa en este proceso.
+    feedback (QgsFeedback) recibe el progreso; al cancelar se retorna lo hecho.
+    """
+    hechos = {}
+    cancelado = lambda: feedback is not None and feedback.isCanceled()
+
+    exe = ejecutable_python() if procesos > 1 and len(pares) > 1 and idx.cargador is None else None
+    if exe:
+        ctx = multiprocessing.get_context('spawn')
+        ctx.set_executable(exe)
+        try:
+            with TopoCompartida(curvas, idx) as topo, \
+                 ctx.Pool(min(procesos, len(pares)), _iniciar_trabajador, (topo.descriptor,)) as pool:
+                for r in pool.imap_unordered(_trabajo, pares):
+                    hechos[r[0]] = r
+                    _avance(feedback, len(hechos), len(pares))
+                    if cancelado():
+                        break
+        except Exception as e:
+            registro.aviso('Lote: pool de procesos no disponible, %d pares en este proceso (%s)',
+                           len(pares) - len(hechos), e)
+            if feedback is not None:
+                feedback.pushInfo(f"Pool de procesos no disponible ({e}); se continúa en este proceso")
+
+    for k, xy1, xy2 in pares:
+        if cancelado():
+            break
+        if k not in hechos:
+            hechos[k] = delimitar_xy(k, xy1, xy2, idx, curvas)
+            _avance(feedback, len(hechos), len(pares))
+
+    return [hechos[k] for k, _, _ in pares if k in hechos]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Topografía (almacén + índice) en un bloque de memoria compartida para procesos de lote"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .almacen_curvas import AlmacenCurvas, ARREGLOS
+from .indice_espacial import IndiceSegmentos
+
+
+ALINEACION = 64
+
+
+class TopoCompartida:
+    """
+    Copia los arreglos del almacén y del índice una sola vez a un bloque de
+    memoria compartida. descriptor (nombre del bloque y tabla de arreglos)
+    es lo único que viaja a los procesos, que lo abren con adjuntar().
+    Usar como contexto: al salir se cierra y se libera el bloque.
+    """
+
+    def __init__(self, alm, idx):
+        arreglos = alm.arreglos()
+        arreglos.update(idx.arreglos())
+        tabla, pos = [], 0
+        for nom, a in arreglos.items():
+            a = np.asarray(a)
+            tabla.append((nom, a.dtype.str, a.shape, pos))
+            pos += -(-a.nbytes // ALINEACION) * ALINEACION
+        self.shm = shared_memory.SharedMemory(create=True, size=max(pos, 1))
+        for nom, tipo, forma, ini in tabla:
+            np.ndarray(forma, tipo, self.shm.buf, ini)[...] = arreglos[nom]
+        self.descriptor = {'nombre': self.shm.name, 'tabla': tabla}
+        self.nbytes = pos
+
+    def cerrar(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+def adjuntar(descriptor):
+    """
+    Almacén e índice sobre el bloque publicado por TopoCompartida, sin copiar
+    coordenadas ni índices: los arreglos, es_pico y la jerarquía incluidos
+    (vienen calculados en el almacén), son vistas de solo lectura.
+    Retorna (alm, idx, shm); shm debe seguir vivo mientras se usen.
+    """
+    shm = shared_memory.SharedMemory(name=descriptor['nombre'])
+    arreglos = {}
+    for nom, tipo, forma, ini in descriptor['tabla']:
+        a = np.ndarray(forma, tipo, shm.buf, ini)
+        a.flags.writeable = False
+        arreglos[nom] = a
+    alm = AlmacenCurvas.desde_arreglos(arreglos)
+    idx = IndiceSegmentos.desde_arreglos(alm, {nom: a for nom, a in arreglos.items() if nom not in ARREGLOS})
+    return alm, idx, shm
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentación de las rutas críticas: contadores y tiempos por traza.
+
+Desactivada por defecto; con ella apagada cada punto medido cuesta una
+lectura de atributo. Se activa con activar() o con la variable de entorno
+HYDA_PERFIL ('1', o la ruta de un archivo JSON Lines donde volcar un
+registro por traza). Los procesos de lote heredan la variable.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+
+
+VARIABLE = 'HYDA_PERFIL'
+
+ACTIVO = False
+_ruta = None
+_cerrojo = threading.Lock()
+
+
+class Perfil:
+    """Cuentas y tiempos (inclusivos, en segundos) de una traza"""
+
+    __slots__ = ('cuentas', 'tiempos', 'llamadas')
+
+    def __init__(self):
+        self.cuentas = {}
+        self.tiempos = {}
+        self.llamadas = {}
+
+    def contar(self, nombre, n=1):
+        self.cuentas[nombre] = self.cuentas.get(nombre, 0) + n
+
+    def tiempo(self, nombre, s):
+        self.tiempos[nombre] = self.tiempos.get(nombre, 0.0) + s
+        self.llamadas[nombre] = self.llamadas.get(nombre, 0) + 1
+
+    def resumen(self):
+        return {'cuentas': dict(sorted(self.cuentas.items())),
+                'tiempos': {nom: {'llamadas': self.llamadas[nom], 'ms': s * 1000.0}
+                            for nom, s in sorted(self.tiempos.items(), key=lambda x: -x[1])}}
+
+
+class _Estado(threading.local):
+    perfil = None       # Perfil de la traza en curso en este hilo
+
+
+_estado = _Estado()
+
+
+def activar(ruta=None):
+    """Activa la instrumentación; con ruta cada traza agrega una línea JSON al archivo"""
+    global ACTIVO, _ruta
+    ACTIVO = True
+    _ruta = ruta
+    os.environ[VARIABLE] = ruta or '1'
+
+
+def desactivar():
+    global ACTIVO, _ruta
+    ACTIVO = False
+    _ruta = None
+    os.environ.pop(VARIABLE, None)
+
+
+def nuevo():
+    """Perfil para una traza nueva, o None si la instrumentación está apagada"""
+    return Perfil() if ACTIVO else None
+
+
+class en:
+    """
+    Hace de p el perfil en curso del hilo mientras dura el bloque; con
+    nombre también mide el bloque. Con p None no mide nada.
+    """
+
+    __slots__ = ('p', 'nombre', 'ant', 't')
+
+    def __init__(self, p, nombre=None):
+        self.p = p
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.ant = _estado.perfil
+        _estado.perfil = self.p
+        self.t = time.perf_counter()
+        return self.p
+
+    def __exit__(self, *exc):
+        if self.p is not None and self.nombre:
+            self.p.tiempo(self.nombre, time.perf_counter() - self.t)
+        _estado.perfil = self.ant
+
+
+def contar(nombre, n=1):
+    p = _estado.perfil
+    if p is not None:
+        p.contar(nombre, n)
+
+
+def medido(nombre):
+    """Decorador: acumula el tiempo de la función en el perfil en curso, si hay"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            p = _estado.perfil
+            if p is None:
+                return fn(*args, **kwargs)
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                p.tiempo(nombre, time.perf_counter() - t)
+        return envoltura
+    return deco
+
+
+def texto(res, n=4):
+    """Resumen de una línea: las n funciones más lentas y las cuentas"""
+    t = ' | '.join(f"{nom} {v['ms']:.0f}ms/{v['llamadas']}" for nom, v in list(res['tiempos'].items())[:n])
+    c = ' '.join(f"{nom}={v}" for nom, v in res['cuentas'].items())
+    return f"{t} || {c}"
+
+
+def volcar(registro):
+    """Agrega el registro (dict) como una línea JSON al archivo configurado"""
+    if _ruta is None:
+        return
+    linea = json.dumps(registro, ensure_ascii=False, default=str) + '\n'
+    with _cerrojo, open(_ruta, 'a', encoding='utf-8') as f:
+        f.write(linea)
+
+
+_valor = os.environ.get(VARIABLE, '')
+if _valor and _valor != '0':
+    activar(None if _valor == '1' else _valor)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Persistencia de los metadatos de polígonos HYDA en el proyecto QGIS"""
+
+from qgis.core import QgsPointXY
+import base64
+import json
+
+import numpy as np
+
+
+CLAVE_PROY = 'HYDA'
+ENTRADA = 'poly_meta'
+FORMATO = 1
+
+
+def pts_a_b64(pts):
+    """Lista de QgsPointXY a texto base64 de float64 little-endian (x, y, x, y, ...)"""
+    arr = np.array([(p.x(), p.y()) for p in pts], dtype='<f8').reshape(-1, 2)
+    return base64.b64encode(arr.tobytes()).decode('ascii')
+
+
+def b64_a_pts(txt):
+    arr = np.frombuffer(base64.b64decode(txt), dtype='<f8').reshape(-1, 2)
+    return [QgsPointXY(x, y) for x, y in arr.tolist()]
+
+
+def _linea_a_dict(r):
+    d = {k: v for k, v in r.items() if k not in ('puntos', 'punto_final', 'curvas_usadas')}
+    d['puntos'] = pts_a_b64(r['puntos'])
+    d['punto_final'] = [r['punto_final'].x(), r['punto_final'].y()]
+    d['curvas_usadas'] = sorted(int(f) for f in r['curvas_usadas'])
+    return d
+
+
+def _dict_a_linea(d):
+    r = dict(d)
+    r['puntos'] = b64_a_pts(d['puntos'])
+    r['punto_final'] = QgsPointXY(*d['punto_final'])
+    r['curvas_usadas'] = set(d['curvas_usadas'])
+    return r
+
+
+def _json_np(v):
+    """Escalares NumPy (elevaciones, conteos) como tipos de Python"""
+    if isinstance(v, np.generic):
+        return v.item()
+    raise TypeError(f'{type(v).__name__} no serializable')
+
+
+def _poligonos_a_dict(poly_meta):
+    polys = {}
+    for fid, m in poly_meta.items():
+        p = {
+            'ini': pts_a_b64([m['punto1'], m['punto2']]),
+            'aux': pts_a_b64(m['auxiliares']),
+            'con': [{'click': [c['punto_click'].x(), c['punto_click'].y()],
+                     'linea': [c['punto_linea'].x(), c['punto_linea'].y()],
+                     'idx': c['linea_idx']} for c in m.get('conexiones', [])],
+        }
+        traza = m.get('traza')
+        if traza:
+            p['traza'] = {'clave': traza['clave'], 'lineas': [_linea_a_dict(r) for r in traza['lineas']]}
+        polys[str(fid)] = p
+    return polys
+
+
+def _dict_a_poligonos(polys):
+    poly_meta = {}
+    for fid, p in polys.items():
+        ini = b64_a_pts(p['ini'])
+        m = {
+            'punto1': ini[0],
+            'punto2': ini[1],
+            'auxiliares': b64_a_pts(p['aux']),
+            'conexiones': [{'punto_click': QgsPointXY(*c['click']), 'punto_linea': QgsPointXY(*c['linea']),
+                            'linea_idx': c['idx']} for c in p['con']],
+        }
+        if 'traza' in p:
+            m['traza'] = {'clave': p['traza']['clave'],
+                          'lineas': [_dict_a_linea(d) for d in p['traza']['lineas']]}
+        poly_meta[int(fid)] = m
+    return poly_meta
+
+
+def meta_a_json(metas):
+    """
+    Serializa {capa_id: poly_meta}: por polígono, puntos de inicio,
+    auxiliares, conexiones y, si existe, la traza calculada (vértices en
+    base64 y atributos de cada línea). Los fid solo valen en su capa.
+    """
+    capas = {cid: _poligonos_a_dict(m) for cid, m in metas.items() if cid and m}
+    return json.dumps({'formato': FORMATO, 'capas': capas}, separators=(',', ':'), default=_json_np)
+
+
+def json_a_meta(txt):
+    """Inverso de meta_a_json; retorna {capa_id: poly_meta}"""
+    doc = json.loads(txt)
+    if doc.get('formato') != FORMATO:
+        raise ValueError(f"formato {doc.get('formato')}")
+    return {cid: _dict_a_poligonos(polys) for cid, polys in doc['capas'].items()}
+
+
+def guardar_en_proyecto(proyecto, metas):
+    """Escribe {capa_id: poly_meta} como propiedad del proyecto (se guarda con el .qgz)"""
+    proyecto.writeEntry(CLAVE_PROY, ENTRADA, meta_a_json(metas))
+
+
+def leer_de_proyecto(proyecto):
+    """{capa_id: poly_meta} guardados en el proyecto; {} si no hay o no se pueden leer"""
+    txt, ok = proyecto.readEntry(CLAVE_PROY, ENTRADA, '')
+    if not ok or not txt:
+        return {}
+    try:
+        return json_a_meta(txt)
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return {}
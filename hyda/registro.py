@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Registro de mensajes de HYDA: niveles, formato diferido y escritura por lotes.
+
+Los mensajes se guardan en un búfer circular como (nivel, plantilla, args) y
+se formatean recién al vaciarlo. Fuera de un bloque agrupado() se vacía en
+cada mensaje; dentro, al salir del bloque, al llegar a LOTE mensajes o ante
+un mensaje crítico. Los mensajes consecutivos del mismo nivel van a
+QgsMessageLog en una sola llamada.
+
+Los mensajes de DEPURACION (diagnóstico por traza) se descartan sin formatear
+salvo que se pidan: configurar(DEPURACION) o la variable de entorno
+HYDA_REGISTRO=depuracion. HYDA_REGISTRO_ARCHIVO agrega un archivo de salida.
+"""
+
+from qgis.core import QgsMessageLog, Qgis
+import atexit
+import collections
+import os
+import threading
+import time
+import traceback
+
+
+VARIABLE = 'HYDA_REGISTRO'
+VARIABLE_ARCHIVO = 'HYDA_REGISTRO_ARCHIVO'
+ETIQUETA = 'HYDA'
+
+DEPURACION, INFO, AVISO, CRITICO = 10, 20, 30, 40
+NOMBRES = {DEPURACION: 'depuracion', INFO: 'info', AVISO: 'aviso', CRITICO: 'critico'}
+
+CAPACIDAD = 2000    # mensajes retenidos en el búfer; al desbordar se pierden los más viejos
+LOTE = 200          # pendientes que fuerzan el vaciado dentro de un bloque agrupado
+
+
+def nivel_de(nombre):
+    """Nivel desde su nombre ('depuracion', 'info', ...) o número"""
+    nombre = str(nombre).strip().lower()
+    for nivel, nom in NOMBRES.items():
+        if nombre == nom or nombre == str(nivel):
+            return nivel
+    raise ValueError(f'Nivel de registro desconocido: {nombre}')
+
+
+def a_qgis(mensajes):
+    """Destino QgsMessageLog: una llamada por tramo de mensajes del mismo nivel"""
+    qnivel = {DEPURACION: Qgis.Info, INFO: Qgis.Info, AVISO: Qgis.Warning, CRITICO: Qgis.Critical}
+    tramo, actual = [], None
+    for _, nivel, texto in mensajes:
+        if qnivel[nivel] != actual and tramo:
+            QgsMessageLog.logMessage('\n'.join(tramo), ETIQUETA, actual)
+            tramo = []
+        actual = qnivel[nivel]
+        tramo.append(texto)
+    if tramo:
+        QgsMessageLog.logMessage('\n'.join(tramo), ETIQUETA, actual)
+
+
+class a_archivo:
+    """Destino archivo de texto: agrega una línea por mensaje, un open() por lote"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def __call__(self, mensajes):
+        with open(self.ruta, 'a', encoding='utf-8') as f:
+            f.writelines(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))} "
+                         f"{NOMBRES[nivel].upper():10s} {texto}\n" for t, nivel, texto in mensajes)
+
+
+class _Hilo(threading.local):
+    agrupado = 0        # profundidad de bloques agrupado() en este hilo
+
+
+class Registro:
+    """
+    Registro con nivel mínimo, búfer circular y destinos (callables que
+    reciben una lista de (tiempo, nivel, texto)).
+    """
+
+    def __init__(self, nivel=INFO, destinos=None, capacidad=CAPACIDAD, lote=LOTE):
+        self.nivel = nivel
+        self.destinos = [a_qgis] if destinos is None else list(destinos)
+        self.lote = lote
+        self.buf = collections.deque(maxlen=capacidad)
+        self.perdidos = 0
+        self._cerrojo = threading.RLock()
+        self._hilo = _Hilo()
+
+    def activo(self, nivel):
+        """Para evitar cálculos costosos de argumentos que luego se descartarían"""
+        return nivel >= self.nivel
+
+    def registrar(self, nivel, msg, *args):
+        if nivel < self.nivel:
+            return
+        with self._cerrojo:
+            if len(self.buf) == self.buf.maxlen:
+                self.perdidos += 1
+            self.buf.append((time.time(), nivel, msg, args))
+            vaciar = (not self._hilo.agrupado or nivel >= CRITICO or len(self.buf) >= self.lote)
+        if vaciar:
+            self.vaciar()
+
+    def depuracion(self, msg, *args):
+        self.registrar(DEPURACION, msg, *args)
+
+    def info(self, msg, *args):
+        self.registrar(INFO, msg, *args)
+
+    def aviso(self, msg, *args):
+        self.registrar(AVISO, msg, *args)
+
+    def critico(self, msg, *args):
+        self.registrar(CRITICO, msg, *args)
+
+    def excepcion(self, msg, *args):
+        """Mensaje crítico seguido de la traza de la excepción en curso"""
+        self.registrar(CRITICO, '%s\n%s', msg % args if args else msg, traceback.format_exc())
+
+    def vaciar(self):
+        """Formatea lo pendiente y lo entrega a cada destino"""
+        with self._cerrojo:
+            if not self.buf:
+                return
+            pendientes = list(self.buf)
+            self.buf.clear()
+            perdidos, self.perdidos = self.perdidos, 0
+        mensajes = []
+        if perdidos:
+            mensajes.append((pendientes[0][0], AVISO, f'{perdidos} mensajes descartados (búfer lleno)'))
+        for t, nivel, msg, args in pendientes:
+            try:
+                texto = msg % args if args else msg
+            except (TypeError, ValueError) as e:
+                texto = f'{msg!r} {args!r} ({e})'
+            mensajes.append((t, nivel, texto))
+        for destino in self.destinos:
+            try:
+                destino(mensajes)
+            except Exception:
+                # Un destino roto (archivo sin permisos, etc.) no corta el trabajo ni a los demás
+                pass
+
+    def agrupado(self):
+        """Bloque with: los mensajes del hilo se acumulan y se escriben al salir"""
+        return _Agrupado(self)
+
+
+class _Agrupado:
+    __slots__ = ('reg',)
+
+    def __init__(self, reg):
+        self.reg = reg
+
+    def __enter__(self):
+        self.reg._hilo.agrupado += 1
+        return self.reg
+
+    def __exit__(self, *exc):
+        self.reg._hilo.agrupado -= 1
+        if not self.reg._hilo.agrupado:
+            self.reg.vaciar()
+
+
+reg = Registro()
+
+depuracion = reg.depuracion
+info = reg.info
+aviso = reg.aviso
+critico = reg.critico
+excepcion = reg.excepcion
+vaciar = reg.vaciar
+agrupado = reg.agrupado
+activo = reg.activo
+
+
+def configurar(nivel=None, ruta=None):
+    """Nivel mínimo y, con ruta, un archivo de registro además de QgsMessageLog"""
+    reg.vaciar()
+    if nivel is not None:
+        reg.nivel = nivel_de(nivel) if isinstance(nivel, str) else nivel
+    if ruta and not any(isinstance(d, a_archivo) and d.ruta == ruta for d in reg.destinos):
+        reg.destinos.append(a_archivo(ruta))
+
+
+atexit.register(reg.vaciar)
+
+if os.environ.get(VARIABLE) or os.environ.get(VARIABLE_ARCHIVO):
+    try:
+        configurar(os.environ.get(VARIABLE) or None, os.environ.get(VARIABLE_ARCHIVO))
+    except ValueError:
+        pass
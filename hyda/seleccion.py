@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Búsqueda de polígonos bajo el cursor con índice espacial y geometrías preparadas"""
+
+from qgis.core import QgsFeature, QgsFeatureRequest, QgsGeometry, QgsPointXY, QgsRectangle, QgsSpatialIndex
+
+
+class IndicePoligonos:
+    """
+    Polígonos de una capa en un QgsSpatialIndex, para consultas de punto sin
+    recorrer la capa. El índice se arma en la primera consulta; cada geometría
+    se prepara (QgsGeometryEngine) la primera vez que es candidata.
+    Entre conectar() y desconectar() sigue las altas, bajas y cambios de
+    geometría de la capa, también los del búfer de edición.
+    """
+
+    def __init__(self, capa):
+        self.capa = capa
+        self.indice = None
+        self.geoms = {}     # fid -> QgsGeometry (en el SRC de la capa)
+        self.prep = {}      # fid -> motor preparado
+
+    def construir(self):
+        self.indice = QgsSpatialIndex()
+        self.geoms = {}
+        self.prep = {}
+        req = QgsFeatureRequest().setNoAttributes()
+        for f in self.capa.getFeatures(req):
+            self._agregar(f.id(), f.geometry())
+
+    def _agregar(self, fid, geom):
+        if geom is None or geom.isEmpty():
+            return
+        self.geoms[fid] = QgsGeometry(geom)
+        self.indice.addFeature(fid, geom.boundingBox())
+
+    def _quitar(self, fid):
+        geom = self.geoms.pop(fid, None)
+        self.prep.pop(fid, None)
+        if geom is not None:
+            f = QgsFeature(fid)
+            f.setGeometry(geom)
+            self.indice.deleteFeature(f)
+
+    def en_punto(self, x, y):
+        """fid del primer polígono (menor fid) que contiene (x, y), en el SRC de la capa, o None"""
+        if self.indice is None:
+            self.construir()
+        pt = QgsGeometry.fromPointXY(QgsPointXY(x, y))
+        for fid in sorted(self.indice.intersects(QgsRectangle(x, y, x, y))):
+            motor = self.prep.get(fid)
+            if motor is None:
+                motor = QgsGeometry.createGeometryEngine(self.geoms[fid].constGet())
+                motor.prepareGeometry()
+                self.prep[fid] = motor
+            if motor.contains(pt.constGet()):
+                return fid
+        return None
+
+    def geometria(self, fid):
+        return self.geoms.get(fid)
+
+    # Señales de la capa; sin índice armado no hay nada que actualizar
+
+    def conectar(self):
+        self.capa.featureAdded.connect(self.al_agregar)
+        self.capa.featureDeleted.connect(self.al_borrar)
+        self.capa.geometryChanged.connect(self.al_cambiar)
+        self.capa.committedFeaturesAdded.connect(self.al_confirmar)
+        self.capa.afterRollBack.connect(self.invalidar)
+
+    def desconectar(self):
+        for senal, slot in ((self.capa.featureAdded, self.al_agregar),
+                            (self.capa.featureDeleted, self.al_borrar),
+                            (self.capa.geometryChanged, self.al_cambiar),
+                            (self.capa.committedFeaturesAdded, self.al_confirmar),
+                            (self.capa.afterRollBack, self.invalidar)):
+            try:
+                senal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass
+
+    def al_agregar(self, fid):
+        if self.indice is not None:
+            self._agregar(fid, self.capa.getFeature(fid).geometry())
+
+    def al_borrar(self, fid):
+        if self.indice is not None:
+            self._quitar(fid)
+
+    def al_cambiar(self, fid, geom):
+        if self.indice is not None:
+            self._quitar(fid)
+            self._agregar(fid, geom)
+
+    def al_confirmar(self, capa_id, feats):
+        """Al confirmar la edición las entidades nuevas dejan su fid temporal (negativo)"""
+        if self.indice is None:
+            return
+        for fid in [fid for fid in self.geoms if fid < 0]:
+            self._quitar(fid)
+        for f in feats:
+            self._agregar(f.id(), f.geometry())
+
+    def invalidar(self):
+        self.indice = None
+        self.geoms = {}
+        self.prep = {}
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""Servicio de delimitación sin interfaz (dock, Processing y línea de comandos)"""
+
+from qgis.core import (QgsCoordinateTransform, QgsFeature, QgsFeatureRequest, QgsField, QgsFields,
+                       QgsGeometry, QgsPointXY, QgsProject, QgsWkbTypes)
+from qgis.PyQt.QtCore import QVariant
+import csv
+
+from . import perfil, registro
+from .cache_topo import clave_cache, dir_cache_defecto
+from .carga_topo import cargar_topologia
+from .hyda_processor import procesar_par, procesar_desde_auxiliar, crear_poligono_cuenca
+
+
+class ServicioHYDA:
+    """
+    Orquestación de una delimitación sobre una topografía ya cargada:
+    trazado de ambas divisorias con sus puntos auxiliares, polígono de la
+    cuenca y escritura en la capa de salida. No usa iface, lienzo ni diálogos.
+    """
+
+    def __init__(self, curvas, idx, version=None, crs=None):
+        self.curvas = curvas
+        self.idx = idx
+        self.version = version
+        self.crs = crs
+
+    @classmethod
+    def desde_capa(cls, capa, campo, dir_cache=None, feedback=None, rango=None):
+        """
+        Carga la topografía de capa en el hilo actual, con caché en disco si la
+        fuente lo admite; rango (e_min, e_max) filtra las curvas en el proveedor.
+        """
+        clave = clave_cache(capa, campo, rango)
+        dir_c = (dir_cache or dir_cache_defecto(capa)) if clave else None
+        alm, idx, info = cargar_topologia(capa, campo, clave, dir_c, feedback, capa.featureCount(), capa.fields(),
+                                          rango)
+        serv = cls(alm, idx, info['version'], capa.crs())
+        serv.info = info
+        serv.clave = clave
+        return serv
+
+    def trazar(self, pts_ini, pts_aux=(), vigia=None):
+        """
+        Divisorias desde los dos puntos de inicio, recortadas en su cruce, y
+        extendidas desde cada punto auxiliar por la línea que termina más cerca.
+        vigia(num, pts, previos=()) se llama tras cada paso de trazado con los
+        vértices de la línea num (previos: los que ya tenía antes de extenderse
+        desde un auxiliar); puede cortar el trazado con TrazadoCancelado.
+        Retorna (res, pt_cruce).
+        """
+        registro.depuracion("Proc L1 + L2")
+        r1, r2, pt_cruce = procesar_par(pts_ini[0], pts_ini[1], self.idx, self.curvas, vigia=vigia)
+        res = [r1, r2]
+        for r in res:
+            registro.depuracion("L%d: %s→%sm | %.2fkm | Pts:%d | It:%d | %s", r['numero'], r['elev_inicial'],
+                                r['elev_final'], r['longitud'] / 1000, r['num_puntos'], r['iteraciones'], r['razon'])
+            if r.get('perfil'):
+                registro.info("L%d perfil: %s", r['numero'], perfil.texto(r['perfil']))
+
+        if pt_cruce:
+            registro.depuracion("✂ Cruce detectado - L1: %d pts | L2: %d pts", len(r1['puntos']), len(r2['puntos']))
+        else:
+            registro.aviso("⚠ No se detectó cruce entre líneas")
+
+        if len(pts_aux) > 0:
+            registro.depuracion("Eval pto aux")
+
+        for pt_aux in pts_aux:
+            lin_c = None
+            d_min = float('inf')
+            idx_lin = -1
+
+            for i, r in enumerate(res):
+                if len(r['puntos']) < 2:
+                    continue
+                d = r['punto_final'].distance(pt_aux)
+                if d < d_min:
+                    d_min = d
+                    lin_c = r
+                    idx_lin = i
+
+            if lin_c is None:
+                continue
+
+            otra_pts = res[1]['puntos'] if idx_lin == 0 else res[0]['puntos']
+            registro.depuracion("L#%d cerc aux (%.1fm)", lin_c['numero'], d_min)
+            lin_c['puntos'].append(pt_aux)
+            self.extender_desde_auxiliar(lin_c, pt_aux, otra_pts, vigia)
+
+        return res, pt_cruce
+
+    def extender_desde_auxiliar(self, lin_c, pt_aux, otra_pts, vigia=None):
+        """Continúa lin_c (que ya termina en pt_aux) con la metodología de auxiliar"""
+        v = None
+        if vigia is not None:
+            num, previos = lin_c['numero'], lin_c['puntos']
+            v = lambda _, pts: vigia(num, pts, previos)
+        r_cont = procesar_desde_auxiliar(pt_aux, self.idx, self.curvas,
+            lin_c['elev_final'], lin_c['curvas_usadas'], otra_pts, v)
+
+        if len(r_cont['puntos']) > 1:
+            lin_c['puntos'].extend(r_cont['puntos'][1:])
+            lin_c['elev_final'] = r_cont['elev_final']
+            lin_c['ganancia'] = lin_c['elev_final'] - lin_c['elev_inicial']
+            lin_c['num_puntos'] = len(lin_c['puntos'])
+            lin_c['salto_auxiliar'] = True
+            lin_c['razon'] = r_cont['razon']
+            lin_c['punto_final'] = r_cont['puntos'][-1] if r_cont['puntos'] else pt_aux
+            lin_c['longitud'] = QgsGeometry.fromPolylineXY(lin_c['puntos']).length()
+            registro.depuracion("✓ Ext: %s→%sm", r_cont['elev_inicial'], r_cont['elev_final'])
+        else:
+            lin_c['salto_auxiliar'] = False
+            registro.aviso("⚠ Sin curvas desde aux")
+
+    def poligono(self, res):
+        if len(res) < 2:
+            return None
+        return crear_poligono_cuenca(res[0]['puntos'], res[1]['puntos'])
+
+    def agregar_poligono(self, capa_d, poly_g):
+        """
+        Agrega la cuenca a capa_d (reproyectada desde self.crs, con Area_m2)
+        y confirma la edición. Retorna el FID nuevo o None.
+        """
+        area_m2 = int(poly_g.area())
+
+        try:
+            if self.crs is not None and self.crs.isValid() and capa_d.crs().isValid() \
+            and self.crs != capa_d.crs():
+                tr = QgsCoordinateTransform(self.crs, capa_d.crs(), QgsProject.instance())
+                poly_g.transform(tr)
+        except Exception as e:
+            registro.aviso("Adv reproyec: %s", e)
+
+        if capa_d.fields().indexOf('Area_m2') == -1:
+            capa_d.dataProvider().addAttributes([QgsField('Area_m2', QVariant.Int)])  # Int en vez de Double
+            capa_d.updateFields()
+
+        feat = QgsFeature(capa_d.fields())
+        feat.setGeometry(poly_g)
+        if capa_d.fields().indexOf('Area_m2') != -1:
+            feat['Area_m2'] = area_m2
+
+        capa_d.startEditing()
+        if not capa_d.addFeature(feat):
+            capa_d.rollBack()
+            registro.aviso("No se pudo agregar poly")
+            return None
+        if not capa_d.commitChanges():
+            registro.aviso("Error commitChanges")
+            return None
+        capa_d.triggerRepaint()
+
+        req = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setNoAttributes()
+        fids = [f.id() for f in capa_d.getFeatures(req)]
+        return max(fids) if fids else None
+
+    def actualizar_poligono(self, capa_d, fid, poly_g):
+        """Reemplaza geometría y Area_m2 del polígono fid; True si se confirmó"""
+        capa_d.startEditing()
+
+        feat = capa_d.getFeature(fid)
+        if not feat.isValid():
+            capa_d.rollBack()
+            return False
+
+        capa_d.changeGeometry(fid, poly_g)
+
+        area_m2 = int(poly_g.area())
+        if capa_d.fields().indexOf('Area_m2') != -1:
+            capa_d.changeAttributeValue(fid, capa_d.fields().indexOf('Area_m2'), area_m2)
+
+        if capa_d.commitChanges():
+            capa_d.triggerRepaint()
+            registro.info("✓ Poly %s actualizado | Área: %d m²", fid, area_m2)
+            return True
+        capa_d.rollBack()
+        return False
+
+
+def pares_de_fuente(fuente, campo_par=None, tr=None):
+    """
+    Pares de puntos de inicio de una capa o fuente de entidades, en el SRC de
+    las curvas (tr). Líneas: primer y último vértice; puntos: dos entidades
+    con el mismo valor de campo_par.
+    Retorna ([(k, (x1, y1), (x2, y2))], ids de par, {id: n puntos} omitidos).
+    """
+    lineas = QgsWkbTypes.geometryType(fuente.wkbType()) == QgsWkbTypes.LineGeometry
+    if not lineas and not campo_par:
+        raise ValueError('Con una capa de puntos se requiere el campo de par')
+
+    grupos = {}
+    for f in fuente.getFeatures():
+        g = f.geometry()
+        if g.isEmpty():
+            continue
+        if tr is not None:
+            g.transform(tr)
+        v = [(p.x(), p.y()) for p in g.vertices()]
+        if lineas:
+            grupos[str(f.id())] = [v[0], v[-1]]
+        else:
+            grupos.setdefault(str(f[campo_par]), []).append(v[0])
+    return _agrupar_pares(grupos)
+
+
+def pares_de_csv(ruta):
+    """
+    Pares de un CSV con columnas x1, y1, x2, y2 (SRC de las curvas) y
+    opcionalmente par; sin par se usa el número de fila. Un par repetido
+    es un error: cada fila ya trae los dos puntos.
+    """
+    grupos, filas = {}, {}
+    with open(ruta, newline='', encoding='utf-8-sig') as f:
+        for n, fila in enumerate(csv.DictReader(f), 1):
+            par = fila.get('par') or str(n)
+            if par in filas:
+                raise ValueError(f"{ruta}: par '{par}' repetido en las filas {filas[par]} y {n}")
+            filas[par] = n
+            grupos[par] = [(float(fila['x1']), float(fila['y1'])), (float(fila['x2']), float(fila['y2']))]
+    return _agrupar_pares(grupos)
+
+
+def _agrupar_pares(grupos):
+    pares, ids, omitidos = [], [], {}
+    for par, xy in grupos.items():
+        if len(xy) != 2:
+            omitidos[par] = len(xy)
+            continue
+        pares.append((len(pares), xy[0], xy[1]))
+        ids.append(par)
+    return pares, ids, omitidos
+
+
+def campos_cuenca():
+    campos = QgsFields()
+    for nom, tipo in (('par', QVariant.String), ('area_m2', QVariant.Double), ('t_s', QVariant.Double),
+                      ('razon_1', QVariant.String), ('razon_2', QVariant.String),
+                      ('elev_fin_1', QVariant.Double), ('elev_fin_2', QVariant.Double)):
+        campos.append(QgsField(nom, tipo))
+    return campos
+
+
+def campos_divisoria():
+    campos = QgsFields()
+    for nom, tipo in (('par', QVariant.String), ('linea', QVariant.Int), ('elev_ini', QVariant.Double),
+                      ('elev_fin', QVariant.Double), ('longitud', QVariant.Double),
+                      ('razon', QVariant.String), ('iteraciones', QVariant.Int), ('t_s', QVariant.Double)):
+        campos.append(QgsField(nom, tipo))
+    return campos
+
+
+def entidades_lote(resultados, ids):
+    """
+    Entidades de cuencas (MultiPolygon) y divisorias a partir de los
+    resultados de lote.delimitar_lote. Retorna (cuencas, divisorias, errores).
+    """
+    campos_p, campos_l = campos_cuenca(), campos_divisoria()
+    feats_p, feats_l, errores = [], [], []
+    for k, lineas, wkb, t, error in resultados:
+        if error:
+            errores.append((ids[k], error))
+            continue
+        for n, (xy, e_ini, e_fin, largo, razon, it) in enumerate(lineas, 1):
+            f = QgsFeature(campos_l)
+            f.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in xy]))
+            f.setAttributes([ids[k], n, e_ini, e_fin, largo, razon, it, t])
+            feats_l.append(f)
+        if wkb is None:
+            continue
+        g = QgsGeometry()
+        g.fromWkb(wkb)
+        g.convertToMultiType()
+        f = QgsFeature(campos_p)
+        f.setGeometry(g)
+        f.setAttributes([ids[k], g.area(), t, lineas[0][4], lineas[1][4], lineas[0][2], lineas[1][2]])
+        feats_p.append(f)
+    return feats_p, feats_l, errores
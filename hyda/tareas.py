@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Tareas en segundo plano (QgsTask)"""
+
+from qgis.core import QgsTask, QgsVectorLayerFeatureSource
+from qgis.PyQt.QtCore import pyqtSignal
+import threading
+import time
+import traceback
+
+from . import registro
+from .cache_topo import clave_cache
+from .carga_topo import cargar_topologia, CargaCancelada
+from .aoi import CargaAOI
+from .hyda_processor import TrazadoCancelado
+
+
+class TareaCargaTopo(QgsTask):
+    """
+    Carga curvas, índice y anidamiento fuera del hilo de la interfaz.
+    Todo lo que toca la capa (fuente, conteo, clave de caché) se resuelve en
+    __init__, en el hilo principal; run() solo usa la copia de la fuente.
+    al_terminar(tarea) se llama en el hilo principal con resultado o error.
+    Con aoi (x0, y0, x1, y1) solo se carga esa área y el almacén crece
+    después bajo demanda (aoi.CargaAOI), sin caché en disco.
+    """
+
+    def __init__(self, capa, campo, dir_cache, al_terminar, aoi=None, rango=None):
+        super().__init__(f"HYDA: cargando {capa.name()}", QgsTask.CanCancel)
+        self.fuente = QgsVectorLayerFeatureSource(capa)
+        self.campo = campo
+        self.campos = capa.fields()
+        self.rango = rango
+        self.total = capa.featureCount()
+        self.clave = clave_cache(capa, campo, rango) if dir_cache else None
+        self.dir_cache = dir_cache
+        self.al_terminar = al_terminar
+        self.aoi = aoi
+        self.resultado = None
+        self.error = None
+
+    def run(self):
+        try:
+            if self.aoi is not None:
+                carga = CargaAOI(self.fuente, self.campo, campos=self.campos, rango=self.rango)
+                self.resultado = carga.iniciar(self.aoi, self)
+            else:
+                self.resultado = cargar_topologia(self.fuente, self.campo, self.clave,
+                                                  self.dir_cache, self, self.total,
+                                                  self.campos, self.rango)
+        except CargaCancelada:
+            return False
+        except Exception:
+            self.error = traceback.format_exc()
+            return False
+        return True
+
+    def finished(self, ok):
+        self.al_terminar(self)
+
+
+class TareaTrazado(QgsTask):
+    """
+    Trazado de divisorias fuera del hilo de la interfaz. trabajo(vigia) hace
+    el cálculo (ServicioHYDA.trazar o extender_desde_auxiliar) y no debe tocar
+    capas ni el lienzo; la escritura en la capa de salida queda para
+    al_terminar(tarea), que se llama en el hilo principal.
+    Mientras avanza emite 'parcial' (número de línea, vértices) cada
+    INTERVALO segundos por línea, para la vista previa en el lienzo.
+    Las tareas de trazado corren de a una: una nueva espera a que termine la
+    cancelada (la carga por área de interés amplía el almacén compartido).
+    """
+
+    INTERVALO = 0.1
+    _en_curso = threading.Lock()
+
+    parcial = pyqtSignal(int, list)
+
+    def __init__(self, descripcion, trabajo, al_terminar):
+        super().__init__(f"HYDA: {descripcion}", QgsTask.CanCancel)
+        self.trabajo = trabajo
+        self.al_terminar = al_terminar
+        self.ultimo = {}
+        self.resultado = None
+        self.error = None
+
+    def vigia(self, num, pts, previos=()):
+        """Llamado tras cada paso de trazado, en el hilo de la tarea"""
+        if self.isCanceled():
+            raise TrazadoCancelado()
+        t = time.monotonic()
+        if num is None or t - self.ultimo.get(num, 0.0) < self.INTERVALO:
+            return
+        self.ultimo[num] = t
+        # Copia: la lista de la traza sigue creciendo en este hilo
+        self.parcial.emit(num, list(previos) + pts[1:] if previos else list(pts))
+
+    def run(self):
+        try:
+            with TareaTrazado._en_curso, registro.agrupado():
+                if self.isCanceled():
+                    return False
+                self.resultado = self.trabajo(self.vigia)
+        except TrazadoCancelado:
+            return False
+        except Exception:
+            self.error = traceback.format_exc()
+            return False
+        return True
+
+    def finished(self, ok):
+        self.al_terminar(self)
@@ -0,0 +1,72 @@
+# coding=utf-8
+"""Almacén columnar de curvas test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import unittest
+
+import numpy as np
+
+from ..almacen_curvas import ConstructorAlmacen
+
+
+def cuadrado(x, y, lado):
+    return [(x, y), (x + lado, y), (x + lado, y + lado), (x, y + lado), (x, y)]
+
+
+class AlmacenCurvasTest(unittest.TestCase):
+    """Test contour store arrays and dict compatibility."""
+
+    def setUp(self):
+        """Runs before each test."""
+        cons = ConstructorAlmacen()
+        cons.agregar(100, cuadrado(0, 0, 10), 7)
+        cons.agregar(101, [(0, 20), (30, 20), (30, 40)], 8)
+        self.alm = cons.terminar()
+
+    def test_arreglos(self):
+        """Offsets, bbox, closed flag and centroid are computed per part."""
+        self.assertEqual(len(self.alm), 2)
+        self.assertEqual(list(self.alm.offsets), [0, 5, 8])
+        self.assertEqual(list(self.alm.bbox[1]), [0, 20, 30, 40])
+        self.assertEqual(list(self.alm.cerrada), [True, False])
+        np.testing.assert_allclose(self.alm.centro[0], [5, 5])
+        np.testing.assert_allclose(self.alm.centro[1], [21, 24])
+        self.assertEqual(list(self.alm.origen), [7, 8])
+
+    def test_vista_dict(self):
+        """Store items behave like the old contour dicts."""
+        c = self.alm[1]
+        self.assertEqual(c['elevation'], 101.0)
+        self.assertIn('es_pico', c)
+        self.assertFalse(c['es_pico'])
+        self.assertNotIn(2, self.alm)
+
+    def test_geometria(self):
+        """Geometries are built on demand from the coordinate buffer."""
+        g = self.alm.geometria(1)
+        self.assertAlmostEqual(g.length(), 50.0)
+        self.assertIs(self.alm[1]['geometry'], g)
+
+    def test_distancias(self):
+        """Distances and closest points for several contours in one pass."""
+        d, qx, qy = self.alm.distancias(35, 30, [1, 0, 1])
+        np.testing.assert_allclose(d, [5, np.hypot(25, 20), 5])
+        np.testing.assert_allclose(qx, [30, 10, 30])
+        np.testing.assert_allclose(qy, [30, 10, 30])
+        self.assertEqual(len(self.alm.distancias(0, 0, [])[0]), 0)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(AlmacenCurvasTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,60 @@
+# coding=utf-8
+"""Anidamiento de curvas cerradas test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import unittest
+
+from ..almacen_curvas import ConstructorAlmacen
+from ..anidamiento import construir_anidamiento, punto_en_poligono
+from ..indice_espacial import IndiceSegmentos
+
+
+def cuadrado(x, y, lado):
+    return [(x, y), (x + lado, y), (x + lado, y + lado), (x, y + lado), (x, y)]
+
+
+class AnidamientoTest(unittest.TestCase):
+    """Test containment hierarchy and precomputed peak flags."""
+
+    def setUp(self):
+        """Runs before each test."""
+        cons = ConstructorAlmacen()
+        cons.agregar(100, cuadrado(0, 0, 100))      # 0: base
+        cons.agregar(101, cuadrado(10, 10, 30))     # 1: cima A
+        cons.agregar(101, cuadrado(50, 50, 40))     # 2: contiene a 3
+        cons.agregar(102, cuadrado(60, 60, 10))     # 3: cima B
+        cons.agregar(99, [(-50, -50), (200, -50)])  # 4: abierta
+        self.alm = cons.terminar()
+        construir_anidamiento(self.alm, IndiceSegmentos(self.alm))
+
+    def test_jerarquia(self):
+        """Each closed contour gets its smallest enclosing closed contour."""
+        self.assertEqual(self.alm.padre.tolist(), [-1, 0, 0, 2, -1])
+        self.assertEqual(sorted(self.alm.hijos_de(0).tolist()), [1, 2])
+        self.assertEqual(self.alm.hijos_de(2).tolist(), [3])
+
+    def test_picos(self):
+        """Only closed contours without a higher contour inside are peaks."""
+        self.assertEqual(self.alm.es_pico.tolist(), [0, 1, 0, 1, 0])
+
+    def test_punto_en_poligono(self):
+        """Even-odd test on a square ring."""
+        anillo = self.alm.vertices(0)
+        self.assertEqual(punto_en_poligono([50, 150, -1], [50, 50, 50], anillo).tolist(),
+                         [True, False, False])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(AnidamientoTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,130 @@
+# coding=utf-8
+"""Carga por área de interés test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import unittest
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY
+
+from ..aoi import CargaAOI
+from ..anidamiento import construir_anidamiento
+from ..indice_espacial import IndiceSegmentos
+
+
+class FuenteRect(object):
+    """Fuente que respeta setFilterRect por bbox, como los proveedores"""
+
+    def __init__(self, lineas):
+        self.feats = []
+        for i, (elev, xy) in enumerate(lineas):
+            f = QgsFeature()
+            f.setId(i)
+            f.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in xy]))
+            f['elev'] = elev
+            self.feats.append((f, min(x for x, _ in xy), min(y for _, y in xy),
+                               max(x for x, _ in xy), max(y for _, y in xy)))
+
+    def getFeatures(self, peticion=None):
+        r = peticion.filterRect()
+        for f, x0, y0, x1, y1 in self.feats:
+            if r.isEmpty() or (x0 <= r.xMaximum() and x1 >= r.xMinimum() and
+                               y0 <= r.yMaximum() and y1 >= r.yMinimum()):
+                yield f
+
+
+class FuenteVertices(FuenteRect):
+    """Devuelve solo las entidades con algún vértice en el rectángulo, no por bbox"""
+
+    def __init__(self, lineas):
+        super().__init__(lineas)
+        self.lineas = lineas
+
+    def getFeatures(self, peticion=None):
+        r = peticion.filterRect()
+        for (f, *_), (_, xy) in zip(self.feats, self.lineas):
+            if r.isEmpty() or any(r.xMinimum() <= x <= r.xMaximum() and r.yMinimum() <= y <= r.yMaximum()
+                                  for x, y in xy):
+                yield f
+
+
+class CargaAOITest(unittest.TestCase):
+    """Test tile loading, on-demand growth and closed-contour completion."""
+
+    def setUp(self):
+        """Runs before each test."""
+        # Tramos horizontales cada 100 m a lo largo de 5 km
+        lineas = [(100, [(x, 50), (x + 90, 50)]) for x in range(0, 5000, 100)]
+        # Cerrada grande (sale del área inicial) con una cima dentro, lejos
+        lineas.append((200, [(0, 200), (3000, 200), (3000, 900), (0, 900), (0, 200)]))
+        lineas.append((210, [(2500, 500), (2600, 500), (2600, 600), (2500, 600), (2500, 500)]))
+        self.fuente = FuenteRect(lineas)
+
+    def test_iniciar(self):
+        """Solo se leen las teselas del área y las de las cerradas que salen de ella."""
+        carga = CargaAOI(self.fuente, 'elev', tam=500.0)
+        alm, idx, info = carga.iniciar((0, 0, 400, 400))
+        origen = set(alm.origen.tolist())
+        self.assertIn(50, origen)
+        self.assertIn(51, origen)
+        self.assertNotIn(49, origen)
+        self.assertEqual(len(origen), len(alm))
+        # La cerrada grande no es pico: contiene a la 210
+        grande = alm.origen.tolist().index(50)
+        self.assertEqual(alm.es_pico[grande], 0)
+
+    def test_asegurar_cobertura(self):
+        """El almacén crece sin duplicar entidades ni cambiar los fid."""
+        carga = CargaAOI(self.fuente, 'elev', tam=500.0)
+        alm, idx, _ = carga.iniciar((0, 0, 400, 100))
+        antes = alm.origen.copy()
+        idx.asegurar_cobertura(4500, 50, 100)
+        self.assertEqual(alm.origen[:len(antes)].tolist(), antes.tolist())
+        self.assertEqual(len(set(alm.origen.tolist())), len(alm))
+        fids, _ = idx.en_radio(4505, 50, 10)
+        self.assertEqual(alm.origen[fids].tolist(), [45])
+        n = carga.n_lecturas
+        idx.asegurar_cobertura(4500, 50, 100)
+        self.assertEqual(carga.n_lecturas, n)
+
+    def test_incremental(self):
+        """Crecer por teselas deja índice y jerarquía iguales a rehacerlos con todo lo cargado."""
+        def anillo(cx, cy, r):
+            lado = [(cx - r + k * 10, cy - r) for k in range(r // 5)]
+            return (lado + [(cx + r, y) for _, y in lado] +
+                    [(cx + r - k * 10, cy + r) for k in range(r // 5)] +
+                    [(cx - r, cy + r - k * 10) for k in range(r // 5)] + [(cx - r, cy - r)])
+        lineas = [(100, [(x + k, 50) for k in range(0, 100, 10)]) for x in range(0, 5000, 100)]
+        # Anillos anidados; con filtro por vértices el que envuelve llega después que sus hijos
+        lineas += [(200, anillo(2500, 1000, 900)), (210, anillo(2500, 1000, 300)), (220, anillo(2500, 1000, 50))]
+        carga = CargaAOI(FuenteVertices(lineas), 'elev', tam=100.0)
+        alm, idx, _ = carga.iniciar((2450, 950, 2550, 1050))
+        for x, y in ((2500, 1000), (2800, 1000), (1600, 1000), (4500, 50)):
+            idx.asegurar_cobertura(x, y, 50)
+            ref = IndiceSegmentos(alm)
+            for nom in ('tr_fid', 'tr_ini', 'tr_fin', 'tr_elev', 'elevs'):
+                self.assertEqual(getattr(idx, nom).tolist(), getattr(ref, nom).tolist())
+            self.assertEqual(idx.idx_trozos.niveles[0].tolist(), ref.idx_trozos.niveles[0].tolist())
+            for e in ref.elevs.tolist():
+                self.assertEqual(idx.por_nivel[e].ids.tolist(), ref.por_nivel[e].ids.tolist())
+            antes = {nom: getattr(alm, nom).tolist() for nom in ('padre', 'hijos', 'hijos_off', 'es_pico')}
+            construir_anidamiento(alm, ref)
+            for nom, v in antes.items():
+                self.assertEqual(v, getattr(alm, nom).tolist(), nom)
+        orig = alm.origen.tolist()
+        self.assertEqual(alm.padre[orig.index(51)], orig.index(50))
+        self.assertEqual(alm.padre[orig.index(52)], orig.index(51))
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(CargaAOITest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,72 @@
+# coding=utf-8
+"""Benchmark terrain and comparison test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import unittest
+
+import numpy as np
+
+from ..benchmark import terreno
+from ..benchmark.medir import comparar
+
+
+class TerrenoTest(unittest.TestCase):
+    """Test marching squares contours and result comparison."""
+
+    def test_cono(self):
+        """Un cono da un solo anillo cerrado, antihorario, al radio esperado."""
+        x = np.arange(41.0)
+        X, Y = np.meshgrid(x, x)
+        z = 100 - np.hypot(X - 20.3, Y - 19.7)
+        coords, offsets = terreno.curvas_nivel(z, 90.0, 1.0)
+        self.assertEqual(len(offsets), 2)
+        self.assertEqual(coords[0].tolist(), coords[-1].tolist())
+        r = np.hypot(coords[:, 0] - 20.3, coords[:, 1] - 19.7)
+        self.assertTrue(np.all(np.abs(r - 10.0) < 0.02))
+        # Lo que está sobre el nivel queda a la izquierda: área con signo positiva
+        area = 0.5 * np.sum(coords[:-1, 0] * coords[1:, 1] - coords[1:, 0] * coords[:-1, 1])
+        self.assertAlmostEqual(area, np.pi * 100, delta=2.0)
+
+    def test_silla(self):
+        """Terreno con sillas: partes válidas en niveles enteros, sin depender del bloque de filas."""
+        z = terreno.grilla('sillas', 3, 1)
+        alm = terreno.curvas(z)
+        self.assertGreater(len(alm), 0)
+        self.assertTrue(np.all(np.diff(alm.offsets) >= 2))
+        self.assertTrue(np.all(alm.elev == np.round(alm.elev)))
+        # Por bloques de filas o de una vez, el resultado es el mismo
+        bloque = terreno.FILAS_BLOQUE
+        terreno.FILAS_BLOQUE = 5
+        try:
+            alm_b = terreno.curvas(z)
+        finally:
+            terreno.FILAS_BLOQUE = bloque
+        self.assertEqual(alm_b.coords.tolist(), alm.coords.tolist())
+
+    def test_comparar(self):
+        """Se informan las medidas más lentas que la tolerancia y las huellas distintas."""
+        def doc(ms, puntos):
+            return {'casos': [{'terreno': 'cerros', 'partes_objetivo': 1000, 'semilla': 0,
+                               'funciones': {'procesar_par': {'n': 5, 'media_ms': ms}},
+                               'huella': {'puntos': puntos}}]}
+        lentas, huellas = comparar(doc(10.0, 5), doc(11.0, 5))
+        self.assertEqual((lentas, huellas), ([], []))
+        lentas, huellas = comparar(doc(10.0, 5), doc(20.0, 6))
+        self.assertEqual([l[3] for l in lentas], ['procesar_par'])
+        self.assertEqual(huellas, [('cerros', 1000, 0)])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TerrenoTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,107 @@
+# coding=utf-8
+"""Carga de topografía test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import os
+import tempfile
+import unittest
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY
+
+from ..cache_topo import clave_cache, archivo_cache, digest
+from ..carga_topo import cargar_topologia, CargaCancelada, peticion_curvas
+
+
+class FuenteLista(object):
+    """Fuente mínima con getFeatures(), como QgsVectorLayerFeatureSource"""
+
+    def __init__(self, n):
+        self.feats = []
+        for i in range(n):
+            f = QgsFeature()
+            f.setId(i)
+            f.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(0, i), QgsPointXY(10, i)]))
+            f['elev'] = 100 + i
+            self.feats.append(f)
+
+    def getFeatures(self, *args):
+        return iter(self.feats)
+
+
+class CapaArchivo(object):
+    """Capa mínima de archivo para clave_cache"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def providerType(self):
+        return 'ogr'
+
+    def source(self):
+        return self.ruta
+
+
+class Feedback(object):
+
+    def __init__(self, cancelar_en=None):
+        self.cancelar_en = cancelar_en
+        self.progreso = []
+
+    def setProgress(self, p):
+        self.progreso.append(p)
+
+    def isCanceled(self):
+        return self.cancelar_en is not None and len(self.progreso) >= self.cancelar_en
+
+
+class CargaTopoTest(unittest.TestCase):
+    """Test progress reporting and cancellation of topography loading."""
+
+    def test_progreso(self):
+        """Progreso monótono hasta 100."""
+        fb = Feedback()
+        alm, idx, info = cargar_topologia(FuenteLista(2500), 'elev', feedback=fb, total=2500)
+        self.assertEqual(len(alm), 2500)
+        self.assertEqual(fb.progreso[-1], 100)
+        self.assertEqual(fb.progreso, sorted(fb.progreso))
+
+    def test_cancelar(self):
+        """Cancelar corta la carga con CargaCancelada."""
+        with self.assertRaises(CargaCancelada):
+            cargar_topologia(FuenteLista(2500), 'elev', feedback=Feedback(2), total=2500)
+
+    def test_peticion(self):
+        """Rango de elevación como expresión del proveedor y filas por segundo."""
+        peticion = peticion_curvas('cota', rango=(100, 200))
+        self.assertIn('"cota" >= 100.0', peticion.filterExpression().expression())
+        _, _, info = cargar_topologia(FuenteLista(10), 'elev')
+        self.assertEqual(info['filas'], 10)
+        self.assertIn('filas_s', info)
+
+    def test_clave_rango(self):
+        """El rango de elevación forma parte de la clave y del archivo de caché."""
+        with tempfile.TemporaryDirectory() as d:
+            ruta = os.path.join(d, 'curvas.gpkg')
+            open(ruta, 'wb').close()
+            capa = CapaArchivo(ruta)
+            todo, filtro = clave_cache(capa, 'elev'), clave_cache(capa, 'elev', (100, 200))
+            self.assertEqual(filtro['rango'], [100.0, 200.0])
+            self.assertNotEqual(digest(todo), digest(filtro))
+            self.assertNotEqual(archivo_cache(todo, d), archivo_cache(filtro, d))
+            self.assertEqual(archivo_cache(filtro, d), archivo_cache(clave_cache(capa, 'elev', (100.0, 200.0)), d))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(CargaTopoTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,134 @@
+# coding=utf-8
+"""Índice espacial STR test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import unittest
+
+import numpy as np
+
+from ..almacen_curvas import ConstructorAlmacen
+from ..geometria_np import segmentos_intersectan
+from ..indice_espacial import IndiceSTR, IndiceSegmentos, IndiceTraza, comparar_indices
+
+
+class IndiceSTRTest(unittest.TestCase):
+    """Test packed R-tree queries against brute force."""
+
+    def setUp(self):
+        """Runs before each test."""
+        rng = np.random.default_rng(0)
+        xy = rng.uniform(0, 1000, (3000, 2))
+        self.bbox = np.column_stack((xy, xy + rng.uniform(0, 40, (3000, 2))))
+        self.idx = IndiceSTR(self.bbox)
+
+    def fuerza_bruta(self, x0, y0, x1, y1):
+        b = self.bbox
+        sel = (b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)
+        return np.nonzero(sel)[0].tolist()
+
+    def test_intersects(self):
+        """Rectangle queries return the same ids as a full scan."""
+        for rect in ((0, 0, 100, 100), (500, 480, 520, 900), (-10, -10, -5, -5), (0, 0, 1e4, 1e4)):
+            self.assertEqual(sorted(self.idx.intersects(rect)), self.fuerza_bruta(*rect))
+
+    def test_arreglos(self):
+        """The index round-trips through its flat arrays."""
+        arr = self.idx.arreglos()
+        otro = IndiceSTR.desde_arreglos(arr)
+        rect = (200, 200, 400, 300)
+        self.assertEqual(sorted(otro.intersects(rect)), self.fuerza_bruta(*rect))
+
+    def test_comparar_indices(self):
+        """QgsSpatialIndex and the packed index find the same candidates."""
+        res = comparar_indices(self.bbox, n_consultas=200, radio=30.0)
+        self.assertEqual((res['n'], res['consultas']), (3000, 200))
+        self.assertGreater(res['str']['resultados'], 0)
+        self.assertEqual(res['str']['resultados'], res['qgis_addfeature']['resultados'])
+
+
+class IndiceSegmentosTest(unittest.TestCase):
+    """Test segment chunk index radius and crossing queries."""
+
+    def setUp(self):
+        """Runs before each test."""
+        rng = np.random.default_rng(1)
+        cons = ConstructorAlmacen()
+        for k in range(40):
+            t = np.linspace(0, 2 * np.pi, int(rng.integers(3, 200)))
+            r = rng.uniform(5, 80)
+            cx, cy = rng.uniform(0, 500, 2)
+            cons.agregar(k, np.column_stack((cx + r * np.cos(t), cy + r * np.sin(t))))
+        self.alm = cons.terminar()
+        self.idx = IndiceSegmentos(self.alm, largo=8)
+
+    def dist_curva(self, fid, x, y):
+        v = self.alm.vertices(fid)
+        a, b = v[:-1], v[1:]
+        ab = b - a
+        t = np.clip(((x - a[:, 0]) * ab[:, 0] + (y - a[:, 1]) * ab[:, 1]) / (ab ** 2).sum(1), 0, 1)
+        return np.hypot(a[:, 0] + t * ab[:, 0] - x, a[:, 1] + t * ab[:, 1] - y).min()
+
+    def test_en_radio(self):
+        """Radius queries match exact per-contour distances."""
+        for x, y, r in ((250, 250, 60), (10, 400, 100), (600, 600, 5)):
+            ids, d = self.idx.en_radio(x, y, r)
+            esperado = {f: self.dist_curva(f, x, y) for f in self.alm}
+            esperado = {f: v for f, v in esperado.items() if v <= r}
+            self.assertEqual(sorted(ids.tolist()), sorted(esperado))
+            for f, v in zip(ids.tolist(), d.tolist()):
+                self.assertAlmostEqual(v, esperado[f])
+
+    def test_por_nivel(self):
+        """Level-restricted queries equal global queries filtered by elevation."""
+        ids, d = self.idx.en_radio(250, 250, 150)
+        for elevs in ([3.0, 4.0], self.idx.niveles_entre(0, 30), [99.0]):
+            ids_n, d_n = self.idx.en_radio(250, 250, 150, elevs)
+            sel = np.isin(self.alm.elev[ids], elevs)
+            self.assertEqual(sorted(ids_n.tolist()), sorted(ids[sel].tolist()))
+
+    def test_cruzan(self):
+        """Crossing queries match a scan over every segment."""
+        for seg in ((0, 0, 500, 500), (100, 300, 400, 310), (-10, -10, -5, -5)):
+            esperado = []
+            for f in self.alm:
+                v = self.alm.vertices(f)
+                if segmentos_intersectan(*seg, v[:-1, 0], v[:-1, 1], v[1:, 0], v[1:, 1]).any():
+                    esperado.append(f)
+            self.assertEqual(self.idx.cruzan(*seg).tolist(), esperado)
+
+
+class IndiceTrazaTest(unittest.TestCase):
+    """Test the growing trace index against a scan over earlier segments."""
+
+    def test_cruza(self):
+        """Cada segmento nuevo encuentra los mismos cruces que el recorrido completo."""
+        rng = np.random.default_rng(2)
+        # Paseo aleatorio con pasos cortos y algunos muy largos
+        pasos = rng.normal(0, 30, (400, 2))
+        pasos[::50] *= 40
+        xy = np.cumsum(pasos, axis=0)
+        ind = IndiceTraza(tam=25.0)
+        for k in range(len(xy) - 1):
+            ind.agregar(*xy[k])
+            (x0, y0), (x1, y1) = xy[k], xy[k + 1]
+            a, b = xy[:k], xy[1:k + 1]
+            esperado = np.flatnonzero(segmentos_intersectan(x0, y0, x1, y1, a[:, 0], a[:, 1], b[:, 0], b[:, 1]))
+            self.assertEqual(ind.cruza(x0, y0, x1, y1).tolist(), esperado.tolist())
+            self.assertEqual(ind.cruza(x0, y0, x1, y1, k - 1).tolist(), esperado[esperado < k - 1].tolist())
+        self.assertEqual(len(ind), len(xy) - 2)
+        self.assertTrue(ind.largos)
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(IndiceSTRTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,84 @@
+# coding=utf-8
+"""Delimitación en lote test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import unittest
+
+from qgis.core import QgsPointXY
+
+from ..almacen_curvas import ConstructorAlmacen
+from ..anidamiento import construir_anidamiento
+from ..indice_espacial import IndiceSegmentos
+from ..hyda_processor import procesar_par
+from .. import lote
+from ..lote import delimitar_lote
+
+
+def cuadrado(c, r):
+    return [(c - r, c - r), (c + r, c - r), (c + r, c + r), (c - r, c + r), (c - r, c - r)]
+
+
+class Cancelar(object):
+
+    def setProgress(self, p):
+        pass
+
+    def isCanceled(self):
+        return True
+
+
+class LoteTest(unittest.TestCase):
+    """Test batch delineation results against single-pair tracing."""
+
+    def setUp(self):
+        """Runs before each test."""
+        # Cerro de cuadrados concéntricos: 10 m de desnivel cada 30 m
+        cons = ConstructorAlmacen()
+        for k in range(10):
+            cons.agregar(100 + 10 * k, cuadrado(500, 300 - 30 * k))
+        self.alm = cons.terminar()
+        self.idx = IndiceSegmentos(self.alm)
+        construir_anidamiento(self.alm, self.idx)
+        self.pares = [(0, (205, 400), (205, 600)), (1, (795, 500), (500, 795)), (2, (5000, 0), (5010, 0))]
+
+    def test_secuencial(self):
+        """Cada resultado coincide con procesar_par y se retorna en orden."""
+        res = delimitar_lote(self.pares, self.alm, self.idx)
+        self.assertEqual([r[0] for r in res], [0, 1, 2])
+        for (k, xy1, xy2), (_, lineas, wkb, t, error) in zip(self.pares, res):
+            self.assertIsNone(error)
+            r1, r2, _ = procesar_par(QgsPointXY(*xy1), QgsPointXY(*xy2), self.idx, self.alm)
+            self.assertEqual(lineas[0][0], [(p.x(), p.y()) for p in r1['puntos']])
+            self.assertEqual((lineas[1][4], lineas[1][2]), (r2['razon'], r2['elev_final']))
+        # Lejos de las curvas: sin elevación inicial ni polígono
+        self.assertEqual(res[2][1][0][4], 'sin_elev_ini')
+        self.assertIsNone(res[2][2])
+
+    def test_cancelar(self):
+        """Cancelado antes de empezar no calcula nada."""
+        self.assertEqual(delimitar_lote(self.pares, self.alm, self.idx, feedback=Cancelar()), [])
+
+    def test_trabajador_sin_topo(self):
+        """Un trabajador que no pudo adjuntar la topografía falla en cada trabajo, no retorna vacío."""
+        lote._iniciar_trabajador({'nombre': 'hyda_no_existe', 'tabla': []})
+        try:
+            with self.assertRaisesRegex(RuntimeError, 'FileNotFoundError'):
+                lote._trabajo(self.pares[0])
+        finally:
+            lote._TOPO = lote._ERROR = None
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(LoteTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
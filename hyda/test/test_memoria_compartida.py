@@ -0,0 +1,61 @@
+# coding=utf-8
+"""Memoria compartida test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import unittest
+
+import numpy as np
+
+from ..almacen_curvas import ConstructorAlmacen
+from ..indice_espacial import IndiceSegmentos
+from ..memoria_compartida import TopoCompartida, adjuntar
+
+
+class MemoriaCompartidaTest(unittest.TestCase):
+    """Test publishing the contour store and index to shared memory."""
+
+    def setUp(self):
+        """Runs before each test."""
+        rng = np.random.default_rng(3)
+        cons = ConstructorAlmacen()
+        for k in range(60):
+            t = np.linspace(0, 2 * np.pi, int(rng.integers(3, 120)))
+            r = rng.uniform(5, 80)
+            cx, cy = rng.uniform(0, 500, 2)
+            cons.agregar(k % 7, np.column_stack((cx + r * np.cos(t), cy + r * np.sin(t))))
+        self.alm = cons.terminar()
+        self.idx = IndiceSegmentos(self.alm, largo=8)
+
+    def test_adjuntar(self):
+        """Las vistas adjuntadas responden igual que el original y son de solo lectura."""
+        with TopoCompartida(self.alm, self.idx) as topo:
+            alm, idx, shm = adjuntar(topo.descriptor)
+            self.assertEqual(alm.coords.tolist(), self.alm.coords.tolist())
+            self.assertFalse(alm.coords.flags.writeable)
+            self.assertEqual(sorted(idx.por_nivel), sorted(self.idx.por_nivel))
+            for elevs in (None, [2.0, 5.0]):
+                ids, d = idx.en_radio(250, 250, 150, elevs)
+                ids_o, d_o = self.idx.en_radio(250, 250, 150, elevs)
+                self.assertEqual(sorted(ids.tolist()), sorted(ids_o.tolist()))
+            self.assertEqual(idx.cruzan(0, 0, 500, 500).tolist(), self.idx.cruzan(0, 0, 500, 500).tolist())
+            # es_pico viene calculado y también se comparte sin copia
+            self.assertEqual(alm.es_pico.tolist(), self.alm.es_pico.tolist())
+            self.assertFalse(alm.es_pico.flags.writeable)
+            del alm, idx
+            shm.close()
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(MemoriaCompartidaTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,81 @@
+# coding=utf-8
+"""Perfil (instrumentation) test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import json
+import os
+import tempfile
+import unittest
+
+from qgis.core import QgsPointXY
+
+from .. import perfil
+from ..almacen_curvas import ConstructorAlmacen
+from ..anidamiento import construir_anidamiento
+from ..indice_espacial import IndiceSegmentos
+from ..hyda_processor import procesar_divisoria_individual, procesar_par
+
+
+def cuadrado(c, r):
+    return [(c - r, c - r), (c + r, c - r), (c + r, c + r), (c - r, c + r), (c - r, c - r)]
+
+
+class PerfilTest(unittest.TestCase):
+    """Test per-trace counters and timers."""
+
+    def setUp(self):
+        """Runs before each test."""
+        cons = ConstructorAlmacen()
+        for k in range(10):
+            cons.agregar(100 + k, cuadrado(500, 300 - 30 * k))
+        self.alm = cons.terminar()
+        self.idx = IndiceSegmentos(self.alm)
+        construir_anidamiento(self.alm, self.idx)
+
+    def tearDown(self):
+        """Runs after each test."""
+        perfil.desactivar()
+
+    def test_apagado(self):
+        """Sin activar no hay perfil en el resultado."""
+        r = procesar_divisoria_individual(QgsPointXY(205, 400), self.idx, self.alm, 1, [], None)
+        self.assertIsNone(r['perfil'])
+
+    def test_traza(self):
+        """Cuentas y tiempos por traza en el resultado y en el archivo de volcado."""
+        fd, ruta = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        try:
+            perfil.activar(ruta)
+            r = procesar_divisoria_individual(QgsPointXY(205, 400), self.idx, self.alm, 1, [], None)
+            r1, r2, _ = procesar_par(QgsPointXY(205, 400), QgsPointXY(205, 600), self.idx, self.alm,
+                                     simultaneo=True)
+            with open(ruta, encoding='utf-8') as f:
+                lineas = [json.loads(l) for l in f]
+        finally:
+            os.remove(ruta)
+        p = r['perfil']
+        self.assertEqual(p['tiempos']['paso']['llamadas'], r['iteraciones'])
+        self.assertEqual(p['tiempos']['elevacion_inicial']['llamadas'], 1)
+        self.assertGreater(p['cuentas']['idx_consultas'], 0)
+        self.assertGreater(p['cuentas']['dist_segmentos'], 0)
+        # Cada traza del par con su propio perfil
+        self.assertIn('cruce_par', r1['perfil']['tiempos'])
+        self.assertEqual([(l['numero'], l['razon']) for l in lineas],
+                         [(1, r['razon']), (1, r1['razon']), (2, r2['razon'])])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(PerfilTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
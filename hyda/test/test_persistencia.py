@@ -0,0 +1,99 @@
+# coding=utf-8
+"""Persistencia de metadatos en el proyecto test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import unittest
+
+import numpy as np
+
+from qgis.core import QgsPointXY
+
+from ..persistencia import meta_a_json, json_a_meta, guardar_en_proyecto, leer_de_proyecto
+
+
+class ProyectoDict(object):
+    """Propiedades de proyecto en memoria, como QgsProject.writeEntry/readEntry"""
+
+    def __init__(self):
+        self.entradas = {}
+
+    def writeEntry(self, alcance, clave, valor):
+        self.entradas[(alcance, clave)] = valor
+        return True
+
+    def readEntry(self, alcance, clave, defecto=''):
+        if (alcance, clave) in self.entradas:
+            return self.entradas[(alcance, clave)], True
+        return defecto, False
+
+
+def xy(pts):
+    return [(p.x(), p.y()) for p in pts]
+
+
+class PersistenciaTest(unittest.TestCase):
+    """Test polygon metadata round-trip through project properties."""
+
+    def setUp(self):
+        """Runs before each test."""
+        pts = [QgsPointXY(1000.125 + k, 2000.5 - k / 3) for k in range(50)]
+        linea = {'puntos': pts, 'numero': 1, 'elev_inicial': np.float64(101.0), 'elev_final': 180.0,
+                 'ganancia': 79.0, 'longitud': 812.5, 'num_puntos': 50, 'num_curvas': np.int64(3),
+                 'picos': 0, 'iteraciones': 40, 'razon': 'sin_curvas', 'punto_final': pts[-1],
+                 'curvas_usadas': {7, 3, 12}, 'salto_auxiliar': False}
+        self.meta = {5: {
+            'punto1': QgsPointXY(1, 2), 'punto2': QgsPointXY(3, 4),
+            'auxiliares': [QgsPointXY(5, 6)],
+            'conexiones': [{'punto_click': QgsPointXY(7, 8), 'punto_linea': QgsPointXY(9, 10), 'linea_idx': 1}],
+            'traza': {'clave': ['v1', [[1, 2], [3, 4]], [[5, 6]]], 'lineas': [linea, dict(linea, numero=2)]},
+        }}
+
+    def test_ida_vuelta(self):
+        """Puntos, conexiones y trazas se recuperan exactos."""
+        metas = json_a_meta(meta_a_json({'capa_1': self.meta}))
+        self.assertEqual(list(metas), ['capa_1'])
+        m, o = metas['capa_1'][5], self.meta[5]
+        self.assertEqual(xy([m['punto1'], m['punto2']]), [(1, 2), (3, 4)])
+        self.assertEqual(xy(m['auxiliares']), [(5, 6)])
+        self.assertEqual(m['conexiones'][0]['linea_idx'], 1)
+        self.assertEqual(m['traza']['clave'], o['traza']['clave'])
+        r = m['traza']['lineas'][1]
+        self.assertEqual(xy(r['puntos']), xy(o['traza']['lineas'][1]['puntos']))
+        self.assertEqual(r['curvas_usadas'], {3, 7, 12})
+        self.assertEqual((r['numero'], r['razon'], r['num_curvas']), (2, 'sin_curvas', 3))
+
+    def test_proyecto(self):
+        """Sin entrada o con texto inválido no hay metadatos."""
+        proy = ProyectoDict()
+        self.assertEqual(leer_de_proyecto(proy), {})
+        guardar_en_proyecto(proy, {'capa_1': self.meta})
+        self.assertEqual(list(leer_de_proyecto(proy)['capa_1']), [5])
+        # Vértices compactos: 50 puntos en ~1 kB por línea
+        self.assertLess(len(proy.entradas[('HYDA', 'poly_meta')]), 3000)
+        proy.writeEntry('HYDA', 'poly_meta', '{no json')
+        self.assertEqual(leer_de_proyecto(proy), {})
+
+    def test_capas(self):
+        """Los fid de cada capa destino no se mezclan."""
+        otro = {5: dict(self.meta[5], auxiliares=[]), 8: dict(self.meta[5])}
+        metas = json_a_meta(meta_a_json({'capa_1': self.meta, 'capa_2': otro, 'capa_3': {}}))
+        self.assertEqual(sorted(metas), ['capa_1', 'capa_2'])
+        self.assertEqual(len(metas['capa_1'][5]['auxiliares']), 1)
+        self.assertEqual(metas['capa_2'][5]['auxiliares'], [])
+        self.assertEqual(sorted(metas['capa_2']), [5, 8])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(PersistenciaTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,98 @@
+# coding=utf-8
+"""Registro (buffered logger) test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import os
+import tempfile
+import unittest
+
+from ..registro import Registro, a_archivo, DEPURACION, INFO, AVISO, CRITICO
+
+
+class Costoso(object):
+    """Argumento que cuenta cuántas veces se formatea"""
+
+    def __init__(self):
+        self.n = 0
+
+    def __str__(self):
+        self.n += 1
+        return 'x'
+
+
+class RegistroTest(unittest.TestCase):
+    """Test level gating, lazy formatting and batched flushing."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.lotes = []
+        self.reg = Registro(INFO, [self.lotes.append], capacidad=5, lote=3)
+
+    def textos(self):
+        return [[(nivel, texto) for _, nivel, texto in lote] for lote in self.lotes]
+
+    def test_nivel(self):
+        """Bajo el nivel mínimo no se guarda ni se formatea; fuera de un bloque se escribe enseguida."""
+        c = Costoso()
+        self.reg.depuracion('no %s', c)
+        self.reg.info('a %d', 1)
+        self.assertEqual(c.n, 0)
+        self.assertEqual(self.textos(), [[(INFO, 'a 1')]])
+        self.assertFalse(self.reg.activo(DEPURACION))
+
+    def test_agrupado(self):
+        """En un bloque se formatea al vaciar, por lotes, y un crítico vacía enseguida."""
+        c = Costoso()
+        with self.reg.agrupado():
+            self.reg.info('a %s', c)
+            self.reg.aviso('b')
+            self.assertEqual((self.lotes, c.n), ([], 0))
+            self.reg.info('c')
+            self.reg.info('d')
+            self.reg.critico('e')
+            self.reg.info('f')
+        self.assertEqual(self.textos(), [[(INFO, 'a x'), (AVISO, 'b'), (INFO, 'c')],
+                                         [(INFO, 'd'), (CRITICO, 'e')], [(INFO, 'f')]])
+
+    def test_desborde(self):
+        """Con el búfer lleno se pierden los más viejos y se avisa cuántos."""
+        self.reg.lote = 100
+        with self.reg.agrupado():
+            for k in range(7):
+                self.reg.info('m%d', k)
+        lote = self.textos()[0]
+        self.assertEqual(lote[0], (AVISO, '2 mensajes descartados (búfer lleno)'))
+        self.assertEqual([t for _, t in lote[1:]], ['m2', 'm3', 'm4', 'm5', 'm6'])
+
+    def test_archivo(self):
+        """El destino archivo escribe una línea por mensaje."""
+        fd, ruta = tempfile.mkstemp(suffix='.log')
+        os.close(fd)
+        try:
+            reg = Registro(DEPURACION, [a_archivo(ruta)])
+            with reg.agrupado():
+                reg.depuracion('L%d: %s', 1, 'max_iter')
+                reg.aviso('sin cruce')
+            with open(ruta, encoding='utf-8') as f:
+                lineas = f.read().splitlines()
+        finally:
+            os.remove(ruta)
+        self.assertEqual(len(lineas), 2)
+        self.assertTrue(lineas[0].endswith('DEPURACION L1: max_iter'))
+        self.assertIn('AVISO', lineas[1])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(RegistroTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,135 @@
+# coding=utf-8
+"""Polygon pick index test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import unittest
+
+import numpy as np
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY
+
+from ..seleccion import IndicePoligonos
+
+
+class Senal(object):
+    """Señal mínima: connect / disconnect / emit"""
+
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, f):
+        self.slots.append(f)
+
+    def disconnect(self, f):
+        self.slots.remove(f)
+
+    def emit(self, *args):
+        for f in list(self.slots):
+            f(*args)
+
+
+class CapaFija(object):
+    """Capa de polígonos en memoria con las señales que usa IndicePoligonos"""
+
+    def __init__(self):
+        self.geoms = {}
+        self.lecturas = 0
+        for nom in ('featureAdded', 'featureDeleted', 'geometryChanged', 'committedFeaturesAdded', 'afterRollBack'):
+            setattr(self, nom, Senal())
+
+    def feature(self, fid):
+        f = QgsFeature(fid)
+        f.setGeometry(self.geoms[fid])
+        return f
+
+    def getFeatures(self, req=None):
+        self.lecturas += 1
+        return [self.feature(fid) for fid in sorted(self.geoms)]
+
+    def getFeature(self, fid):
+        return self.feature(fid)
+
+    def agregar(self, fid, geom):
+        self.geoms[fid] = geom
+        self.featureAdded.emit(fid)
+
+    def borrar(self, fid):
+        del self.geoms[fid]
+        self.featureDeleted.emit(fid)
+
+    def cambiar(self, fid, geom):
+        self.geoms[fid] = geom
+        self.geometryChanged.emit(fid, geom)
+
+    def confirmar(self):
+        """Como commitChanges: los fid temporales (negativos) pasan a definitivos"""
+        nuevas = []
+        for fid in sorted(f for f in self.geoms if f < 0):
+            nuevo = max(self.geoms) + 1
+            self.geoms[nuevo] = self.geoms.pop(fid)
+            nuevas.append(self.feature(nuevo))
+        self.committedFeaturesAdded.emit('capa', nuevas)
+
+
+def cuadrado(x, y, r):
+    return QgsGeometry.fromPolygonXY([[QgsPointXY(x - r, y - r), QgsPointXY(x + r, y - r), QgsPointXY(x + r, y + r),
+                                       QgsPointXY(x - r, y + r), QgsPointXY(x - r, y - r)]])
+
+
+class IndicePoligonosTest(unittest.TestCase):
+    """Test point queries against a full scan while the layer changes."""
+
+    def setUp(self):
+        """Runs before each test."""
+        rng = np.random.default_rng(5)
+        self.capa = CapaFija()
+        for fid in range(60):
+            x, y = rng.uniform(0, 1000, 2)
+            self.capa.geoms[fid] = cuadrado(x, y, rng.uniform(10, 80))
+        self.pts = rng.uniform(-50, 1050, (300, 2))
+
+    def recorrido(self, x, y):
+        pt = QgsGeometry.fromPointXY(QgsPointXY(x, y))
+        return next((fid for fid in sorted(self.capa.geoms) if self.capa.geoms[fid].contains(pt)), None)
+
+    def comprobar(self, ind):
+        for x, y in self.pts.tolist():
+            self.assertEqual(ind.en_punto(x, y), self.recorrido(x, y))
+
+    def test_consulta(self):
+        """Mismo resultado que recorrer la capa, leyéndola una sola vez."""
+        ind = IndicePoligonos(self.capa)
+        self.comprobar(ind)
+        self.assertEqual(self.capa.lecturas, 1)
+
+    def test_senales(self):
+        """Altas, bajas, cambios y confirmación de la edición sin releer la capa."""
+        ind = IndicePoligonos(self.capa)
+        ind.conectar()
+        ind.en_punto(0, 0)
+        self.capa.borrar(3)
+        self.capa.cambiar(7, cuadrado(500, 500, 200))
+        self.capa.agregar(-1, cuadrado(100, 900, 150))
+        self.comprobar(ind)
+        self.capa.confirmar()
+        self.assertNotIn(-1, ind.geoms)
+        self.comprobar(ind)
+        self.assertEqual(self.capa.lecturas, 1)
+        ind.desconectar()
+        self.assertEqual(self.capa.featureAdded.slots, [])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(IndicePoligonosTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
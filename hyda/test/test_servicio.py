@@ -0,0 +1,96 @@
+# coding=utf-8
+"""Servicio de delimitación test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import os
+import tempfile
+import unittest
+
+from qgis.core import QgsPointXY
+
+from ..almacen_curvas import ConstructorAlmacen
+from ..anidamiento import construir_anidamiento
+from ..hyda_processor import TrazadoCancelado
+from ..indice_espacial import IndiceSegmentos
+from ..servicio import ServicioHYDA, pares_de_csv, _agrupar_pares
+
+
+class ServicioTest(unittest.TestCase):
+    """Test reading start point pairs for headless runs."""
+
+    def test_csv(self):
+        """Columnas x1, y1, x2, y2; sin columna par se usa el número de fila."""
+        fd, ruta = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write('x1,y1,x2,y2\n205,400,205,600\n795.5,500,500,795\n')
+        try:
+            pares, ids, omitidos = pares_de_csv(ruta)
+        finally:
+            os.remove(ruta)
+        self.assertEqual(pares, [(0, (205.0, 400.0), (205.0, 600.0)), (1, (795.5, 500.0), (500.0, 795.0))])
+        self.assertEqual(ids, ['1', '2'])
+        self.assertEqual(omitidos, {})
+
+    def test_csv_repetido(self):
+        """Un valor de par repetido es un error que nombra el par, no una fila que pisa a otra."""
+        fd, ruta = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write('par,x1,y1,x2,y2\na,0,0,1,1\nb,2,2,3,3\na,4,4,5,5\n')
+        try:
+            with self.assertRaisesRegex(ValueError, "par 'a' repetido en las filas 1 y 3"):
+                pares_de_csv(ruta)
+        finally:
+            os.remove(ruta)
+
+    def test_omitidos(self):
+        """Grupos que no tienen exactamente dos puntos se omiten."""
+        pares, ids, omitidos = _agrupar_pares({'a': [(0, 0), (1, 1)], 'b': [(2, 2)], 'c': [(0, 0)] * 3})
+        self.assertEqual(pares, [(0, (0, 0), (1, 1))])
+        self.assertEqual(ids, ['a'])
+        self.assertEqual(omitidos, {'b': 1, 'c': 3})
+
+    def servicio(self):
+        cons = ConstructorAlmacen()
+        for k in range(10):
+            r = 300 - 30 * k
+            cons.agregar(100 + k, [(500 - r, 500 - r), (500 + r, 500 - r), (500 + r, 500 + r),
+                                   (500 - r, 500 + r), (500 - r, 500 - r)])
+        alm = cons.terminar()
+        idx = IndiceSegmentos(alm)
+        construir_anidamiento(alm, idx)
+        return ServicioHYDA(alm, idx)
+
+    def test_vigia(self):
+        """El vigía ve crecer ambas líneas sin cambiar el resultado, y puede cortar el trazado."""
+        serv = self.servicio()
+        pts = [QgsPointXY(205, 400), QgsPointXY(205, 600)]
+        vistos = []
+        res, _ = serv.trazar(pts, vigia=lambda num, p, previos=(): vistos.append((num, len(p))))
+        ref, _ = serv.trazar(pts)
+        self.assertEqual([[(q.x(), q.y()) for q in r['puntos']] for r in res],
+                         [[(q.x(), q.y()) for q in r['puntos']] for r in ref])
+        self.assertEqual({n for n, _ in vistos}, {1, 2})
+        for num in (1, 2):
+            largos = [k for n, k in vistos if n == num]
+            self.assertEqual(largos, sorted(largos))
+
+        def cortar(num, p, previos=()):
+            raise TrazadoCancelado()
+        with self.assertRaises(TrazadoCancelado):
+            serv.trazar(pts, vigia=cortar)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ServicioTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,203 @@
+# coding=utf-8
+"""Trazado simultáneo de divisorias test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import unittest
+
+import numpy as np
+
+from qgis.core import QgsPointXY
+
+from ..almacen_curvas import ConstructorAlmacen
+from ..anidamiento import construir_anidamiento
+from ..benchmark import terreno
+from ..benchmark.medir import pares_prueba
+from ..hyda_processor import (trazar_par, recortar_lineas_en_cruce, contar_menores, pto_salida_cresta,
+                              clave_traza, copiar_lineas, procesar_par, elevacion_inicial, TrazaDivisoria)
+from ..indice_espacial import IndiceTraza, IndiceSegmentos
+
+
+class TrazaFija(object):
+    """Traza que recorre una polilínea dada, un vértice por paso"""
+
+    def __init__(self, xy):
+        self.resto = [QgsPointXY(x, y) for x, y in xy]
+        self.pts = [self.resto.pop(0)]
+        self.ind_pts = IndiceTraza(self.pts)
+        self.perfil = None
+        self.terminada = False
+        self.pasos = 0
+
+    def paso(self):
+        if self.terminada:
+            return False
+        self.pasos += 1
+        self.pts.append(self.resto.pop(0))
+        self.terminada = not self.resto
+        return not self.terminada
+
+    def cortar(self, i, p):
+        self.pts = self.pts[:i + 1] + [p]
+        self.terminada = True
+
+
+def xy(pts):
+    return [(p.x(), p.y()) for p in pts]
+
+
+class TrazarParTest(unittest.TestCase):
+    """Test lockstep tracing against trace-then-trim."""
+
+    def test_corte_temprano(self):
+        """Dos líneas que se cruzan pronto y siguen: se detienen al cruzarse."""
+        l1 = [(0, 0)] + [(10 * k, 10 * k) for k in range(1, 60)]
+        l2 = [(20, 0)] + [(20 - 10 * k, 10 * k) for k in range(1, 60)]
+        t1, t2 = TrazaFija(l1), TrazaFija(l2)
+        pc = trazar_par(t1, t2)
+        r1, r2, rc = recortar_lineas_en_cruce([QgsPointXY(*p) for p in l1], [QgsPointXY(*p) for p in l2])
+        self.assertEqual(xy(t1.pts), xy(r1))
+        self.assertEqual(xy(t2.pts), xy(r2))
+        self.assertEqual((pc.x(), pc.y()), (10, 10))
+        self.assertLess(t1.pasos + t2.pasos, 10)
+
+    def test_sin_cruce(self):
+        """Sin cruce ambas trazas se completan y no se recortan."""
+        t1 = TrazaFija([(0, 0), (0, 10), (0, 20)])
+        t2 = TrazaFija([(5, 0), (5, 10)])
+        self.assertIsNone(trazar_par(t1, t2))
+        self.assertEqual(len(t1.pts), 3)
+        self.assertEqual(len(t2.pts), 2)
+
+    def test_cruce_mas_cercano(self):
+        """Entre varios cruces gana el de menor distancia total, aunque aparezca después."""
+        l1 = [(0, 0), (100, 0), (100, 5), (-50, 5)]
+        l2 = [(90, -10), (90, 10), (3, 10), (3, -10)]
+        t1, t2 = TrazaFija(l1), TrazaFija(l2)
+        trazar_par(t1, t2)
+        r1, r2, rc = recortar_lineas_en_cruce([QgsPointXY(*p) for p in l1], [QgsPointXY(*p) for p in l2])
+        self.assertEqual(xy(t1.pts), xy(r1))
+        self.assertEqual(xy(t2.pts), xy(r2))
+
+    def test_recortar(self):
+        """recortar_lineas_en_cruce elige el cruce de menor distancia total, no el primero de L1."""
+        l1 = [QgsPointXY(0, 0), QgsPointXY(100, 0)]
+        l2 = [QgsPointXY(90, -10), QgsPointXY(90, 10), QgsPointXY(10, 10), QgsPointXY(10, -10)]
+        r1, r2, rc = recortar_lineas_en_cruce(l1, l2)
+        self.assertEqual(xy(r1), [(0, 0), (90, 0)])
+        self.assertEqual(xy(r2), [(90, -10), (90, 0)])
+        r1, r2, rc = recortar_lineas_en_cruce(l1, [QgsPointXY(0, 5), QgsPointXY(100, 5)])
+        self.assertIsNone(rc)
+        self.assertEqual(len(r1), 2)
+
+    def test_cache_traza(self):
+        """La clave depende de versión y puntos; las copias no comparten listas."""
+        ini = [QgsPointXY(0, 0), QgsPointXY(5, 0)]
+        self.assertIsNone(clave_traza(None, ini, []))
+        self.assertEqual(clave_traza('v1', ini, []), clave_traza('v1', list(ini), []))
+        self.assertNotEqual(clave_traza('v1', ini, []), clave_traza('v2', ini, []))
+        self.assertNotEqual(clave_traza('v1', ini, []), clave_traza('v1', ini, [QgsPointXY(1, 1)]))
+        res = [{'puntos': ini[:1], 'curvas_usadas': {3}, 'razon': 'max_iter'}]
+        copia = copiar_lineas(res)
+        copia[0]['puntos'].append(ini[1])
+        copia[0]['curvas_usadas'].add(4)
+        self.assertEqual(len(res[0]['puntos']), 1)
+        self.assertEqual(res[0]['curvas_usadas'], {3})
+
+
+class ProcesarParTest(unittest.TestCase):
+    """Test lockstep tracing against tracing both divides to the end."""
+
+    def test_modos(self):
+        """Mismas líneas y cruce en ambos modos; en simultáneo las trazas quedan cortadas en el cruce."""
+        alm = terreno.curvas(terreno.grilla('crestas', 12, 3))
+        idx = IndiceSegmentos(alm)
+        construir_anidamiento(alm, idx)
+
+        def simple(r, *fuera):
+            r = dict(r, puntos=xy(r['puntos']), punto_final=xy([r['punto_final']]))
+            return {k: v for k, v in r.items() if k not in fuera}
+
+        geom = ('puntos', 'punto_final', 'num_puntos', 'longitud')
+        cruces, it_a, it_b = 0, 0, 0
+        for p1, p2 in pares_prueba(alm, 15, 1):
+            a1, a2, ac = procesar_par(p1, p2, idx, alm, simultaneo=False)
+            b1, b2, bc = procesar_par(p1, p2, idx, alm)
+            self.assertEqual(ac is None, bc is None)
+            if ac is None:
+                self.assertEqual((simple(a1, 'perfil'), simple(a2, 'perfil')), (simple(b1, 'perfil'), simple(b2, 'perfil')))
+                continue
+            cruces += 1
+            self.assertEqual(xy([ac]), xy([bc]))
+            for pt, a, b in ((p1, a1, b1), (p2, a2, b2)):
+                it_a += a['iteraciones']
+                it_b += b['iteraciones']
+                self.assertEqual({k: simple(a)[k] for k in geom}, {k: simple(b)[k] for k in geom})
+                self.assertEqual(b['razon'], 'cruce_par')
+                # Igual a la traza completa cortada en el cruce, salvo el trabajo hecho
+                t = TrazaDivisoria(pt, idx, alm, elevacion_inicial(pt, idx, alm), b['numero'])
+                t.trazar()
+                t.cortar(b['num_puntos'] - 2, b['punto_final'])
+                self.assertEqual(simple(t.resultado(), 'iteraciones', 'perfil'), simple(b, 'iteraciones', 'perfil'))
+                self.assertLessEqual(b['curvas_usadas'], a['curvas_usadas'])
+        self.assertGreater(cruces, 0)
+        self.assertLess(it_b, it_a)
+
+    def test_cortar(self):
+        """Cortar vuelve curvas usadas, elevación y picos a los del paso que llegó al vértice."""
+        t = TrazaDivisoria(QgsPointXY(0, 0), None, None, 100.0, 1, curvas_u={9})
+        t.pts += [QgsPointXY(k, 0) for k in range(1, 6)]
+        t.pasos = [(1, 3, 110.0, False), (2, 4, 120.0, True), (4, 5, 130.0, False)]
+        t.cortar(3, QgsPointXY(3.5, 0))
+        self.assertEqual(xy(t.pts), [(0, 0), (1, 0), (2, 0), (3, 0), (3.5, 0)])
+        r = t.resultado()
+        self.assertEqual((r['elev_final'], r['picos'], r['razon']), (120.0, 1, 'cruce_par'))
+        self.assertEqual(r['curvas_usadas'], {9, 3, 4})
+        t.cortar(0, QgsPointXY(0.5, 0))
+        self.assertEqual((t.elev_act, t.curvas_u), (100.0, {9}))
+
+
+class SalidaCrestaTest(unittest.TestCase):
+    """Test batched crest-exit scoring."""
+
+    def setUp(self):
+        """Runs before each test."""
+        cons = ConstructorAlmacen()
+        t = np.linspace(0, 2 * np.pi, 41)
+        # Pico circular de 100 m y una curva superior al este
+        cons.agregar(100, np.column_stack((50 * np.cos(t), 50 * np.sin(t))))
+        cons.agregar(110, [(70, -30), (70, 30)])
+        for k in range(6):
+            cons.agregar(90 - k, [(-200 + 40 * k, -100), (-200 + 40 * k, 100)])
+        self.alm = cons.terminar()
+        self.idx = IndiceSegmentos(self.alm, largo=4)
+
+    def test_contar_menores(self):
+        """El conteo en bloque coincide con una consulta por radio por punto."""
+        rng = np.random.default_rng(3)
+        px, py = rng.uniform(-220, 80, 50), rng.uniform(-120, 120, 50)
+        n = contar_menores(px, py, self.idx, self.alm, 100, r=30.0)
+        for x, y, k in zip(px, py, n.tolist()):
+            ids, _ = self.idx.en_radio(x, y, 30.0)
+            self.assertEqual(k, int((self.alm.elev[ids] < 100).sum()))
+
+    def test_salida(self):
+        """Sin dirección gana el vértice más cerca de la curva superior."""
+        c_sig = [self.alm[1]] + [self.alm[k] for k in range(2, 8)]
+        pt = pto_salida_cresta(QgsPointXY(0, 0), self.alm.geometria(0), 100, None, self.idx, self.alm, c_sig)
+        self.assertEqual((pt.x(), pt.y()), (50, 0))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TrazarParTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
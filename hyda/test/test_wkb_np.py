@@ -0,0 +1,95 @@
+# coding=utf-8
+"""Decodificación WKB en bloque test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'eduardoaqgis@gmail.com'
+__date__ = '2025-10-20'
+__copyright__ = 'Copyright 2025, eduardo a'
+
+import struct
+import unittest
+
+from ..wkb_np import decodificar_lineas
+
+
+def linea(xy, orden='<', tipo=2, dims=2, srid=None):
+    e = 1 if orden == '<' else 0
+    cab = struct.pack(orden + 'BI', e, tipo | (0x20000000 if srid else 0))
+    if srid:
+        cab += struct.pack(orden + 'I', srid)
+    vals = [v for p in xy for v in (tuple(p) + (7.0,) * (dims - 2))]
+    return cab + struct.pack(orden + 'I', len(xy)) + struct.pack(orden + f'{len(vals)}d', *vals)
+
+
+class DecodificarLineasTest(unittest.TestCase):
+    """Test bulk WKB decoding of line geometries."""
+
+    def test_tipos(self):
+        """2D, big endian, Z ISO, EWKB Z con SRID y ZM en un mismo lote."""
+        wkbs = [linea([(0, 1), (2, 3)]),
+                linea([(4, 5), (6, 7)], orden='>'),
+                linea([(8, 9), (10, 11)], tipo=1002, dims=3),
+                linea([(12, 13), (14, 15)], tipo=0x80000002, dims=3, srid=4326),
+                linea([(16, 17), (18, 19)], tipo=3002, dims=4)]
+        coords, offsets, geom, malas = decodificar_lineas(wkbs)
+        self.assertEqual(coords[:, 0].tolist(), list(range(0, 20, 2)))
+        self.assertEqual(coords[:, 1].tolist(), list(range(1, 20, 2)))
+        self.assertEqual(offsets.tolist(), [0, 2, 4, 6, 8, 10])
+        self.assertEqual(geom.tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(malas, [])
+
+    def test_big_endian(self):
+        """Big endian Z y ZM, sueltas y en MultiLineString, junto a las mismas en little endian."""
+        def multi(orden, tipo, partes):
+            return struct.pack(orden + 'BII', 1 if orden == '<' else 0, tipo, len(partes)) + b''.join(partes)
+        xy = [[(0, 1), (2, 3)], [(4, 5), (6, 7), (8, 9)]]
+        wkbs = []
+        for orden in ('>', '<'):
+            wkbs += [linea(xy[0], orden=orden, tipo=1002, dims=3),
+                     linea(xy[0], orden=orden, tipo=0x80000002, dims=3, srid=4326),
+                     linea(xy[0], orden=orden, tipo=3002, dims=4),
+                     linea(xy[0], orden=orden, tipo=0xC0000002, dims=4),
+                     multi(orden, 1005, [linea(p, orden=orden, tipo=1002, dims=3) for p in xy]),
+                     multi(orden, 3005, [linea(p, orden=orden, tipo=3002, dims=4) for p in xy])]
+        coords, offsets, geom, malas = decodificar_lineas(wkbs)
+        self.assertEqual(malas, [])
+        esperado = (xy[0] * 4 + xy[0] + xy[1] + xy[0] + xy[1]) * 2
+        self.assertEqual(coords.tolist(), [list(p) for p in esperado])
+        self.assertEqual(geom.tolist(), [0, 1, 2, 3, 4, 4, 5, 5, 6, 7, 8, 9, 10, 10, 11, 11])
+
+    def test_multi(self):
+        """Partes de MultiLineString; partes de 1 vértice y tipos no lineales."""
+        partes = [linea([(0, 0), (1, 1), (2, 2)]), linea([(5, 5)]), linea([(3, 3), (4, 4)], dims=3, tipo=1002)]
+        multi = struct.pack('<BII', 1, 5, 3) + b''.join(partes)
+        punto = struct.pack('<BI2d', 1, 1, 0, 0)
+        coords, offsets, geom, malas = decodificar_lineas([punto, multi])
+        self.assertEqual(offsets.tolist(), [0, 3, 5])
+        self.assertEqual(geom.tolist(), [1, 1])
+        self.assertEqual(coords[-1].tolist(), [4, 4])
+        self.assertEqual(malas, [0])
+
+    def test_truncado(self):
+        """WKB truncados o con conteos erróneos no leen bytes del siguiente ni dejan partes."""
+        buena = linea([(1, 2), (3, 4)])
+        truncada = linea([(0, 0), (9, 9), (8, 8)])[:-8]
+        # Declara 2 vértices pero trae 3: sobran bytes
+        conteo = bytearray(linea([(5, 5), (6, 6), (7, 7)]))
+        conteo[5:9] = struct.pack('<I', 2)
+        multi = struct.pack('<BII', 1, 5, 2) + linea([(0, 0), (1, 1)])
+        coords, offsets, geom, malas = decodificar_lineas([truncada, buena, bytes(conteo), multi, buena])
+        self.assertEqual(malas, [0, 2, 3])
+        self.assertEqual(geom.tolist(), [1, 4])
+        self.assertEqual(offsets.tolist(), [0, 2, 4])
+        self.assertEqual(coords.tolist(), [[1, 2], [3, 4], [1, 2], [3, 4]])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DecodificarLineasTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
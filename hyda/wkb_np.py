@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Decodificación en bloque de WKB de líneas a arreglos NumPy"""
+
+import struct
+
+import numpy as np
+
+from .geometria_np import rangos
+
+
+WKB_LINESTRING = 2
+WKB_MULTILINESTRING = 5
+# Banderas EWKB (PostGIS / 2.5D de QGIS)
+EWKB_Z = 0x80000000
+EWKB_M = 0x40000000
+EWKB_SRID = 0x20000000
+
+
+def cabecera(buf, pos):
+    """(orden '<' o '>', tipo plano, dimensiones, posición tras la cabecera)"""
+    e = '<' if buf[pos] == 1 else '>'
+    tipo, = struct.unpack_from(e + 'I', buf, pos + 1)
+    pos += 5
+    if tipo & EWKB_SRID:
+        pos += 4
+    z = bool(tipo & EWKB_Z)
+    m = bool(tipo & EWKB_M)
+    tipo &= 0x0FFFFFFF
+    # ISO: 1000 = Z, 2000 = M, 3000 = ZM
+    if tipo >= 1000:
+        z = z or tipo // 1000 in (1, 3)
+        m = m or tipo // 1000 in (2, 3)
+        tipo %= 1000
+    return e, tipo, 2 + z + m, pos
+
+
+def estructura(buf, pos, partes):
+    """
+    Primera pasada: agrega a partes (inicio de coordenadas, n, dims, orden)
+    de cada LineString y retorna la posición final. Otros tipos: ValueError.
+    """
+    e, tipo, dims, pos = cabecera(buf, pos)
+    n, = struct.unpack_from(e + 'I', buf, pos)
+    pos += 4
+    if tipo == WKB_LINESTRING:
+        partes.append((pos, n, dims, e))
+        return pos + 8 * dims * n
+    if tipo == WKB_MULTILINESTRING:
+        for _ in range(n):
+            if cabecera(buf, pos)[1] != WKB_LINESTRING:
+                raise ValueError('parte no lineal')
+            pos = estructura(buf, pos, partes)
+        return pos
+    raise ValueError(f'tipo WKB {tipo}')
+
+
+def decodificar_lineas(wkbs):
+    """
+    Decodifica una lista de WKB (LineString / MultiLineString, 2D, Z, M o ZM,
+    cualquier orden de bytes) sin crear objetos por vértice.
+    Primera pasada: cabeceras y conteos; segunda: copia vectorizada de x, y
+    desde vistas np.frombuffer del buffer unido a arreglos preasignados.
+    Retorna (coords (n, 2), offsets, geom de cada parte, índices no decodificados).
+    Las partes con menos de 2 vértices se descartan. Un WKB cuyos conteos no
+    terminan justo en su último byte (truncado o malformado) va a los no
+    decodificados sin aportar partes, aunque sus bytes se pudieran leer.
+    """
+    buf = b''.join(wkbs)
+    ini, num, dims, orden, geom = [], [], [], [], []
+    malas = []
+    pos = 0
+    for g, w in enumerate(wkbs):
+        partes = []
+        try:
+            if estructura(buf, pos, partes) != pos + len(w):
+                raise ValueError('largo WKB')
+        except (ValueError, struct.error, IndexError):
+            malas.append(g)
+            partes = []
+        for p in partes:
+            ini.append(p[0])
+            num.append(p[1])
+            dims.append(p[2])
+            orden.append(p[3] == '>')
+            geom.append(g)
+        pos += len(w)
+
+    ini = np.asarray(ini, dtype=np.int64)
+    num = np.asarray(num, dtype=np.int64)
+    dims = np.asarray(dims, dtype=np.int64)
+    orden = np.asarray(orden, dtype=bool)
+    geom = np.asarray(geom, dtype=np.int64)
+
+    ok = num >= 2
+    ini, num, dims, orden, geom = ini[ok], num[ok], dims[ok], orden[ok], geom[ok]
+    offsets = np.zeros(len(num) + 1, dtype=np.int64)
+    np.cumsum(num, out=offsets[1:])
+    coords = np.empty((int(offsets[-1]), 2), dtype=np.float64)
+
+    # Un grupo por alineación, orden de bytes y dimensiones: una sola vista float64 cada uno
+    # Campos en bits separados: dims <= 4 ocupa 3 bits, orden el cuarto
+    clave = (ini % 8) * 16 + orden * 8 + dims
+    for c in np.unique(clave).tolist():
+        sel = clave == c
+        r = c // 16
+        vista = np.frombuffer(buf, dtype='>f8' if orden[sel][0] else '<f8',
+                              count=(len(buf) - r) // 8, offset=r)
+        n = num[sel]
+        k = rangos(np.zeros(len(n), dtype=np.int64), n)
+        src = np.repeat((ini[sel] - r) // 8, n) + k * np.repeat(dims[sel], n)
+        dst = rangos(offsets[:-1][sel], offsets[1:][sel])
+        coords[dst, 0] = vista[src]
+        coords[dst, 1] = vista[src + 1]
+
+    return coords, offsets, geom, malas